@@ -0,0 +1,19 @@
+# gunicorn.conf.py
+#
+# Read automatically by gunicorn from the working directory. SERVER_MODE
+# picks how the app is served:
+#
+#   wsgi (default)  sync workers running vehicle_tracker.wsgi
+#   asgi            uvicorn workers running vehicle_tracker.asgi, so the async
+#                   chart and API views share an event loop per worker
+#
+# Worker count comes from WEB_CONCURRENCY as usual.
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+if os.environ.get('SERVER_MODE', 'wsgi').lower() == 'asgi':
+    wsgi_app = 'vehicle_tracker.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'vehicle_tracker.wsgi:application'
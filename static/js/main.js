@@ -127,6 +127,37 @@ document.addEventListener('DOMContentLoaded', function() {
         updateVisibleFields();
     }
     
+    // Suggest the nearest known location when logging a new event
+    const locationSelect = document.querySelector('select[data-suggest-nearby]');
+    if (locationSelect && !locationSelect.value && navigator.geolocation) {
+        navigator.geolocation.getCurrentPosition(position => {
+            const params = new URLSearchParams({
+                lat: position.coords.latitude,
+                lon: position.coords.longitude,
+                radius: 1,
+                limit: 1
+            });
+            fetch(`/api/locations/nearby/?${params}`)
+                .then(response => response.json())
+                .then(data => {
+                    const nearest = (data.results || [])[0];
+                    // Only pick one the form offers, and never override a choice
+                    if (!nearest || locationSelect.value ||
+                        !locationSelect.querySelector(`option[value="${nearest.id}"]`)) {
+                        return;
+                    }
+                    locationSelect.value = nearest.id;
+                    const hint = document.createElement('div');
+                    hint.className = 'form-text';
+                    hint.textContent = `Nearest known location (${nearest.distance_miles.toFixed(1)} mi away)`;
+                    locationSelect.insertAdjacentElement('afterend', hint);
+                })
+                .catch(error => {
+                    console.error('Error fetching nearby locations:', error);
+                });
+        }, () => {}, { maximumAge: 60000, timeout: 10000 });
+    }
+    
     // Setup PWA install prompt
     let deferredPrompt;
     const installButton = document.getElementById('install-button');
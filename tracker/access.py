@@ -0,0 +1,159 @@
+"""
+Request-scoped access context.
+
+Which families a user belongs to and which vehicles those families own is
+needed by nearly every view, form and API check. AccessContext holds both
+as id sets, built once per user per cache period and shared through the
+default cache (Redis) between requests and sessions. Within a request it
+is memoised on the user object, so ``request.access`` (attached lazily by
+tracker.middleware.AccessContextMiddleware), forms given ``user`` and DRF
+views all read the same instance. Async views use ``await request.aaccess()``,
+which goes through the async cache and ORM methods instead.
+
+Cached contexts are deleted after commit whenever a family's membership or
+its vehicles change (see tracker.signals).
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Family, Vehicle
+
+logger = logging.getLogger('tracker')
+
+ACCESS_KEY = 'tracker:access:{}'
+
+
+class AccessContext:
+    """The families and vehicles one user can see"""
+
+    def __init__(self, user_id, family_ids, vehicle_ids):
+        self.user_id = user_id
+        self.family_ids = frozenset(family_ids)
+        self.vehicle_ids = frozenset(vehicle_ids)
+
+    def __repr__(self):
+        return f"<AccessContext user={self.user_id} families={len(self.family_ids)} vehicles={len(self.vehicle_ids)}>"
+
+    def has_family(self, family_id):
+        return family_id in self.family_ids
+
+    def has_vehicle(self, vehicle_id):
+        return vehicle_id in self.vehicle_ids
+
+    def families(self):
+        return Family.objects.filter(pk__in=self.family_ids)
+
+    def vehicles(self):
+        return Vehicle.objects.filter(pk__in=self.vehicle_ids)
+
+
+def _load(user_id):
+    family_ids = list(Family.objects.filter(members=user_id).values_list('id', flat=True))
+    vehicle_ids = list(Vehicle.objects.filter(family__in=family_ids).values_list('id', flat=True)) if family_ids else []
+    return AccessContext(user_id, family_ids, vehicle_ids)
+
+
+async def _aload(user_id):
+    family_ids = [pk async for pk in Family.objects.filter(members=user_id).values_list('id', flat=True)]
+    vehicle_ids = [
+        pk async for pk in Vehicle.objects.filter(family__in=family_ids).values_list('id', flat=True)
+    ] if family_ids else []
+    return AccessContext(user_id, family_ids, vehicle_ids)
+
+
+def _cache_value(access):
+    return (sorted(access.family_ids), sorted(access.vehicle_ids))
+
+
+def _cache_timeout():
+    return getattr(settings, 'ACCESS_CACHE_TIMEOUT', 15 * 60)
+
+
+def build_access(user_id):
+    """Load a user's AccessContext through the cache"""
+    key = ACCESS_KEY.format(user_id)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Cache unavailable reading access context: {e}")
+        return _load(user_id)
+    if cached is not None:
+        family_ids, vehicle_ids = cached
+        return AccessContext(user_id, family_ids, vehicle_ids)
+
+    access = _load(user_id)
+    try:
+        cache.set(key, _cache_value(access), _cache_timeout())
+    except Exception as e:
+        logger.warning(f"Cache unavailable storing access context: {e}")
+    return access
+
+
+async def abuild_access(user_id):
+    """Async counterpart of build_access"""
+    key = ACCESS_KEY.format(user_id)
+    try:
+        cached = await cache.aget(key)
+    except Exception as e:
+        logger.warning(f"Cache unavailable reading access context: {e}")
+        return await _aload(user_id)
+    if cached is not None:
+        family_ids, vehicle_ids = cached
+        return AccessContext(user_id, family_ids, vehicle_ids)
+
+    access = await _aload(user_id)
+    try:
+        await cache.aset(key, _cache_value(access), _cache_timeout())
+    except Exception as e:
+        logger.warning(f"Cache unavailable storing access context: {e}")
+    return access
+
+
+def get_access(user):
+    """The AccessContext for ``user``, memoised on the user object"""
+    if user is None or not user.is_authenticated:
+        return AccessContext(None, (), ())
+    access = getattr(user, '_tracker_access', None)
+    if access is None:
+        access = build_access(user.pk)
+        user._tracker_access = access
+    return access
+
+
+async def aget_access(user):
+    """Async counterpart of get_access"""
+    if user is None or not user.is_authenticated:
+        return AccessContext(None, (), ())
+    access = getattr(user, '_tracker_access', None)
+    if access is None:
+        access = await abuild_access(user.pk)
+        user._tracker_access = access
+    return access
+
+
+def invalidate_access(*user_ids):
+    """Drop cached access contexts once the current transaction commits"""
+    keys = [ACCESS_KEY.format(user_id) for user_id in set(user_ids) if user_id is not None]
+    if not keys:
+        return
+
+    def delete():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.warning(f"Cache unavailable invalidating access contexts: {e}")
+
+    transaction.on_commit(delete)
+
+
+def invalidate_family_access(*family_ids):
+    """Invalidate every current member of ``family_ids``"""
+    family_ids = {family_id for family_id in family_ids if family_id is not None}
+    if family_ids:
+        invalidate_access(*Family.members.through.objects.filter(
+            family_id__in=family_ids
+        ).values_list('user_id', flat=True))
+
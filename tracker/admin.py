@@ -1,12 +1,18 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from django.db.models import Count, Sum, Avg
+from django.db import IntegrityError, transaction
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from django.db.models import Count, Sum, Avg, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
     Family, Vehicle, Location, Event, 
-    MaintenanceCategory, TodoItem, MaintenanceSchedule
+    MaintenanceCategory, TodoItem, MaintenanceSchedule, Job
 )
+from .cache import bump_family_version
+from .forecast import queue_forecast
+from .jobs import enqueue
 
 
 # Inline Admin Classes
@@ -67,7 +73,8 @@ class VehicleAdmin(admin.ModelAdmin):
                    'total_miles_or_hours', 'maintenance_status')
     list_filter = ('type', 'family', 'year')
     search_fields = ('name', 'make', 'model', 'vin', 'license_plate')
-    readonly_fields = ('created_at', 'current_mileage_display', 'maintenance_status_detail')
+    readonly_fields = ('created_at', 'current_mileage_display', 'maintenance_status_detail', 'image_status')
+    list_select_related = ('family',)
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'family', 'type')
@@ -82,7 +89,7 @@ class VehicleAdmin(admin.ModelAdmin):
             'fields': ('maintenance_status_detail',)
         }),
         ('Image', {
-            'fields': ('image',)
+            'fields': ('image', 'image_status')
         }),
         ('System Info', {
             'fields': ('created_at',),
@@ -92,35 +99,41 @@ class VehicleAdmin(admin.ModelAdmin):
     inlines = [EventInline, MaintenanceScheduleInline]
     
     def total_miles_or_hours(self, obj):
-        latest_event = obj.events.order_by('-date', '-created_at').first()
-        if latest_event:
+        if obj.current_reading is not None:
             if obj.type == 'car':
-                return f"{latest_event.miles:,.0f} mi"
+                return f"{obj.current_reading:,.0f} mi"
             else:
-                return f"{latest_event.hours:,.1f} hrs"
+                return f"{obj.current_reading:,.1f} hrs"
         return "No data"
     total_miles_or_hours.short_description = 'Current Reading'
     
     def current_mileage_display(self, obj):
-        latest_event = obj.events.order_by('-date', '-created_at').first()
-        if latest_event:
+        if obj.current_reading is not None:
             if obj.type == 'car':
-                return f"{latest_event.miles:,.0f} miles"
+                return f"{obj.current_reading:,.0f} miles (as of {obj.current_reading_date})"
             else:
-                return f"{latest_event.hours:,.1f} hours"
+                return f"{obj.current_reading:,.1f} hours (as of {obj.current_reading_date})"
         return "No events recorded"
     current_mileage_display.short_description = 'Current Mileage/Hours'
     
+    def get_queryset(self, request):
+        # Count due schedules for the changelist in the same query
+        due_counts = MaintenanceSchedule.objects.due().filter(
+            vehicle=OuterRef('pk')
+        ).order_by().values('vehicle').annotate(count=Count('id')).values('count')
+        return super().get_queryset(request).annotate(
+            due_schedule_count=Coalesce(Subquery(due_counts), 0)
+        )
+    
     def maintenance_status(self, obj):
-        due_count = sum(1 for schedule in obj.maintenance_schedules.filter(is_active=True) 
-                       if schedule.is_due())
+        due_count = obj.due_schedule_count
         if due_count > 0:
             return format_html('<span style="color: red;">⚠️ {} Due</span>', due_count)
         return format_html('<span style="color: green;">✓ OK</span>')
     maintenance_status.short_description = 'Maintenance'
     
     def maintenance_status_detail(self, obj):
-        schedules = obj.maintenance_schedules.filter(is_active=True)
+        schedules = obj.maintenance_schedules.filter(is_active=True).with_due_status()
         if not schedules:
             return "No maintenance schedules"
         
@@ -205,19 +218,32 @@ class EventAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_maintenance', 'mark_as_gas', 'mark_as_outing']
     
+    def _event_types_changed(self, request, queryset):
+        # queryset.update() doesn't send post_save, so invalidate cached
+        # family data now and queue a recompute of efficiency (from each
+        # vehicle's earliest changed event) and monthly stats
+        bump_family_version(*queryset.values_list('vehicle__family_id', flat=True).distinct())
+        changed = list(queryset.order_by().values('vehicle_id').annotate(since=Min('date')))
+        for row in changed:
+            enqueue('vehicles.recompute_derived', vehicle_id=row['vehicle_id'], since=row['since'],
+                    created_by=request.user)
+    
     def mark_as_maintenance(self, request, queryset):
         updated = queryset.update(event_type='maintenance')
-        self.message_user(request, f"{updated} events marked as maintenance")
+        self._event_types_changed(request, queryset)
+        self.message_user(request, f"{updated} events marked as maintenance; efficiency recompute queued")
     mark_as_maintenance.short_description = "Mark as maintenance"
     
     def mark_as_gas(self, request, queryset):
         updated = queryset.update(event_type='gas')
-        self.message_user(request, f"{updated} events marked as gas")
+        self._event_types_changed(request, queryset)
+        self.message_user(request, f"{updated} events marked as gas; efficiency recompute queued")
     mark_as_gas.short_description = "Mark as gas"
     
     def mark_as_outing(self, request, queryset):
         updated = queryset.update(event_type='outing')
-        self.message_user(request, f"{updated} events marked as outing")
+        self._event_types_changed(request, queryset)
+        self.message_user(request, f"{updated} events marked as outing; efficiency recompute queued")
     mark_as_outing.short_description = "Mark as outing"
 
 
@@ -341,10 +367,12 @@ class TodoItemAdmin(admin.ModelAdmin):
 @admin.register(MaintenanceSchedule)
 class MaintenanceScheduleAdmin(admin.ModelAdmin):
     list_display = ('name', 'vehicle', 'maintenance_type', 'is_active', 'is_due_display', 
-                   'interval_display', 'last_performed')
+                   'interval_display', 'last_performed', 'forecast_due_date')
     list_filter = ('is_active', 'maintenance_type', 'vehicle__family')
     search_fields = ('name', 'description', 'vehicle__name', 'maintenance_type__name')
-    readonly_fields = ('created_at', 'created_by', 'is_due_display', 'due_status_detail')
+    readonly_fields = ('created_at', 'created_by', 'is_due_display', 'due_status_detail',
+                       'forecast_due_date', 'forecast_basis')
+    list_select_related = ('vehicle', 'maintenance_type')
     fieldsets = (
         ('Basic Information', {
             'fields': ('vehicle', 'maintenance_type', 'name', 'description', 'is_active')
@@ -356,7 +384,7 @@ class MaintenanceScheduleAdmin(admin.ModelAdmin):
             'fields': ('last_performed', 'last_miles', 'last_hours')
         }),
         ('Status', {
-            'fields': ('is_due_display', 'due_status_detail'),
+            'fields': ('is_due_display', 'due_status_detail', 'forecast_due_date', 'forecast_basis'),
             'classes': ('wide',)
         }),
         ('System Info', {
@@ -382,44 +410,22 @@ class MaintenanceScheduleAdmin(admin.ModelAdmin):
         return format_html('<span style="color: green;">✓ OK</span>')
     is_due_display.short_description = 'Status'
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_due_status()
+    
     def due_status_detail(self, obj):
         if not obj.last_performed:
             return "No service history"
         
-        current_event = obj.vehicle.events.order_by('-date', '-created_at').first()
-        if not current_event:
+        details = obj.get_due_details()
+        if not details:
             return "No current mileage/hours data"
         
-        details = []
-        
-        # Check mileage
-        if obj.interval_miles and obj.last_miles:
-            miles_since = (current_event.miles or 0) - obj.last_miles
-            miles_due_in = obj.interval_miles - miles_since
-            if miles_due_in < 0:
-                details.append(f'<span style="color: red;">Overdue by {abs(miles_due_in):,.0f} miles</span>')
-            else:
-                details.append(f'Due in {miles_due_in:,.0f} miles')
-        
-        # Check hours
-        if obj.interval_hours and obj.last_hours:
-            hours_since = (current_event.hours or 0) - obj.last_hours
-            hours_due_in = obj.interval_hours - hours_since
-            if hours_due_in < 0:
-                details.append(f'<span style="color: red;">Overdue by {abs(hours_due_in):,.1f} hours</span>')
-            else:
-                details.append(f'Due in {hours_due_in:,.1f} hours')
-        
-        # Check days
-        if obj.interval_days:
-            days_since = (timezone.now().date() - obj.last_performed).days
-            days_due_in = obj.interval_days - days_since
-            if days_due_in < 0:
-                details.append(f'<span style="color: red;">Overdue by {abs(days_due_in)} days</span>')
-            else:
-                details.append(f'Due in {days_due_in} days')
-        
-        return format_html('<br>'.join(details))
+        return format_html_join(
+            mark_safe('<br>'), '<span{}>{}</span>',
+            ((mark_safe(' style="color: red;"') if detail.startswith('Overdue') else '', detail)
+             for detail in details)
+        )
     due_status_detail.short_description = 'Due Status Details'
     
     def save_model(self, request, obj, form, change):
@@ -431,6 +437,9 @@ class MaintenanceScheduleAdmin(admin.ModelAdmin):
     
     def activate_schedules(self, request, queryset):
         updated = queryset.update(is_active=True)
+        # update() skips save(), so their due dates are projected by the worker
+        for vehicle_id in queryset.order_by().values_list('vehicle_id', flat=True).distinct():
+            queue_forecast(vehicle_id)
         self.message_user(request, f"{updated} schedules activated")
     activate_schedules.short_description = "Activate selected schedules"
     
@@ -442,13 +451,15 @@ class MaintenanceScheduleAdmin(admin.ModelAdmin):
     def mark_as_serviced(self, request, queryset):
         # This would create a service event and update the schedule
         count = 0
-        for schedule in queryset:
+        for schedule in queryset.select_related('vehicle'):
             # Update last service info based on most recent vehicle data
-            current_event = schedule.vehicle.events.order_by('-date', '-created_at').first()
-            if current_event:
+            vehicle = schedule.vehicle
+            if vehicle.current_reading is not None:
                 schedule.last_performed = timezone.now().date()
-                schedule.last_miles = current_event.miles
-                schedule.last_hours = current_event.hours
+                if vehicle.type == 'car':
+                    schedule.last_miles = vehicle.current_reading
+                else:
+                    schedule.last_hours = vehicle.current_reading
                 schedule.save()
                 count += 1
         
@@ -456,6 +467,71 @@ class MaintenanceScheduleAdmin(admin.ModelAdmin):
     mark_as_serviced.short_description = "Mark as serviced today"
 
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status_display', 'attempts_display', 'run_at', 'locked_by',
+                    'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'key', 'error')
+    readonly_fields = ('name', 'args', 'key', 'status', 'priority', 'run_at', 'attempts', 'max_attempts',
+                       'locked_by', 'locked_at', 'result', 'error_display', 'created_by', 'created_at',
+                       'updated_at', 'finished_at')
+    exclude = ('error',)
+    list_select_related = ('created_by',)
+    date_hierarchy = 'created_at'
+    
+    STATUS_COLORS = {
+        'queued': 'gray',
+        'running': 'blue',
+        'succeeded': 'green',
+        'failed': 'red',
+        'cancelled': 'orange',
+    }
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def status_display(self, obj):
+        return format_html('<span style="color: {};">{}</span>',
+                           self.STATUS_COLORS.get(obj.status, 'black'), obj.get_status_display())
+    status_display.short_description = 'Status'
+    status_display.admin_order_field = 'status'
+    
+    def attempts_display(self, obj):
+        return f"{obj.attempts}/{obj.max_attempts}"
+    attempts_display.short_description = 'Attempts'
+    
+    def error_display(self, obj):
+        if not obj.error:
+            return "-"
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', obj.error)
+    error_display.short_description = 'Error'
+    
+    actions = ['retry_jobs', 'cancel_jobs']
+    
+    def retry_jobs(self, request, queryset):
+        now = timezone.now()
+        updated = 0
+        for job in queryset.filter(status__in=('failed', 'cancelled')):
+            try:
+                with transaction.atomic():
+                    updated += Job.objects.filter(pk=job.pk).update(
+                        status='queued', run_at=now, attempts=0, locked_by='', locked_at=None,
+                        finished_at=None, updated_at=now,
+                    )
+            except IntegrityError:
+                # Another job with the same key is already queued or running
+                continue
+        self.message_user(request, f"{updated} jobs queued to run again")
+    retry_jobs.short_description = "Retry selected failed/cancelled jobs"
+    
+    def cancel_jobs(self, request, queryset):
+        now = timezone.now()
+        updated = queryset.filter(status='queued').update(status='cancelled', finished_at=now, updated_at=now)
+        self.message_user(request, f"{updated} queued jobs cancelled")
+    cancel_jobs.short_description = "Cancel selected queued jobs"
+
+
 # Customize admin site
 admin.site.site_header = "TripTracker Administration"
 admin.site.site_title = "TripTracker Admin"
@@ -16,10 +16,7 @@ def admin_dashboard(request):
     active_todos = TodoItem.objects.filter(completed=False).count()
     
     # Count maintenance schedules that are due
-    maintenance_due = 0
-    for schedule in MaintenanceSchedule.objects.filter(is_active=True):
-        if schedule.is_due():
-            maintenance_due += 1
+    maintenance_due = MaintenanceSchedule.objects.due().count()
     
     # Get recent events
     recent_events = Event.objects.select_related('vehicle').order_by('-date', '-created_at')[:10]
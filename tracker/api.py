@@ -0,0 +1,113 @@
+"""
+Read-only REST API under ``/api/v1/``.
+
+Every endpoint is scoped to the families the requesting user belongs to,
+paginated with a cursor so bulk pulls don't slow down with depth, and
+accepts ``?fields=`` to trim the payload (see SparseFieldsMixin).
+"""
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from rest_framework import viewsets
+from rest_framework.pagination import CursorPagination
+
+from .models import Vehicle, Event, Location, TodoItem, MaintenanceCategory, MaintenanceSchedule
+from .serializers import (VehicleSerializer, EventSerializer, LocationSerializer, TodoItemSerializer,
+                          MaintenanceCategorySerializer, MaintenanceScheduleSerializer)
+
+
+class APICursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+class EventCursorPagination(APICursorPagination):
+    # Matches the (vehicle, date, id) indexes
+    ordering = ('-date', '-id')
+
+
+class FamilyScopedViewSet(viewsets.ReadOnlyModelViewSet):
+    """Base viewset limiting ``queryset`` to the user's families"""
+    pagination_class = APICursorPagination
+    family_lookup = 'family'
+    # Set instead for models that belong to a vehicle; filtering on the
+    # user's vehicle ids avoids joining through tracker_vehicle
+    vehicle_lookup = None
+
+    def get_queryset(self):
+        access = self.request.access
+        if self.vehicle_lookup:
+            return super().get_queryset().filter(**{f'{self.vehicle_lookup}__in': access.vehicle_ids})
+        return super().get_queryset().filter(**{f'{self.family_lookup}__in': access.family_ids})
+
+
+class VehicleViewSet(FamilyScopedViewSet):
+    queryset = Vehicle.objects.all()
+    serializer_class = VehicleSerializer
+
+
+class EventViewSet(FamilyScopedViewSet):
+    """
+    Events, newest first. Filter with ``vehicle``, ``event_type``,
+    ``start_date`` and ``end_date``.
+    """
+    queryset = Event.objects.select_related('maintenance_category', 'location')
+    serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+    vehicle_lookup = 'vehicle'
+
+    def get_queryset(self):
+        events = super().get_queryset()
+        params = self.request.query_params
+
+        vehicle_id = params.get('vehicle')
+        if vehicle_id and vehicle_id.isdigit():
+            events = events.filter(vehicle_id=vehicle_id)
+        event_type = params.get('event_type')
+        if event_type in dict(Event.EVENT_TYPES):
+            events = events.filter(event_type=event_type)
+        for param, lookup in (('start_date', 'date__gte'), ('end_date', 'date__lte')):
+            try:
+                value = parse_date(params.get(param) or '')
+            except ValueError:
+                value = None
+            if value:
+                events = events.filter(**{lookup: value})
+        return events
+
+
+class LocationViewSet(FamilyScopedViewSet):
+    queryset = Location.objects.all()
+    serializer_class = LocationSerializer
+
+
+class TodoItemViewSet(viewsets.ReadOnlyModelViewSet):
+    """Todos the user created, was shared or can see through a family vehicle"""
+    serializer_class = TodoItemSerializer
+    pagination_class = APICursorPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        # A subquery instead of joining shared_with keeps rows unique
+        # without DISTINCT
+        shared = TodoItem.shared_with.through.objects.filter(user=user).values('todoitem_id')
+        return TodoItem.objects.filter(
+            Q(created_by=user) | Q(id__in=shared) | Q(vehicle__in=self.request.access.vehicle_ids)
+        ).prefetch_related('shared_with')
+
+
+class MaintenanceScheduleViewSet(FamilyScopedViewSet):
+    queryset = MaintenanceSchedule.objects.select_related('maintenance_type')
+    serializer_class = MaintenanceScheduleSerializer
+    vehicle_lookup = 'vehicle'
+
+    def get_queryset(self):
+        return super().get_queryset().with_due_status()
+
+
+class MaintenanceCategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    # Categories are shared by every family
+    queryset = MaintenanceCategory.objects.all()
+    serializer_class = MaintenanceCategorySerializer
+    pagination_class = APICursorPagination
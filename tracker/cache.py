@@ -0,0 +1,111 @@
+"""
+Versioned per-family caching.
+
+Every family has a version number stored in the default cache. Cached values
+that depend on a family's data are keyed by the versions of all the families
+they cover, so bumping a family's version (see tracker.signals) makes every
+dependent entry unreachable without having to find and delete it.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('tracker')
+
+VERSION_KEY = 'tracker:family:{}:version'
+
+
+def _new_version():
+    # Time based so a version that was evicted never comes back as a value
+    # that older cache entries were keyed with
+    return time.time_ns()
+
+
+def get_family_versions(family_ids):
+    """Return a {family_id: version} dict, initialising missing versions"""
+    family_ids = sorted(set(family_ids))
+    keys = {VERSION_KEY.format(family_id): family_id for family_id in family_ids}
+    try:
+        found = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Cache unavailable reading family versions: {e}")
+        return None
+
+    versions = {}
+    for key, family_id in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            try:
+                # add() so a concurrent initialisation wins consistently
+                if not cache.add(key, version, timeout=None):
+                    version = cache.get(key, version)
+            except Exception as e:
+                logger.warning(f"Cache unavailable initialising family version: {e}")
+                return None
+        versions[family_id] = version
+    return versions
+
+
+def bump_family_version(*family_ids):
+    """Invalidate every cached value that depends on the given families"""
+    for family_id in set(family_ids):
+        if family_id is None:
+            continue
+        key = VERSION_KEY.format(family_id)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Key missing or evicted - start a fresh version
+                cache.set(key, _new_version(), timeout=None)
+        except Exception as e:
+            logger.error(f"Error bumping cache version for family {family_id}: {e}")
+
+
+def family_cache_key(prefix, family_ids, *parts):
+    """
+    Build a cache key for ``prefix`` covering ``family_ids``.
+
+    Returns None when the cache is unavailable so callers can fall back to
+    computing the value directly.
+    """
+    versions = get_family_versions(family_ids)
+    if versions is None:
+        return None
+    raw = ','.join(f"{family_id}:{version}" for family_id, version in sorted(versions.items()))
+    if parts:
+        raw += '|' + '|'.join(str(part) for part in parts)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"tracker:{prefix}:{digest}"
+
+
+def get_or_build(prefix, family_ids, builder, *parts, timeout=None):
+    """
+    Return the cached value for ``prefix``/``family_ids``/``parts``, calling
+    ``builder()`` and storing its result on a miss.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'FAMILY_CACHE_TIMEOUT', 60 * 60)
+
+    key = family_cache_key(prefix, family_ids, *parts)
+    if key is None:
+        return builder()
+
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Cache unavailable reading {prefix}: {e}")
+        return builder()
+    if value is not None:
+        return value
+
+    value = builder()
+    try:
+        cache.set(key, value, timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Cache unavailable storing {prefix}: {e}")
+    return value
@@ -0,0 +1,124 @@
+"""
+Per-vehicle chart series built from a single ordered pass over its events.
+
+The chart bundle endpoint and the older one-series endpoints all go through
+vehicle_chart_data() (avehicle_chart_data() from async views), so a page
+that needs every series makes one request and the database is scanned once.
+"""
+from django.db.models import Q
+
+from .downsample import Series
+from .models import Event
+
+# In the order they appear in a bundle
+CHART_SERIES = ('events', 'mileage', 'fuel_efficiency')
+
+
+def parse_series(value):
+    """
+    ``?series=`` as a tuple of series names (comma separated, all of them
+    when missing). Raises ValueError naming any unknown series.
+    """
+    if not value:
+        return CHART_SERIES
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names - set(CHART_SERIES)
+    if unknown:
+        raise ValueError(f"Unknown series: {', '.join(sorted(unknown))}")
+    return tuple(name for name in CHART_SERIES if name in names)
+
+
+class ChartBuilder:
+    """Accumulates event rows (see ChartBuilder.rows) into chart series"""
+
+    def __init__(self, vehicle, series):
+        self.vehicle = vehicle
+        self.series = series
+        self.reading_field = vehicle.get_reading_field()
+        self.counts = {}
+        self.mileage = Series()
+        self.efficiency = Series()
+
+    @classmethod
+    def for_vehicle(cls, vehicle, series):
+        """A builder for the requested ``series`` that apply, or None if none do"""
+        series = [name for name in CHART_SERIES if name in series]
+        if vehicle.type != 'car' and 'fuel_efficiency' in series:
+            series.remove('fuel_efficiency')
+        return cls(vehicle, series) if series else None
+
+    def rows(self, start=None, end=None):
+        """The values_list queryset to feed to ``add``, in date order"""
+        events = Event.objects.filter(vehicle_id=self.vehicle.pk)
+        if start:
+            events = events.filter(date__gte=start)
+        if end:
+            events = events.filter(date__lte=end)
+        if 'events' not in self.series:
+            # Only the rows a line series can use
+            wanted = Q()
+            if 'mileage' in self.series:
+                wanted |= Q(**{f'{self.reading_field}__isnull': False})
+            if 'fuel_efficiency' in self.series:
+                wanted |= Q(event_type='gas', gallons__gt=0)
+            events = events.filter(wanted)
+        return events.order_by('date', 'id').values_list(
+            'date', 'event_type', 'miles', 'hours', 'gallons', 'milespergallon'
+        )
+
+    def add(self, day, event_type, miles, hours, gallons, mpg):
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+        reading = miles if self.reading_field == 'miles' else hours
+        if reading is not None:
+            self.mileage.append(day, float(reading))
+        if event_type == 'gas' and gallons and gallons > 0:
+            # Same fallback as Event.get_mpg
+            if not mpg and miles:
+                mpg = round(miles / gallons, 2)
+            if mpg:
+                self.efficiency.append(day, float(mpg))
+
+    def result(self, max_points=None):
+        data = {}
+        if 'events' in self.series:
+            event_types = sorted(self.counts)
+            data['events'] = {
+                'labels': event_types,
+                'data': [self.counts[event_type] for event_type in event_types],
+            }
+        if 'mileage' in self.series:
+            data['mileage'] = self.mileage.downsample(max_points).as_chart(unit=self.vehicle.get_unit())
+        if 'fuel_efficiency' in self.series:
+            data['fuel_efficiency'] = self.efficiency.downsample(max_points).as_chart()
+        return data
+
+
+def vehicle_chart_data(vehicle, series=CHART_SERIES, start=None, end=None, max_points=None):
+    """
+    Return ``{series name: chart dict}`` for ``vehicle``:
+
+    - ``events``: count of events by type
+    - ``mileage``: odometer (cars) or hour meter readings, with a ``unit``
+    - ``fuel_efficiency``: MPG per fill-up; cars only, omitted otherwise
+
+    ``start``/``end`` limit the dates (inclusive) and line series longer than
+    ``max_points`` are LTTB-downsampled.
+    """
+    builder = ChartBuilder.for_vehicle(vehicle, series)
+    if builder is None:
+        return {}
+    for row in builder.rows(start, end).iterator(chunk_size=2000):
+        builder.add(*row)
+    return builder.result(max_points)
+
+
+async def avehicle_chart_data(vehicle, series=CHART_SERIES, start=None, end=None, max_points=None):
+    """Async counterpart of vehicle_chart_data"""
+    builder = ChartBuilder.for_vehicle(vehicle, series)
+    if builder is None:
+        return {}
+    # Not aiterator(): for tuple values_list querysets it runs the query on
+    # the event loop thread (Django 5.2). __aiter__ fetches in a worker thread.
+    async for row in builder.rows(start, end):
+        builder.add(*row)
+    return builder.result(max_points)
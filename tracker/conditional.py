@@ -0,0 +1,173 @@
+"""
+Conditional GET (ETag / Last-Modified) for vehicle data.
+
+A view is wrapped with a *state function* that returns the latest
+modification time of everything the response is built from, using a single
+cheap query. When the client's cached copy is still current the view isn't
+run at all and a 304 is returned.
+
+Vehicle.updated_at is also touched whenever its derived data changes
+(see Vehicle.refresh_current_reading), so deleting an event moves the
+timestamp forward too. Renaming or deleting a location or maintenance
+category touches the updated_at of its events (see tracker.signals), since
+their pages show those names.
+
+Async views are supported too; give them an async state function such as
+avehicle_state so the check stays on the async ORM.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Vehicle, Event
+
+
+def vehicle_last_modified(vehicle_id):
+    """Latest change to a vehicle or any of its events, or None if it doesn't exist"""
+    row = Vehicle.objects.filter(
+        pk=vehicle_id
+    ).annotate(
+        events_updated=Max('events__updated_at')
+    ).values_list('updated_at', 'events_updated').first()
+    if row is None:
+        return None
+    return max(value for value in row if value is not None)
+
+
+def vehicle_state(request, vehicle_id=None, pk=None, **kwargs):
+    """Latest change to a vehicle the user can access or any of its events"""
+    vehicle_id = vehicle_id if vehicle_id is not None else pk
+    if not request.access.has_vehicle(int(vehicle_id)):
+        return None
+    return vehicle_last_modified(vehicle_id)
+
+
+async def avehicle_state(request, vehicle_id=None, pk=None, **kwargs):
+    """Async counterpart of vehicle_state"""
+    vehicle_id = vehicle_id if vehicle_id is not None else pk
+    access = await request.aaccess()
+    if not access.has_vehicle(int(vehicle_id)):
+        return None
+    row = await Vehicle.objects.filter(
+        pk=vehicle_id
+    ).annotate(
+        events_updated=Max('events__updated_at')
+    ).values_list('updated_at', 'events_updated').afirst()
+    if row is None:
+        return None
+    return max(value for value in row if value is not None)
+
+
+def event_state(request, pk=None, **kwargs):
+    """Latest change to an event the user can access or to its vehicle"""
+    row = Event.objects.filter(
+        pk=pk, vehicle__in=request.access.vehicle_ids
+    ).values_list('updated_at', 'vehicle__updated_at').first()
+    if row is None:
+        return None
+    return max(row)
+
+
+def _make_etag(request, user, last_modified):
+    # Pages embed the user and a CSRF token, so the tag varies per session
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    source = f"{request.path}|{request.GET.urlencode()}|{user.pk}|{session_key}|{last_modified.isoformat()}"
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def _finish(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        if response.status_code == 200:
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        # Let browsers and the service worker keep a copy but always
+        # revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_on(state_func):
+    """
+    Decorate a view so GET/HEAD requests are answered with 304 Not Modified
+    when ``state_func(request, *args, **kwargs)`` hasn't moved since the
+    client's copy. ``state_func`` returns a datetime, or None to skip
+    conditional handling (e.g. no access; the view then responds as usual).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return aconditional_on(state_func)(view_func)
+
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+            # A 304 would hide queued flash messages until the next page
+            if len(messages.get_messages(request)):
+                return view_func(request, *args, **kwargs)
+
+            last_modified = state_func(request, *args, **kwargs)
+            if last_modified is None:
+                return view_func(request, *args, **kwargs)
+
+            etag = _make_etag(request, request.user, last_modified)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            return _finish(response, etag, timestamp)
+        return inner
+    return decorator
+
+
+def aconditional_on(state_func):
+    """
+    ``conditional_on`` for async views. ``view_func`` may be a coroutine
+    function or return an awaitable (e.g. View.dispatch of an async view);
+    a sync ``state_func`` is run in a thread.
+    """
+    if not iscoroutinefunction(state_func):
+        state_func = sync_to_async(state_func)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def inner(request, *args, **kwargs):
+            user = await request.auser()
+            if request.method not in ('GET', 'HEAD') or not user.is_authenticated:
+                return await view_func(request, *args, **kwargs)
+            # Reading queued messages may load the session
+            if await sync_to_async(lambda: len(messages.get_messages(request)))():
+                return await view_func(request, *args, **kwargs)
+
+            last_modified = await state_func(request, *args, **kwargs)
+            if last_modified is None:
+                return await view_func(request, *args, **kwargs)
+
+            etag = _make_etag(request, user, last_modified)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = await view_func(request, *args, **kwargs)
+            return _finish(response, etag, timestamp)
+        return inner
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    Class-based view counterpart of ``conditional_on``. Set ``state_func``
+    and list this mixin after LoginRequiredMixin (AsyncLoginRequiredMixin for
+    async views) so access is checked first.
+    """
+    state_func = None
+
+    def dispatch(self, request, *args, **kwargs):
+        state_func = type(self).state_func
+        if state_func is None:
+            return super().dispatch(request, *args, **kwargs)
+        decorate = aconditional_on if self.view_is_async else conditional_on
+        return decorate(state_func)(super().dispatch)(request, *args, **kwargs)
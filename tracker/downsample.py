@@ -0,0 +1,109 @@
+"""
+Largest-Triangle-Three-Buckets (LTTB) downsampling for chart series.
+
+A chart a few hundred pixels wide can't show thousands of points, so series
+are reduced to at most ``max_points`` before they are serialised. LTTB keeps
+the first and last points and, from each bucket in between, the point that
+forms the largest triangle with its neighbours, which preserves the peaks
+and dips a plain stride would drop.
+
+Series are held as two ``array('d')`` columns (x as a date ordinal) rather
+than lists of dicts, so a long history costs two flat buffers.
+"""
+from array import array
+from datetime import date
+
+from django.conf import settings
+
+
+def default_max_points():
+    return getattr(settings, 'CHART_MAX_POINTS', 1000)
+
+
+def parse_max_points(value):
+    """
+    ``?max_points=`` as an int between 3 and CHART_MAX_POINTS. Missing or
+    invalid values fall back to CHART_MAX_POINTS so a response stays bounded.
+    """
+    limit = default_max_points()
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        return limit
+    return min(max(points, 3), limit)
+
+
+class Series:
+    """A numeric series of ``(date, value)`` points in date order"""
+
+    def __init__(self):
+        self.x = array('d')
+        self.y = array('d')
+
+    def __len__(self):
+        return len(self.y)
+
+    def append(self, day, value):
+        self.x.append(day.toordinal())
+        self.y.append(value)
+
+    def downsample(self, max_points):
+        """Return a new Series of at most ``max_points`` points"""
+        if not max_points or len(self) <= max_points:
+            return self
+        result = Series()
+        for index in lttb_indices(self.x, self.y, max_points):
+            result.x.append(self.x[index])
+            result.y.append(self.y[index])
+        return result
+
+    def as_chart(self, **extra):
+        """The ``{'labels': [...], 'data': [...]}`` dict the charts consume"""
+        data = {
+            'labels': [date.fromordinal(int(x)).isoformat() for x in self.x],
+            'data': self.y.tolist(),
+        }
+        data.update(extra)
+        return data
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points LTTB keeps when reducing ``x``/``y`` (equal length
+    sequences, ``x`` ascending) to ``threshold`` points.
+    """
+    length = len(y)
+    if threshold >= length or threshold < 3:
+        return range(length)
+
+    indices = [0]
+    # Points between the fixed first and last are split into threshold - 2 buckets
+    every = (length - 2) / (threshold - 2)
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        if next_start >= next_end:
+            next_start, next_end = length - 1, length
+        count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / count
+        avg_y = sum(y[next_start:next_end]) / count
+
+        ax, ay = x[selected], y[selected]
+        best_area = -1.0
+        best = start
+        for index in range(start, end):
+            area = abs((ax - avg_x) * (y[index] - ay) - (ax - x[index]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = index
+        indices.append(best)
+        selected = best
+
+    indices.append(length - 1)
+    return indices
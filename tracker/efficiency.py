@@ -0,0 +1,104 @@
+"""
+Fuel efficiency recompute engine.
+
+MPG (cars) and gallons per hour (boats/other) depend on the previous fill-up,
+so inserting a back-dated fill-up or editing/deleting one changes every later
+row of that vehicle. Instead of recomputing row by row, a LAG() window over
+each vehicle's gas events recomputes all affected rows in a single UPDATE.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Event, Vehicle
+
+logger = logging.getLogger('tracker')
+
+# A fill-up contributes to efficiency when it has gallons and the reading
+# that matches the vehicle's unit. Rows outside this set can't have a value.
+_EFFICIENCY_ROWS = Q(event_type='gas', gallons__gt=0) & (
+    Q(vehicle__type='car', miles__isnull=False) |
+    (~Q(vehicle__type='car') & Q(hours__isnull=False))
+)
+
+# "* 1.0" because SQLite stores whole-number decimals as integers and would
+# divide them as integers
+_RECOMPUTE_SQL = """
+UPDATE {event}
+SET milespergallon = calc.mpg, gallonsperhour = calc.gph, updated_at = %s
+FROM (
+    SELECT e.id, e.date,
+        CASE WHEN v.type = 'car'
+                  AND e.miles - COALESCE(LAG(e.miles) OVER w, v.starting_mileage, 0) > 0
+             THEN ROUND((e.miles - COALESCE(LAG(e.miles) OVER w, v.starting_mileage, 0)) * 1.0 / e.gallons, 2)
+        END AS mpg,
+        CASE WHEN v.type <> 'car' AND e.hours - LAG(e.hours) OVER w > 0
+             THEN ROUND(e.gallons * 1.0 / (e.hours - LAG(e.hours) OVER w), 2)
+        END AS gph
+    FROM {event} e
+    JOIN {vehicle} v ON v.id = e.vehicle_id
+    WHERE e.vehicle_id IN ({vehicle_ids})
+      AND e.event_type = 'gas'
+      AND e.gallons > 0
+      AND ((v.type = 'car' AND e.miles IS NOT NULL)
+           OR (v.type <> 'car' AND e.hours IS NOT NULL))
+    WINDOW w AS (PARTITION BY e.vehicle_id ORDER BY e.date, e.id)
+) AS calc
+WHERE {event}.id = calc.id
+  {since_filter}
+  AND ({event}.milespergallon IS DISTINCT FROM calc.mpg
+       OR {event}.gallonsperhour IS DISTINCT FROM calc.gph)
+"""
+
+
+def recompute_efficiency(vehicle_ids, since=None):
+    """
+    Recompute MPG/GPH for the gas events of ``vehicle_ids``.
+
+    The previous fill-up of each row is found with LAG() over all of the
+    vehicle's fill-ups, but only rows dated ``since`` or later are written,
+    and only when their value actually changes. Rows that can no longer
+    have an efficiency (no longer gas, reading removed) are cleared.
+    Returns the number of rows changed.
+    """
+    vehicle_ids = sorted({int(pk) for pk in vehicle_ids if pk is not None})
+    if not vehicle_ids:
+        return 0
+
+    now = timezone.now()
+    # Placeholders appear in the order: updated_at, vehicle ids, since
+    params = [now, *vehicle_ids]
+    since_filter = ''
+    if since is not None:
+        since_filter = 'AND calc.date >= %s'
+        params.append(since)
+
+    sql = _RECOMPUTE_SQL.format(
+        event=connection.ops.quote_name(Event._meta.db_table),
+        vehicle=connection.ops.quote_name(Vehicle._meta.db_table),
+        vehicle_ids=', '.join(['%s'] * len(vehicle_ids)),
+        since_filter=since_filter,
+    )
+
+    stale = Event.objects.filter(vehicle_id__in=vehicle_ids).filter(
+        Q(milespergallon__isnull=False) | Q(gallonsperhour__isnull=False)
+    ).exclude(_EFFICIENCY_ROWS)
+    if since is not None:
+        stale = stale.filter(date__gte=since)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated = cursor.rowcount
+        cleared = stale.update(milespergallon=None, gallonsperhour=None, updated_at=now)
+
+    logger.debug(f"Recomputed efficiency for vehicles {vehicle_ids}: {updated} updated, {cleared} cleared")
+    return updated + cleared
+
+
+def recompute_vehicle_efficiency(vehicle, since=None):
+    """Recompute one vehicle's efficiency history from ``since`` onwards"""
+    vehicle_id = vehicle.pk if isinstance(vehicle, Vehicle) else vehicle
+    return recompute_efficiency([vehicle_id], since=since)
@@ -0,0 +1,171 @@
+"""
+Maintenance due-date forecasting.
+
+A vehicle's usage rate - miles (cars) or hours (boats/other) a day - is the
+least-squares slope of its readings over the FORECAST_USAGE_DAYS up to its
+latest one. Rates are fitted for a batch of vehicles at once with NumPy and
+stored as Vehicle.usage_rate. Each active schedule is then projected:
+
+    days   last_performed + interval_days
+    miles  the day the odometer reaches last_miles + interval_miles
+    hours  the day the hour meter reaches last_hours + interval_hours
+
+and the earliest is stored as its forecast_due_date / forecast_basis, so a
+page shows "due around ..." by reading two columns.
+
+update_forecasts() refits and reprojects. The 'schedules.forecast' job runs
+it for a vehicle after its readings change, the importer after bulk writes
+and the forecast_maintenance command for every vehicle. Saving a schedule
+reprojects it from the stored rate when its vehicle is loaded, and queues
+the job when it isn't.
+"""
+import logging
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .cache import bump_family_version
+from .jobs import debounce
+from .models import Event, MaintenanceSchedule, Vehicle
+
+logger = logging.getLogger('tracker')
+
+JOB_NAME = 'schedules.forecast'
+# Fewest readings, over the fewest days, a usage rate is fitted from
+MIN_READINGS = 3
+MIN_SPAN_DAYS = 14
+# Projections further out than this are left blank
+MAX_HORIZON_DAYS = 365 * 10
+# Readings logged close together are forecast by one job
+DEBOUNCE = timedelta(minutes=1)
+
+
+def usage_days():
+    return getattr(settings, 'FORECAST_USAGE_DAYS', 180)
+
+
+def fit_usage_rates(vehicles):
+    """``{vehicle_id: Decimal}`` readings per day, for vehicles with enough recent readings"""
+    latest = {vehicle.pk: vehicle.current_reading_date for vehicle in vehicles if vehicle.current_reading_date}
+    if not latest:
+        return {}
+    cars = {vehicle.pk for vehicle in vehicles if vehicle.type == 'car'}
+    window = usage_days()
+
+    rows = list(Event.objects.filter(
+        Q(vehicle_id__in=cars & latest.keys(), miles__isnull=False) |
+        Q(vehicle_id__in=latest.keys() - cars, hours__isnull=False),
+        date__gte=min(latest.values()) - timedelta(days=window),
+    ).values_list('vehicle_id', 'date', 'miles', 'hours'))
+    if not rows:
+        return {}
+
+    vehicle_id = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    day = np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int64).astype(float)
+    reading = np.fromiter(
+        (float(row[2] if row[0] in cars else row[3]) for row in rows), dtype=float, count=len(rows)
+    )
+    # The query reaches back from the earliest latest reading; keep each
+    # vehicle's own window
+    cutoff = {pk: np.datetime64(value, 'D').astype(np.int64) - window for pk, value in latest.items()}
+    keep = day >= np.fromiter((cutoff[pk] for pk in vehicle_id.tolist()), dtype=float, count=len(rows))
+    vehicle_id, day, reading = vehicle_id[keep], day[keep], reading[keep]
+
+    # Slope of reading against day per vehicle, from grouped sums of the
+    # values centred on each vehicle's means
+    ids, group, counts = np.unique(vehicle_id, return_inverse=True, return_counts=True)
+    day_offset = day - (np.bincount(group, weights=day) / counts)[group]
+    reading_offset = reading - (np.bincount(group, weights=reading) / counts)[group]
+    sxx = np.bincount(group, weights=day_offset * day_offset)
+    sxy = np.bincount(group, weights=day_offset * reading_offset)
+    first = np.full(len(ids), np.inf)
+    last = np.full(len(ids), -np.inf)
+    np.minimum.at(first, group, day)
+    np.maximum.at(last, group, day)
+
+    fitted = (counts >= MIN_READINGS) & (last - first >= MIN_SPAN_DAYS) & (sxx > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # A corrected reading can slope backwards; that is no usage
+        rates = np.maximum(np.where(fitted, sxy / sxx, np.nan), 0)
+    return {
+        int(pk): Decimal(f'{rate:.3f}')
+        for pk, rate in zip(ids.tolist(), rates.tolist()) if not math.isnan(rate)
+    }
+
+
+def project(schedule, vehicle):
+    """
+    ``(date, basis)`` of the first of the schedule's intervals to run out at
+    the vehicle's stored usage rate, or ``(None, '')`` when none can be
+    projected. Never-performed and inactive schedules get no forecast.
+    """
+    if not schedule.is_active or not schedule.last_performed:
+        return None, ''
+
+    candidates = []
+    if schedule.interval_days and schedule.interval_days <= MAX_HORIZON_DAYS:
+        candidates.append((schedule.last_performed + timedelta(days=schedule.interval_days), 'days'))
+
+    if vehicle.type == 'car':
+        interval, last, basis = schedule.interval_miles, schedule.last_miles, 'miles'
+    else:
+        interval, last, basis = schedule.interval_hours, schedule.last_hours, 'hours'
+    rate = vehicle.usage_rate
+    if interval and last and rate and vehicle.current_reading is not None and vehicle.current_reading_date:
+        # Negative when already past the interval: when it ran out
+        days = math.ceil(float(last + interval - vehicle.current_reading) / float(rate))
+        if abs(days) <= MAX_HORIZON_DAYS:
+            candidates.append((vehicle.current_reading_date + timedelta(days=days), basis))
+
+    return min(candidates) if candidates else (None, '')
+
+
+def update_forecasts(vehicle_ids):
+    """
+    Refit the usage rates of ``vehicle_ids`` and reproject their active
+    schedules. Returns ``(vehicles changed, schedules changed)``.
+    """
+    vehicles = list(Vehicle.objects.filter(pk__in=vehicle_ids).only(
+        'id', 'family_id', 'type', 'current_reading', 'current_reading_date', 'usage_rate'
+    ))
+    rates = fit_usage_rates(vehicles)
+    changed_vehicles = []
+    for vehicle in vehicles:
+        rate = rates.get(vehicle.pk)
+        if rate != vehicle.usage_rate:
+            vehicle.usage_rate = rate
+            changed_vehicles.append(vehicle)
+
+    by_id = {vehicle.pk: vehicle for vehicle in vehicles}
+    schedules = MaintenanceSchedule.objects.filter(vehicle_id__in=by_id, is_active=True).only(
+        'id', 'vehicle_id', 'is_active', 'interval_days', 'interval_miles', 'interval_hours',
+        'last_performed', 'last_miles', 'last_hours', 'forecast_due_date', 'forecast_basis',
+    )
+    changed_schedules = []
+    for schedule in schedules:
+        forecast = project(schedule, by_id[schedule.vehicle_id])
+        if forecast != (schedule.forecast_due_date, schedule.forecast_basis):
+            schedule.forecast_due_date, schedule.forecast_basis = forecast
+            changed_schedules.append(schedule)
+
+    with transaction.atomic():
+        Vehicle.objects.bulk_update(changed_vehicles, ['usage_rate'])
+        MaintenanceSchedule.objects.bulk_update(changed_schedules, ['forecast_due_date', 'forecast_basis'])
+
+    family_ids = {vehicle.family_id for vehicle in changed_vehicles}
+    family_ids.update(by_id[schedule.vehicle_id].family_id for schedule in changed_schedules)
+    if family_ids:
+        transaction.on_commit(lambda: bump_family_version(*family_ids))
+    logger.debug(f"Forecast {len(vehicles)} vehicles: {len(changed_vehicles)} rates, "
+                 f"{len(changed_schedules)} schedules changed")
+    return len(changed_vehicles), len(changed_schedules)
+
+
+def queue_forecast(vehicle_id):
+    """Refit ``vehicle_id`` in the background, once its burst of writes is over"""
+    return debounce(JOB_NAME, key=f"{JOB_NAME}:{vehicle_id}", delay=DEBOUNCE, vehicle_id=vehicle_id)
@@ -4,6 +4,7 @@ from django.contrib.auth.forms import UserCreationForm
 from datetime import date
 from django.utils.translation import gettext_lazy as _
 from .models import Family, Vehicle, Event, TodoItem, Location, MaintenanceSchedule
+from .access import get_access
 
 
 class VehicleTypeFieldMixin:
@@ -115,10 +116,11 @@ class VehicleForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Limit family choices to families the user belongs to
         if user:
-            self.fields['family'].queryset = user.families.all()
+            access = get_access(user)
+            self.fields['family'].queryset = access.families()
             # If user is only in one family, preselect it
-            if user.families.count() == 1:
-                self.fields['family'].initial = user.families.first()
+            if len(access.family_ids) == 1:
+                self.fields['family'].initial = next(iter(access.family_ids))
         
         # Add help text for fields
         self.fields['starting_mileage'].help_text = "Initial odometer reading"
@@ -156,11 +158,14 @@ class EventForm(forms.ModelForm):
         
         # Limit vehicle choices to vehicles in user's families
         if user:
-            user_families = user.families.all()
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
             
             # Limit location choices to those created by the user
             self.fields['location'].queryset = Location.objects.filter(created_by=user)
+        
+        if not self.instance.pk:
+            # main.js preselects the nearest known location on new events
+            self.fields['location'].widget.attrs['data-suggest-nearby'] = 'true'
 
 
 class TodoItemForm(forms.ModelForm):
@@ -184,13 +189,13 @@ class TodoItemForm(forms.ModelForm):
         
         if user:
             # Get all families the user belongs to
-            user_families = user.families.all()
+            access = get_access(user)
             
             # Limit vehicle choices to those in user's families
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = access.vehicles()
             
             # Limit shared_with to family members across all user's families
-            family_members = User.objects.filter(families__in=user_families).distinct().exclude(id=user.id)
+            family_members = User.objects.filter(families__in=access.family_ids).distinct().exclude(id=user.id)
             self.fields['shared_with'].queryset = family_members
 
 
@@ -209,11 +214,12 @@ class LocationForm(forms.ModelForm):
         
         if user:
             # Limit family choices to only families the user belongs to
-            self.fields['family'].queryset = user.families.all()
+            access = get_access(user)
+            self.fields['family'].queryset = access.families()
             
             # If the user belongs to only one family, select it by default
-            if user.families.count() == 1:
-                self.fields['family'].initial = user.families.first()
+            if len(access.family_ids) == 1:
+                self.fields['family'].initial = next(iter(access.family_ids))
         
         # Add help text
         self.fields['latitude'].help_text = 'Decimal degrees (e.g., 37.123456)'
@@ -241,8 +247,7 @@ class MaintenanceEventForm(VehicleTypeFieldMixin, forms.ModelForm):
         
         # Limit vehicle choices to vehicles in user's families
         if user:
-            user_families = user.families.all()
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
 
 
 class MaintenanceScheduleForm(forms.ModelForm):
@@ -292,8 +297,7 @@ class MaintenanceScheduleForm(forms.ModelForm):
             
         # Filter vehicles to only those the user has access to
         if user:
-            user_families = user.families.all()
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
             
         # Set initial values based on vehicle type
         if self.instance and self.instance.pk:
@@ -331,10 +335,14 @@ class MaintenanceScheduleForm(forms.ModelForm):
 class GasEventForm(VehicleTypeFieldMixin, forms.ModelForm):
     class Meta:
         model = Event
-        fields = ['vehicle', 'date', 'miles', 'hours', 'gallons', 'price_per_gallon', 'total_cost', 'notes']
+        fields = ['vehicle', 'date', 'location', 'miles', 'hours', 'gallons', 'price_per_gallon', 'total_cost', 'notes']
+        labels = {
+            'location': 'Station',
+        }
         widgets = {
             'vehicle': forms.Select(attrs={'class': 'form-select'}),
             'date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'location': forms.Select(attrs={'class': 'form-select'}),
             'miles': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.1'}),
             'hours': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
             'gallons': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.001'}),
@@ -351,10 +359,13 @@ class GasEventForm(VehicleTypeFieldMixin, forms.ModelForm):
         self.fields['date'].initial = date.today()
         self.fields['miles'].help_text = "Current odometer reading at fill-up"
         self.fields['hours'].help_text = "Current hour meter reading at fill-up"
+        self.fields['location'].help_text = "Where you filled up, for price comparisons in Fuel Analytics"
         # Limit vehicle choices to vehicles in user's families
         if user:
-            user_families = user.families.all()
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
+            
+            # Limit location choices to those created by the user
+            self.fields['location'].queryset = Location.objects.filter(created_by=user)
             
             # Set initial vehicle to the most recently used one
             try:
@@ -367,6 +378,10 @@ class GasEventForm(VehicleTypeFieldMixin, forms.ModelForm):
             except Exception:
                 # If there's any error, just continue without a default vehicle
                 pass
+        
+        if not self.instance.pk:
+            # main.js preselects the nearest known station on new fill-ups
+            self.fields['location'].widget.attrs['data-suggest-nearby'] = 'true'
 
     def clean(self):
         cleaned_data = super().clean()
@@ -403,8 +418,7 @@ class OutingEventForm(VehicleTypeFieldMixin, forms.ModelForm):
         
         # Limit vehicle choices to vehicles in user's families
         if user:
-            user_families = user.families.all()
-            self.fields['vehicle'].queryset = Vehicle.objects.filter(family__in=user_families)
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
             
             # Limit location choices to those created by the user
             self.fields['location'].queryset = Location.objects.filter(created_by=user)
@@ -420,6 +434,10 @@ class OutingEventForm(VehicleTypeFieldMixin, forms.ModelForm):
             except Exception:
                 # If there's any error, just continue without a default vehicle
                 pass
+        
+        if not self.instance.pk:
+            # main.js preselects the nearest known location on new events
+            self.fields['location'].widget.attrs['data-suggest-nearby'] = 'true'
 
 
 class UserRegisterForm(UserCreationForm):
@@ -439,4 +457,45 @@ class UserRegisterForm(UserCreationForm):
         super().__init__(*args, **kwargs)
         # Add Bootstrap classes to the password fields
         self.fields['password1'].widget.attrs.update({'class': 'form-control'})
-        self.fields['password2'].widget.attrs.update({'class': 'form-control'})
\ No newline at end of file
+        self.fields['password2'].widget.attrs.update({'class': 'form-control'})
+
+class EventImportForm(forms.Form):
+    """Form for uploading a CSV of historical events"""
+    FORMAT_CHOICES = [
+        ('', 'Detect from header'),
+        ('triptrack', 'TripTracker export'),
+        ('fuelly', 'Fuelly export'),
+    ]
+    
+    csv_file = forms.FileField(
+        label=_('CSV file'),
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'})
+    )
+    vehicle = forms.ModelChoiceField(
+        queryset=Vehicle.objects.none(),
+        required=False,
+        empty_label='Match the vehicle name column',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    format = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    event_type = forms.ChoiceField(
+        choices=Event.EVENT_TYPES,
+        initial='gas',
+        help_text=_('Used for rows without an event type column'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label=_('Validate only'),
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['vehicle'].queryset = get_access(user).vehicles()
@@ -0,0 +1,319 @@
+"""
+Fleet fuel analytics, computed with NumPy.
+
+The fill-ups of a set of vehicles are read with one values_list() query into
+column arrays (FillUps) ordered by vehicle and date, and every statistic is
+computed over whole columns instead of Event instances and get_mpg():
+
+- price per gallon at each station (the fill-up's location) and its trend
+- the fleet's average price paid per month and its rolling average
+- each vehicle's efficiency percentiles and rolling average
+- outlier fill-ups, far from the vehicle's usual efficiency, which mostly
+  mean a fill-up was never logged or a tank was only partly filled
+
+Efficiency is the stored MPG (cars) or gallons per hour (boats/other) kept
+by tracker.efficiency. Outliers are scored on distance per gallon - MPG, or
+1 / GPH - so a value that is too high means the same for every vehicle type.
+"""
+import logging
+import math
+from array import array
+from datetime import date
+
+import numpy as np
+
+from . import cache as family_cache
+from .downsample import Series, default_max_points
+from .models import Event, Location, Vehicle
+
+logger = logging.getLogger('tracker')
+
+FIELDS = ('id', 'vehicle_id', 'date', 'gallons', 'price_per_gallon', 'total_cost',
+          'milespergallon', 'gallonsperhour', 'location_id')
+PERCENTILES = (10, 25, 50, 75, 90)
+# Fill-ups in a vehicle's rolling efficiency average
+ROLLING_WINDOW = 5
+# Months in the rolling average of fleet prices
+PRICE_WINDOW = 3
+# Fewest scored fill-ups a vehicle needs before any of them is an outlier
+MIN_FILL_UPS = 6
+# Robust z-score (from the median absolute deviation) that makes an outlier
+OUTLIER_Z = 3.5
+# Smallest spread assumed, in log units (about 5%), so a vehicle with very
+# regular fill-ups doesn't flag every small difference
+MIN_SPREAD = 0.05
+# Fill-ups under this share of the vehicle's median gallons look partial
+PARTIAL_FILL_SHARE = 0.6
+DAYS_PER_MONTH = 365.25 / 12
+# datetime64[D] counts days from 1970-01-01; Series wants date ordinals
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+REASONS = {
+    'missed_entry': 'Possible missed fill-up',
+    'partial_fill': 'Possible partial fill',
+    'low_efficiency': 'Unusually low efficiency',
+}
+
+
+def _floats(values):
+    # Decimals to float64, None to NaN
+    return np.fromiter(
+        (math.nan if value is None else float(value) for value in values), dtype=float, count=len(values)
+    )
+
+
+def _ids(values):
+    # None (no station) becomes 0, which no row has as a primary key
+    return np.fromiter((value or 0 for value in values), dtype=np.int64, count=len(values))
+
+
+def _round(value, digits=2):
+    # JSON-ready: NaN becomes None
+    value = float(value)
+    return None if math.isnan(value) else round(value, digits)
+
+
+def rolling_mean(values, window):
+    """The mean of each value and up to ``window - 1`` values before it"""
+    sums = np.cumsum(values, dtype=float)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+class FillUps:
+    """Gas event columns as NumPy arrays, ordered by vehicle, date and id"""
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(FIELDS)
+        ids, vehicle_ids, dates, gallons, prices, costs, mpg, gph, location_ids = columns
+        self.id = _ids(ids)
+        self.vehicle_id = _ids(vehicle_ids)
+        self.date = np.array(dates, dtype='datetime64[D]')
+        self.gallons = _floats(gallons)
+        self.total_cost = _floats(costs)
+        self.mpg = _floats(mpg)
+        self.gph = _floats(gph)
+        self.location_id = _ids(location_ids)
+
+        # Price from the cost where only the total was entered
+        price = _floats(prices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            derived = self.total_cost / self.gallons
+        price = np.where(np.isnan(price) & (self.gallons > 0), derived, price)
+        self.price = np.where(np.isfinite(price) & (price > 0), price, np.nan)
+
+    @classmethod
+    def load(cls, vehicle_ids, start=None, end=None):
+        events = Event.objects.filter(vehicle_id__in=vehicle_ids, event_type='gas')
+        if start:
+            events = events.filter(date__gte=start)
+        if end:
+            events = events.filter(date__lte=end)
+        return cls(list(events.order_by('vehicle_id', 'date', 'id').values_list(*FIELDS)))
+
+    def __len__(self):
+        return len(self.id)
+
+    def vehicles(self):
+        """``{vehicle_id: slice}`` of each vehicle's run of rows"""
+        if not len(self):
+            return {}
+        starts = np.flatnonzero(np.r_[True, self.vehicle_id[1:] != self.vehicle_id[:-1]])
+        ends = np.r_[starts[1:], len(self)]
+        return {int(self.vehicle_id[start]): slice(int(start), int(end)) for start, end in zip(starts, ends)}
+
+
+def station_prices(fill_ups, names):
+    """Price per gallon at each station, cheapest first"""
+    valid = (fill_ups.location_id > 0) & ~np.isnan(fill_ups.price)
+    if not valid.any():
+        return []
+    location = fill_ups.location_id[valid]
+    days = fill_ups.date[valid].astype(np.int64).astype(float)
+    order = np.lexsort((days, location))
+    location, days = location[order], days[order]
+    dates = fill_ups.date[valid][order]
+    price = fill_ups.price[valid][order]
+    gallons = np.nan_to_num(fill_ups.gallons[valid][order])
+
+    stations, starts, counts = np.unique(location, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(stations)), counts)
+    mean = np.add.reduceat(price, starts) / counts
+    low = np.minimum.reduceat(price, starts)
+    high = np.maximum.reduceat(price, starts)
+    total_gallons = np.add.reduceat(gallons, starts)
+    latest = starts + counts - 1
+
+    # Least-squares slope of price against date within each station, from
+    # grouped sums; NaN where every fill-up was on one day
+    day_offset = days - (np.add.reduceat(days, starts) / counts)[group]
+    sxx = np.add.reduceat(day_offset * day_offset, starts)
+    sxy = np.add.reduceat(day_offset * (price - mean[group]), starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trend = np.where(sxx > 0, sxy / sxx * DAYS_PER_MONTH, np.nan)
+
+    return [
+        {
+            'id': int(station),
+            'name': names.get(int(station), ''),
+            'fill_ups': int(counts[index]),
+            'gallons': _round(total_gallons[index], 1),
+            'avg_price': _round(mean[index], 3),
+            'min_price': _round(low[index], 3),
+            'max_price': _round(high[index], 3),
+            'latest_price': _round(price[latest[index]], 3),
+            'latest_date': str(dates[latest[index]]),
+            'trend_per_month': _round(trend[index], 3),
+        }
+        for index, station in sorted(enumerate(stations), key=lambda item: mean[item[0]])
+    ]
+
+
+def monthly_prices(fill_ups):
+    """Average price paid per gallon across the fleet in each month"""
+    valid = ~np.isnan(fill_ups.price) & (fill_ups.gallons > 0)
+    months, inverse = np.unique(fill_ups.date[valid].astype('datetime64[M]'), return_inverse=True)
+    gallons = fill_ups.gallons[valid]
+    # Weighted by gallons, so a top-up doesn't count as much as a full tank
+    average = np.bincount(inverse, weights=gallons * fill_ups.price[valid]) / np.bincount(inverse, weights=gallons)
+    return {
+        'labels': [str(month) for month in months],
+        'data': [_round(value, 3) for value in average],
+        'rolling': [_round(value, 3) for value in rolling_mean(average, PRICE_WINDOW)],
+    }
+
+
+def _efficiency(fill_ups, vehicle, rows):
+    return (fill_ups.mpg if vehicle.type == 'car' else fill_ups.gph)[rows]
+
+
+def vehicle_stats(fill_ups, vehicles, max_points):
+    """Fill-up totals, efficiency percentiles and rolling efficiency per vehicle"""
+    runs = fill_ups.vehicles()
+    results = []
+    for vehicle in vehicles:
+        rows = runs.get(vehicle.pk, slice(0, 0))
+        gallons = fill_ups.gallons[rows]
+        priced = ~np.isnan(fill_ups.price[rows]) & (gallons > 0)
+        entry = {
+            'id': vehicle.pk,
+            'name': vehicle.name,
+            'type': vehicle.type,
+            'unit': 'MPG' if vehicle.type == 'car' else 'GPH',
+            'fill_ups': rows.stop - rows.start,
+            'gallons': _round(np.nansum(gallons), 1),
+            'cost': _round(np.nansum(fill_ups.total_cost[rows])),
+            'avg_price': _round(
+                np.sum(fill_ups.price[rows][priced] * gallons[priced]) / np.sum(gallons[priced]), 3
+            ) if priced.any() else None,
+            'efficiency': None,
+            'rolling': None,
+            'series': {'labels': [], 'data': []},
+        }
+
+        efficiency = _efficiency(fill_ups, vehicle, rows)
+        scored = np.isfinite(efficiency) & (efficiency > 0)
+        if scored.any():
+            values = efficiency[scored]
+            entry['efficiency'] = {
+                'count': len(values),
+                'mean': _round(values.mean()),
+                **{f'p{percentile}': _round(value) for percentile, value in zip(
+                    PERCENTILES, np.percentile(values, PERCENTILES)
+                )},
+            }
+            rolling = rolling_mean(values, ROLLING_WINDOW)
+            entry['rolling'] = _round(rolling[-1])
+            series = Series()
+            series.x = array('d', (fill_ups.date[rows][scored].astype(np.int64) + EPOCH_ORDINAL).tolist())
+            series.y = array('d', rolling.tolist())
+            entry['series'] = series.downsample(max_points).as_chart()
+        results.append(entry)
+    return results
+
+
+def find_outliers(fill_ups, vehicles):
+    """Fill-ups whose distance per gallon is far from their vehicle's usual, newest first"""
+    runs = fill_ups.vehicles()
+    outliers = []
+    for vehicle in vehicles:
+        rows = runs.get(vehicle.pk)
+        if rows is None:
+            continue
+        efficiency = _efficiency(fill_ups, vehicle, rows)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_gallon = efficiency if vehicle.type == 'car' else 1 / efficiency
+        scored = np.flatnonzero(np.isfinite(per_gallon) & (per_gallon > 0))
+        if len(scored) < MIN_FILL_UPS:
+            continue
+
+        # Compared in log space, so half and double the usual are equally far
+        logs = np.log(per_gallon[scored])
+        median = np.median(logs)
+        deviation = max(np.median(np.abs(logs - median)), MIN_SPREAD)
+        z = 0.6745 * (logs - median) / deviation
+        flagged = np.flatnonzero(np.abs(z) > OUTLIER_Z)
+        if not len(flagged):
+            continue
+
+        gallons = fill_ups.gallons[rows]
+        partial = gallons < np.nanmedian(gallons) * PARTIAL_FILL_SHARE
+        usual = math.exp(median) if vehicle.type == 'car' else 1 / math.exp(median)
+        for position in flagged:
+            index = scored[position]
+            if z[position] > 0:
+                # Too far on the fuel added: part of a tank, or the distance
+                # of two tanks because the fill-up between wasn't logged
+                reason = 'partial_fill' if partial[index] else 'missed_entry'
+            else:
+                # Too much fuel for the distance: refilling what a partial
+                # fill-up before it left out
+                reason = 'partial_fill' if index > 0 and partial[index - 1] else 'low_efficiency'
+            outliers.append({
+                'event_id': int(fill_ups.id[rows][index]),
+                'vehicle_id': vehicle.pk,
+                'vehicle': vehicle.name,
+                'date': str(fill_ups.date[rows][index]),
+                'efficiency': _round(efficiency[index]),
+                'expected': _round(usual),
+                'unit': 'MPG' if vehicle.type == 'car' else 'GPH',
+                'gallons': _round(gallons[index], 3),
+                'reason': reason,
+                'reason_display': REASONS[reason],
+                'score': _round(z[position]),
+            })
+    outliers.sort(key=lambda outlier: (outlier['date'], outlier['event_id']), reverse=True)
+    return outliers
+
+
+def build_fuel_analytics(vehicle_ids, start=None, end=None, max_points=None):
+    """Every fleet fuel statistic for ``vehicle_ids`` as a JSON-ready dict"""
+    vehicles = list(Vehicle.objects.filter(pk__in=vehicle_ids).only('id', 'name', 'type').order_by('name', 'id'))
+    fill_ups = FillUps.load([vehicle.pk for vehicle in vehicles], start, end)
+    station_ids = np.unique(fill_ups.location_id[fill_ups.location_id > 0]).tolist()
+    names = dict(Location.objects.filter(pk__in=station_ids).values_list('id', 'name'))
+    logger.debug(f"Fuel analytics over {len(fill_ups)} fill-ups of {len(vehicles)} vehicles")
+    return {
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'fill_ups': len(fill_ups),
+        'vehicles': vehicle_stats(fill_ups, vehicles, max_points or default_max_points()),
+        'stations': station_prices(fill_ups, names),
+        'monthly_prices': monthly_prices(fill_ups),
+        'outliers': find_outliers(fill_ups, vehicles),
+    }
+
+
+def fuel_analytics(family_ids, start=None, end=None, max_points=None):
+    """
+    build_fuel_analytics() for the vehicles of ``family_ids``, cached until
+    one of the families' data changes
+    """
+    family_ids = sorted(family_ids)
+    return family_cache.get_or_build(
+        'fuel_analytics', family_ids,
+        lambda: build_fuel_analytics(
+            Vehicle.objects.filter(family__in=family_ids).values('id'), start, end, max_points
+        ),
+        start, end, max_points,
+    )
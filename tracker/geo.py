@@ -0,0 +1,145 @@
+"""
+Nearest-location lookups on a geohash grid.
+
+Every Location with coordinates stores the geohash of its point
+(Location.geohash, kept up to date on save). A geohash names a grid cell and
+each extra character splits it into 32 smaller cells, so a prefix match
+selects one cell at any size and is a range scan on the column's index.
+
+A radius query picks the finest precision whose cells still cover the
+radius' bounding box in a handful of cells, fetches the locations in those
+cells, then computes the exact haversine distance of every candidate in one
+pass over array columns, the same layout tracker.downsample uses.
+"""
+import math
+from array import array
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# ~5m cells; enough to tell two pumps at a fuel station apart
+PRECISION = 9
+# Most cells a radius query may cover before a coarser precision is used
+MAX_CELLS = 9
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = math.pi * EARTH_RADIUS_MILES / 180
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """The geohash of a point, ``precision`` characters long"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        if even:
+            bounds, coordinate = lon_range, float(longitude)
+        else:
+            bounds, coordinate = lat_range, float(latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(latitude, longitude)`` size in degrees of a cell at ``precision``"""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    return 180.0 / 2 ** (bits - lon_bits), 360.0 / 2 ** lon_bits
+
+
+def _steps(low, high, step):
+    # Points ``step`` apart from ``low`` to ``high``, both ends included, so
+    # every cell the span touches gets sampled
+    count = int((high - low) / step) + 1
+    return [low + step * index for index in range(count)] + [high]
+
+
+def covering_cells(latitude, longitude, radius_miles):
+    """
+    Geohash prefixes whose cells together cover every point within
+    ``radius_miles`` of the given point.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    lat_delta = radius_miles / MILES_PER_DEGREE
+    south = max(latitude - lat_delta, -90.0)
+    north = min(latitude + lat_delta, 90.0)
+    # Longitude degrees shrink towards the poles; past them, every longitude
+    widest = max(abs(south), abs(north))
+    cos_lat = math.cos(math.radians(widest))
+    if widest >= 90 or radius_miles / (MILES_PER_DEGREE * cos_lat) >= 180:
+        west, east = -180.0, 180.0 - 1e-9
+    else:
+        lon_delta = radius_miles / (MILES_PER_DEGREE * cos_lat)
+        west, east = longitude - lon_delta, longitude + lon_delta
+
+    for precision in range(PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        if ((north - south) / lat_step + 2) * ((east - west) / lon_step + 2) > MAX_CELLS * 4:
+            # Far too many cells at this precision; try coarser
+            continue
+        cells = set()
+        for lat in _steps(south, north, lat_step):
+            for lon in _steps(west, east, lon_step):
+                # Wrap across the antimeridian
+                lon = (lon + 180.0) % 360.0 - 180.0
+                cells.add(encode(min(lat, 90.0 - 1e-9), lon, precision))
+        if len(cells) <= MAX_CELLS:
+            return sorted(cells)
+    return ['']
+
+
+def cell_filter(latitude, longitude, radius_miles):
+    """A Q() for Location rows in the cells covering the radius"""
+    query = Q()
+    for prefix in covering_cells(latitude, longitude, radius_miles):
+        query |= Q(geohash__startswith=prefix)
+    return query & ~Q(geohash='')
+
+
+def haversine_miles(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances in miles from one point to each of the given points"""
+    lat1 = math.radians(float(latitude))
+    lon1 = math.radians(float(longitude))
+    cos_lat1 = math.cos(lat1)
+    radians = math.radians
+    sin = math.sin
+    cos = math.cos
+    distances = array('d')
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2 = radians(lat2)
+        half_dlat = sin((lat2 - lat1) / 2)
+        half_dlon = sin((radians(lon2) - lon1) / 2)
+        a = half_dlat * half_dlat + cos_lat1 * cos(lat2) * half_dlon * half_dlon
+        distances.append(2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a))))
+    return distances
+
+
+def nearest(rows, latitude, longitude, radius_miles, limit):
+    """
+    ``rows`` of ``(id, latitude, longitude, ...)`` within ``radius_miles``,
+    nearest first, as ``(distance, row)`` pairs.
+    """
+    rows = list(rows)
+    latitudes = array('d', (float(row[1]) for row in rows))
+    longitudes = array('d', (float(row[2]) for row in rows))
+    distances = haversine_miles(latitude, longitude, latitudes, longitudes)
+    within = [index for index, distance in enumerate(distances) if distance <= radius_miles]
+    within.sort(key=distances.__getitem__)
+    return [(distances[index], rows[index]) for index in within[:limit]]
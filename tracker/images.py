@@ -0,0 +1,152 @@
+"""
+Vehicle image renditions.
+
+Uploads are stored untouched so the form submission returns immediately;
+Vehicle.save() marks the vehicle's image_status 'pending' and queues a
+'vehicles.render_image' job (see tracker.tasks). The job, or the
+process_vehicle_images command, then decodes the upload once and writes every
+RENDITIONS size in each of FORMATS, recording their storage paths in
+Vehicle.image_renditions:
+
+    {'card': {'width': 480, 'height': 360,
+              'webp': 'vehicle_images/renditions/7/card-1a2b3c4d.webp',
+              'jpeg': 'vehicle_images/renditions/7/card-1a2b3c4d.jpg'}, ...}
+
+Templates show a placeholder until the status is 'ready' (see the
+vehicle_image tag in tracker_images).
+"""
+import hashlib
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from imagekit.processors import ProcessorPipeline, ResizeToFill, ResizeToFit, Transpose
+from imagekit.utils import img_to_fobj, open_image
+
+from .jobs import current_job
+from .models import Vehicle
+
+logger = logging.getLogger('tracker')
+
+RENDITIONS = {
+    'thumb': [ResizeToFill(200, 150)],
+    'card': [ResizeToFill(480, 360)],
+    'full': [ResizeToFit(1600, 1200, upscale=False)],
+}
+
+# (key, Pillow format, file extension, save options)
+FORMATS = (
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+RENDITION_DIR = 'vehicle_images/renditions'
+
+
+def has_image():
+    return ~Q(image='') & Q(image__isnull=False)
+
+
+def rendition_path(vehicle_id, source_name, name, extension):
+    # Named after the source upload, so a new upload never reuses a URL that
+    # browsers or the service worker may have cached
+    token = hashlib.md5(source_name.encode()).hexdigest()[:8]
+    return f"{RENDITION_DIR}/{vehicle_id}/{name}-{token}.{extension}"
+
+
+def render_renditions(vehicle_id, source):
+    """Write every rendition of the ``source`` file; returns the renditions dict"""
+    source.open('rb')
+    try:
+        original = open_image(source)
+        # Decode large JPEGs at a reduced scale; still at least as big as
+        # the largest rendition
+        original.draft('RGB', (1600, 1600))
+        # Phone photos are stored sideways with an EXIF orientation
+        original = Transpose().process(original)
+        original.load()
+    finally:
+        source.close()
+
+    renditions = {}
+    for name, processors in RENDITIONS.items():
+        image = ProcessorPipeline(processors).process(original)
+        rendition = {'width': image.width, 'height': image.height}
+        for key, image_format, extension, options in FORMATS:
+            path = rendition_path(vehicle_id, source.name, name, extension)
+            content = img_to_fobj(image, image_format, **options)
+            # Re-rendering the same upload replaces the files in place
+            default_storage.delete(path)
+            rendition[key] = default_storage.save(path, ContentFile(content.read()))
+        renditions[name] = rendition
+    return renditions
+
+
+def delete_renditions(renditions, keep=()):
+    """Delete the files of a renditions dict, except paths in ``keep``"""
+    for rendition in renditions.values():
+        for key, *_ in FORMATS:
+            path = rendition.get(key)
+            if not path or path in keep:
+                continue
+            try:
+                default_storage.delete(path)
+            except Exception as e:
+                logger.warning(f"Error deleting image rendition {path}: {e}")
+
+
+def process_vehicle_image(vehicle_id, image=None):
+    """
+    Render a pending vehicle image. Returns True when renditions were
+    stored, False when there was nothing to do (not pending, or claimed by
+    another worker) or rendering failed. Inside a job a rendering error is
+    raised instead, so the queue retries it and records the last failure.
+
+    ``image`` is the upload a job was queued for. A retry of that job may
+    reclaim it while it is still 'processing', as it is when the worker
+    rendering it died.
+    """
+    # Claim it so concurrent workers don't render the same upload
+    claimable = Q(image_status='pending')
+    if image:
+        claimable |= Q(image_status='processing', image=image)
+    if not Vehicle.objects.filter(claimable, pk=vehicle_id).update(image_status='processing'):
+        return False
+
+    vehicle = Vehicle.objects.only('id', 'image', 'image_renditions').get(pk=vehicle_id)
+    source_name = vehicle.image.name
+    try:
+        renditions = render_renditions(vehicle.pk, vehicle.image)
+    except Exception as e:
+        # Inside a job the error goes to the queue, which retries with
+        # backoff; only the last attempt marks the image failed
+        job = current_job()
+        retrying = job is not None and job.attempts < job.max_attempts
+        logger.error(f"Error rendering image for vehicle {vehicle_id}"
+                     f"{', will retry' if retrying else ''}: {e}")
+        Vehicle.objects.filter(pk=vehicle_id, image=source_name, image_status='processing').update(
+            image_status='pending' if retrying else 'failed'
+        )
+        if job is not None:
+            raise
+        return False
+
+    # If a new image was uploaded meanwhile the vehicle is pending again;
+    # leave it for the next pass and drop what was just rendered
+    stored = Vehicle.objects.filter(pk=vehicle_id, image=source_name, image_status='processing').update(
+        image_status='ready',
+        image_renditions=renditions,
+        # Moves list card cache keys and ETags on to the new renditions
+        updated_at=timezone.now(),
+    )
+    if not stored:
+        delete_renditions(renditions)
+        return False
+
+    keep = {path for rendition in renditions.values() for path in rendition.values() if isinstance(path, str)}
+    delete_renditions(vehicle.image_renditions, keep=keep)
+    logger.debug(f"Rendered {len(renditions)} image sizes for vehicle {vehicle_id}")
+    return True
+
@@ -0,0 +1,423 @@
+"""
+Bulk importer for event history exported from spreadsheets and other fuel
+trackers.
+
+Rows are validated in a single streaming pass and inserted with
+``bulk_create`` in batches. ``bulk_create`` skips ``Event.save()`` and the
+signal handlers, so the derived data they maintain (fuel efficiency, the
+vehicle's current reading, maintenance schedule ``last_*`` values and
+forecasts, monthly stats, search vectors and the family cache version) is
+brought up to date once per vehicle afterwards.
+"""
+import csv
+import logging
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_family_version
+from .efficiency import recompute_efficiency
+from .forecast import update_forecasts
+from .rollups import rebuild_monthly_stats
+from .search import update_search_vectors
+from .models import Event, Vehicle, Location, MaintenanceCategory, MaintenanceSchedule
+
+logger = logging.getLogger('tracker')
+
+# Event attributes a CSV column can be mapped to. ``reading`` goes to miles
+# or hours depending on the vehicle type.
+IMPORT_FIELDS = (
+    'vehicle', 'event_type', 'date', 'reading', 'miles', 'hours', 'gallons',
+    'price_per_gallon', 'total_cost', 'category', 'location', 'notes',
+)
+
+# Column mappings (field -> CSV header) for common tracker exports
+COLUMN_MAPPINGS = {
+    # TripTracker's own per-vehicle export
+    'triptrack': {
+        'event_type': 'Event Type',
+        'date': 'Date',
+        'reading': 'Miles/Hours',
+        'category': 'Category',
+        'location': 'Location',
+        'total_cost': 'Cost',
+        'notes': 'Notes',
+    },
+    'fuelly': {
+        'vehicle': 'car_name',
+        'date': 'fuelup_date',
+        'miles': 'odometer',
+        'gallons': 'gallons',
+        'price_per_gallon': 'price',
+        'notes': 'notes',
+    },
+}
+
+# Header aliases used when no mapping is given
+HEADER_ALIASES = {
+    'vehicle': ('vehicle', 'vehicle name', 'car', 'car_name', 'name'),
+    'event_type': ('event_type', 'event type', 'type'),
+    'date': ('date', 'fuelup_date', 'fill date', 'service date'),
+    'reading': ('reading', 'miles/hours', 'odometer', 'mileage', 'odo'),
+    'miles': ('miles',),
+    'hours': ('hours', 'engine hours'),
+    'gallons': ('gallons', 'volume', 'fuel', 'quantity'),
+    'price_per_gallon': ('price_per_gallon', 'price per gallon', 'price', 'unit price'),
+    'total_cost': ('total_cost', 'total cost', 'cost', 'total'),
+    'category': ('category', 'maintenance category', 'service'),
+    'location': ('location', 'station'),
+    'notes': ('notes', 'note', 'comments', 'description'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%d.%m.%Y', '%Y/%m/%d')
+
+DECIMAL_FIELDS = ('miles', 'hours', 'gallons', 'price_per_gallon', 'total_cost')
+
+
+class EventImportError(Exception):
+    """The file as a whole can't be imported (bad header, unknown mapping)"""
+
+
+class ImportResult:
+    """Counts plus the first ``max_report`` rejected and duplicate rows"""
+
+    def __init__(self, max_report=1000):
+        self.max_report = max_report
+        self.imported = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.rejects = []
+        self.duplicate_rows = []
+        self.vehicle_ids = set()
+
+    @property
+    def total(self):
+        return self.imported + self.rejected + self.duplicates
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < self.max_report:
+            self.rejects.append((line, reason))
+
+    def duplicate(self, line, reason):
+        self.duplicates += 1
+        if len(self.duplicate_rows) < self.max_report:
+            self.duplicate_rows.append((line, reason))
+
+
+class RowError(ValueError):
+    pass
+
+
+def resolve_mapping(header, mapping=None):
+    """
+    Return ``{field: column index}`` for a CSV header.
+
+    ``mapping`` is a preset name from COLUMN_MAPPINGS, a ``{field: column}``
+    dict, or None to match the header against HEADER_ALIASES.
+    """
+    normalized = [column.strip().lower() for column in header]
+
+    if isinstance(mapping, str):
+        if mapping not in COLUMN_MAPPINGS:
+            raise EventImportError(f"Unknown column mapping '{mapping}'")
+        mapping = COLUMN_MAPPINGS[mapping]
+
+    resolved = {}
+    if mapping:
+        for field, column in mapping.items():
+            if field not in IMPORT_FIELDS:
+                raise EventImportError(f"Unknown import field '{field}'")
+            try:
+                resolved[field] = normalized.index(column.strip().lower())
+            except ValueError:
+                raise EventImportError(f"Column '{column}' not found in the file header")
+    else:
+        for field, aliases in HEADER_ALIASES.items():
+            for alias in aliases:
+                if alias in normalized and normalized.index(alias) not in resolved.values():
+                    resolved[field] = normalized.index(alias)
+                    break
+
+    if 'date' not in resolved:
+        raise EventImportError("No date column found")
+    return resolved
+
+
+def parse_import_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f"Invalid date '{value}'")
+
+
+# (exponent, max_digits) per decimal field, so rows don't go through the
+# full model field validators
+_DECIMAL_LIMITS = {
+    name: (Decimal(1).scaleb(-field.decimal_places), field.max_digits)
+    for name, field in ((name, Event._meta.get_field(name)) for name in DECIMAL_FIELDS)
+}
+
+
+def parse_import_decimal(field_name, value):
+    """Parse a number like ``$1,234.50`` and check it fits the model field"""
+    exponent, max_digits = _DECIMAL_LIMITS[field_name]
+    try:
+        number = Decimal(value.replace('$', '').replace(',', '').strip()).quantize(exponent)
+    except InvalidOperation:
+        raise RowError(f"Invalid {field_name} '{value}'")
+    if number.is_nan():
+        raise RowError(f"Invalid {field_name} '{value}'")
+    if number < 0:
+        raise RowError(f"Negative {field_name} '{value}'")
+    if len(number.as_tuple().digits) > max_digits:
+        raise RowError(f"{field_name} '{value}' is out of range")
+    return number
+
+
+class EventImporter:
+    """
+    Import events from CSV rows into ``vehicles``.
+
+    ``vehicles`` are the vehicles rows may be imported into; rows are matched
+    to one by a ``vehicle`` column (vehicle name) unless ``vehicle`` is given,
+    in which case every row goes to it.
+    """
+
+    def __init__(self, user, vehicles, vehicle=None, mapping=None,
+                 default_event_type='gas', batch_size=1000, max_report=1000):
+        self.user = user
+        self.vehicle = vehicle
+        self.mapping = mapping
+        self.default_event_type = default_event_type
+        self.batch_size = batch_size
+        self.max_report = max_report
+
+        self.vehicles = {v.pk: v for v in vehicles}
+        if vehicle is not None:
+            self.vehicles[vehicle.pk] = vehicle
+        self.vehicles_by_name = {}
+        for v in self.vehicles.values():
+            self.vehicles_by_name.setdefault(v.name.strip().lower(), []).append(v)
+
+        self.event_types = {}
+        for key, label in Event.EVENT_TYPES:
+            self.event_types[key] = key
+            self.event_types[label.lower()] = key
+
+        self.categories = {
+            name.lower(): pk for pk, name in MaintenanceCategory.objects.values_list('id', 'name')
+        }
+        self.locations = {
+            (family_id, name.lower()): pk
+            for pk, family_id, name in Location.objects.filter(
+                family__in={v.family_id for v in self.vehicles.values()}
+            ).values_list('id', 'family_id', 'name')
+        }
+        # Duplicate keys of existing events, loaded per vehicle on first use
+        self.seen = {}
+
+    def run(self, lines, dry_run=False):
+        """
+        Import CSV ``lines`` (any iterable of strings, e.g. an open file).
+        With ``dry_run`` the rows are only validated.
+        """
+        reader = csv.reader(lines)
+        try:
+            header = next(reader)
+        except StopIteration:
+            raise EventImportError("The file is empty")
+        columns = resolve_mapping(header, self.mapping)
+        if self.vehicle is None and 'vehicle' not in columns:
+            raise EventImportError("Choose a vehicle or map a vehicle column")
+
+        result = ImportResult(self.max_report)
+        with transaction.atomic():
+            batch = []
+            for row in reader:
+                if not any(cell.strip() for cell in row):
+                    continue
+                line = reader.line_num
+                try:
+                    event = self.build_event(row, columns)
+                except RowError as e:
+                    result.reject(line, str(e))
+                    continue
+
+                key = self.duplicate_key(event)
+                seen = self.seen_keys(event.vehicle_id)
+                if key in seen:
+                    result.duplicate(line, f"{event.vehicle.name} {event.event_type} on {event.date}")
+                    continue
+                seen.add(key)
+
+                result.imported += 1
+                result.vehicle_ids.add(event.vehicle_id)
+                if not dry_run:
+                    batch.append(event)
+                    if len(batch) >= self.batch_size:
+                        Event.objects.bulk_create(batch)
+                        batch = []
+
+            if dry_run:
+                return result
+            if batch:
+                Event.objects.bulk_create(batch)
+            if result.vehicle_ids:
+                update_derived_data(result.vehicle_ids)
+
+        logger.info(
+            f"Imported {result.imported} events for {self.user} "
+            f"({result.duplicates} duplicates, {result.rejected} rejected)"
+        )
+        return result
+
+    def build_event(self, row, columns):
+        values = {}
+        for field, index in columns.items():
+            value = row[index].strip() if index < len(row) else ''
+            if value:
+                values[field] = value
+
+        vehicle = self.vehicle
+        if vehicle is None:
+            name = values.get('vehicle')
+            if not name:
+                raise RowError("Missing vehicle")
+            matches = self.vehicles_by_name.get(name.lower(), [])
+            if not matches:
+                raise RowError(f"Unknown vehicle '{name}'")
+            if len(matches) > 1:
+                raise RowError(f"Vehicle name '{name}' matches several vehicles")
+            vehicle = matches[0]
+
+        if 'date' not in values:
+            raise RowError("Missing date")
+        event_date = parse_import_date(values['date'])
+
+        event_type = self.default_event_type
+        if 'event_type' in values:
+            event_type = self.event_types.get(values['event_type'].lower())
+            if event_type is None:
+                raise RowError(f"Unknown event type '{values['event_type']}'")
+
+        numbers = {}
+        for field in DECIMAL_FIELDS:
+            if field in values:
+                numbers[field] = parse_import_decimal(field, values[field])
+        if 'reading' in values:
+            reading_field = vehicle.get_reading_field()
+            numbers.setdefault(reading_field, parse_import_decimal(reading_field, values['reading']))
+
+        if event_type == 'gas' and not numbers.get('gallons'):
+            raise RowError("Gas fill-up without gallons")
+
+        # Event.save() fills in the total; bulk_create doesn't call it
+        if numbers.get('gallons') and numbers.get('price_per_gallon') and not numbers.get('total_cost'):
+            numbers['total_cost'] = (numbers['gallons'] * numbers['price_per_gallon']).quantize(Decimal('0.01'))
+
+        notes = values.get('notes')
+        category_id = None
+        if 'category' in values and event_type == 'maintenance':
+            category_id = self.categories.get(values['category'].lower())
+            if category_id is None:
+                # Keep the original category text rather than losing it
+                notes = f"Category: {values['category']}" + (f"\n{notes}" if notes else '')
+
+        location_id = None
+        if 'location' in values:
+            location_id = self.locations.get((vehicle.family_id, values['location'].lower()))
+            if location_id is None:
+                notes = f"Location: {values['location']}" + (f"\n{notes}" if notes else '')
+
+        return Event(
+            vehicle=vehicle,
+            created_by=self.user,
+            event_type=event_type,
+            date=event_date,
+            notes=notes,
+            maintenance_category_id=category_id,
+            location_id=location_id,
+            **numbers,
+        )
+
+    @staticmethod
+    def duplicate_key(event):
+        return (event.event_type, event.date, event.miles, event.hours, event.gallons)
+
+    def seen_keys(self, vehicle_id):
+        if vehicle_id not in self.seen:
+            self.seen[vehicle_id] = set(
+                Event.objects.filter(vehicle_id=vehicle_id).values_list(
+                    'event_type', 'date', 'miles', 'hours', 'gallons'
+                )
+            )
+        return self.seen[vehicle_id]
+
+
+def update_derived_data(vehicle_ids):
+    """
+    Bring efficiency, current readings, maintenance schedules and their
+    forecasts, and search vectors up to date for ``vehicle_ids`` after events
+    were written without ``save()``.
+    """
+    vehicle_ids = sorted(vehicle_ids)
+    recompute_efficiency(vehicle_ids)
+
+    vehicles = list(Vehicle.objects.filter(pk__in=vehicle_ids))
+    for vehicle in vehicles:
+        vehicle.refresh_current_reading()
+
+    update_schedules(vehicle_ids)
+    update_forecasts(vehicle_ids)
+    rebuild_monthly_stats(vehicle_ids)
+    update_search_vectors(Event.objects.filter(vehicle_id__in=vehicle_ids, search_vector__isnull=True))
+
+    family_ids = {vehicle.family_id for vehicle in vehicles}
+    transaction.on_commit(lambda: bump_family_version(*family_ids))
+
+
+def update_schedules(vehicle_ids):
+    """Set each active schedule's ``last_*`` values from its latest matching event"""
+    schedules = list(MaintenanceSchedule.objects.filter(vehicle_id__in=vehicle_ids, is_active=True))
+    if not schedules:
+        return 0
+
+    latest = {}
+    events = Event.objects.filter(
+        vehicle_id__in=vehicle_ids,
+        event_type='maintenance',
+        maintenance_category_id__in={s.maintenance_type_id for s in schedules},
+    ).order_by('-date', '-id').values_list('vehicle_id', 'maintenance_category_id', 'date', 'miles', 'hours')
+    for vehicle_id, category_id, event_date, miles, hours in events.iterator():
+        latest.setdefault((vehicle_id, category_id), (event_date, miles, hours))
+
+    now = timezone.now()
+    changed = []
+    for schedule in schedules:
+        performed = latest.get((schedule.vehicle_id, schedule.maintenance_type_id))
+        if not performed:
+            continue
+        event_date, miles, hours = performed
+        if schedule.last_performed and schedule.last_performed > event_date:
+            continue
+        schedule.last_performed = event_date
+        if miles:
+            schedule.last_miles = int(miles)
+        if hours:
+            schedule.last_hours = int(hours)
+        schedule.updated_at = now
+        changed.append(schedule)
+
+    MaintenanceSchedule.objects.bulk_update(
+        changed, ['last_performed', 'last_miles', 'last_hours', 'updated_at']
+    )
+    return len(changed)
@@ -0,0 +1,72 @@
+"""
+Per-request SQL instrumentation.
+
+QueryRecorder hooks every database connection with an execute wrapper and
+records the number of queries, the time spent in them and how often each
+statement *shape* ran. A shape (fingerprint) is the SQL with literals and
+IN-lists collapsed, so the same lookup repeated once per row of a loop - the
+usual N+1 - shows up as one fingerprint with a high count.
+
+SQLInstrumentationMiddleware (tracker.middleware) uses it per request;
+tracker.querybudget uses it to hold URLs to a query budget.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Runs after _NUMBER, which has turned $1-style placeholders into $?
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\$?\?)(?:\s*,\s*(?:%s|\$?\?))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalise ``sql`` so statements differing only in values compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint_id(shape):
+    """Short stable id for a fingerprint, for log lines and headers"""
+    return hashlib.md5(shape.encode(), usedforsecurity=False).hexdigest()[:8]
+
+
+class QueryRecorder:
+    """Execute wrapper that counts and times queries by fingerprint"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def record(self):
+        """Record queries on every configured database while the block runs"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold):
+        """``[(fingerprint, count)]`` run more than ``threshold`` times, most first"""
+        return [(shape, count) for shape, count in self.fingerprints.most_common() if count > threshold]
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
@@ -0,0 +1,274 @@
+"""
+Event history consistency checks.
+
+Each vehicle's events are streamed in date order into compact NumPy columns
+(EventColumns) and checked for:
+
+    wrong_unit           a reading in the other unit's field (hours on a
+                         car, miles on a boat) - what migrate_gas_records
+                         fixed once for boats
+    reading_backwards    an odometer or hour meter reading below an earlier one
+    duplicate_fill_up    a fill-up with the date, reading and gallons of an
+                         earlier one
+    efficiency_mismatch  stored MPG / GPH that differs from what the previous
+                         fill-up gives, as tracker.efficiency computes it
+    future_date          an event dated after today
+
+check_vehicles() checks a batch of vehicles; the check_event_integrity
+command runs it in worker processes. fix_anomalies() repairs what needs no
+guessing - moving readings to the right field, deleting duplicate fill-ups
+and recomputing efficiency - and leaves the rest for a person.
+"""
+import logging
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .importer import update_derived_data
+from .models import Event, Vehicle
+
+logger = logging.getLogger('tracker')
+
+CHECKS = ('wrong_unit', 'reading_backwards', 'duplicate_fill_up', 'efficiency_mismatch', 'future_date')
+FIXABLE = {'wrong_unit', 'duplicate_fill_up', 'efficiency_mismatch'}
+
+FIELDS = ('vehicle_id', 'id', 'date', 'event_type', 'miles', 'hours', 'gallons', 'milespergallon', 'gallonsperhour')
+EVENT_TYPES = {event_type: code for code, (event_type, _) in enumerate(Event.EVENT_TYPES)}
+GAS = EVENT_TYPES['gas']
+# Efficiency is stored to 2 places; allow for rounding half-even vs. half-up
+EFFICIENCY_TOLERANCE = 0.011
+# Rows fetched per round trip while streaming events
+FETCH_SIZE = 5000
+
+
+class EventColumns:
+    """One vehicle's events as column arrays, in (date, id) order"""
+
+    def __init__(self, rows):
+        count = len(rows)
+        self.id = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+        self.date = np.array([row[2] for row in rows], dtype='datetime64[D]')
+        self.event_type = np.fromiter((EVENT_TYPES.get(row[3], -1) for row in rows), dtype=np.int8, count=count)
+        self.miles = _floats(rows, 4)
+        self.hours = _floats(rows, 5)
+        self.gallons = _floats(rows, 6)
+        self.mpg = _floats(rows, 7)
+        self.gph = _floats(rows, 8)
+
+    def __len__(self):
+        return len(self.id)
+
+
+def _floats(rows, index):
+    return np.fromiter(
+        (np.nan if row[index] is None else float(row[index]) for row in rows), dtype=float, count=len(rows)
+    )
+
+
+def _anomaly(check, vehicle, events, index, message, **extra):
+    return {
+        'check': check,
+        'vehicle_id': vehicle['id'],
+        'event_id': int(events.id[index]),
+        'date': str(events.date[index]),
+        'message': message,
+        'fixable': check in FIXABLE,
+        **extra,
+    }
+
+
+def check_wrong_unit(vehicle, events, today):
+    is_car = vehicle['type'] == 'car'
+    # Only when the right field is empty; an event may carry both
+    if is_car:
+        wrong = np.isnan(events.miles) & ~np.isnan(events.hours)
+    else:
+        wrong = np.isnan(events.hours) & ~np.isnan(events.miles)
+    return [
+        _anomaly('wrong_unit', vehicle, events, index,
+                 f"{'Hours' if is_car else 'Miles'} recorded on a {vehicle['type']}",
+                 value=float((events.hours if is_car else events.miles)[index]))
+        for index in np.flatnonzero(wrong)
+    ]
+
+
+def check_reading_backwards(vehicle, events, today):
+    readings = events.miles if vehicle['type'] == 'car' else events.hours
+    rows = np.flatnonzero(~np.isnan(readings))
+    if len(rows) < 2:
+        return []
+    values = readings[rows]
+    # Highest reading before each one
+    previous = np.maximum.accumulate(values)[:-1]
+    backwards = np.flatnonzero(values[1:] < previous) + 1
+    return [
+        _anomaly('reading_backwards', vehicle, events, rows[position],
+                 f"Reading {values[position]:,.1f} is below the earlier {previous[position - 1]:,.1f}",
+                 reading=float(values[position]), previous=float(previous[position - 1]))
+        for position in backwards
+    ]
+
+
+def check_duplicate_fill_up(vehicle, events, today):
+    rows = np.flatnonzero(events.event_type == GAS)
+    if len(rows) < 2:
+        return []
+    # NaN never equals NaN; compare missing values as a sentinel instead
+    keys = np.stack([
+        events.date[rows].astype(np.int64).astype(float),
+        np.nan_to_num(events.miles[rows], nan=-1.0),
+        np.nan_to_num(events.hours[rows], nan=-1.0),
+        np.nan_to_num(events.gallons[rows], nan=-1.0),
+    ], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Rows are in (date, id) order, so the first of each key is the original
+    duplicates = np.flatnonzero(first[inverse] != np.arange(len(rows)))
+    return [
+        _anomaly('duplicate_fill_up', vehicle, events, rows[position],
+                 f"Same fill-up as event {events.id[rows[first[inverse[position]]]]}",
+                 duplicate_of=int(events.id[rows[first[inverse[position]]]]))
+        for position in duplicates
+    ]
+
+
+def expected_efficiency(vehicle, events):
+    """
+    ``(stored, expected)`` efficiency of every event, NaN where there is
+    none, computed like tracker.efficiency's LAG() over the fill-ups that
+    have gallons and a reading.
+    """
+    is_car = vehicle['type'] == 'car'
+    readings = events.miles if is_car else events.hours
+    counted = np.flatnonzero((events.event_type == GAS) & (events.gallons > 0) & ~np.isnan(readings))
+
+    expected = np.full(len(events), np.nan)
+    if len(counted):
+        values = readings[counted]
+        # A car's first fill-up counts from the starting mileage
+        first = (vehicle['starting_mileage'] or 0) if is_car else np.nan
+        distance = values - np.r_[first, values[:-1]]
+        gallons = events.gallons[counted]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = np.round(distance / gallons if is_car else gallons / distance, 2)
+        expected[counted] = np.where(distance > 0, efficiency, np.nan)
+
+    stored = events.mpg if is_car else events.gph
+    return stored, expected
+
+
+def check_efficiency_mismatch(vehicle, events, today):
+    stored, expected = expected_efficiency(vehicle, events)
+    # The other unit's column should always be empty
+    other = events.gph if vehicle['type'] == 'car' else events.mpg
+    with np.errstate(invalid='ignore'):
+        matches = (np.isnan(stored) & np.isnan(expected)) | (np.abs(stored - expected) <= EFFICIENCY_TOLERANCE)
+    wrong = ~matches | ~np.isnan(other)
+    unit = 'MPG' if vehicle['type'] == 'car' else 'GPH'
+    return [
+        _anomaly('efficiency_mismatch', vehicle, events, index,
+                 f"Stored {unit} {_describe(stored[index])}, expected {_describe(expected[index])}",
+                 stored=_plain(stored[index]), expected=_plain(expected[index]))
+        for index in np.flatnonzero(wrong)
+    ]
+
+
+def check_future_date(vehicle, events, today):
+    return [
+        _anomaly('future_date', vehicle, events, index, "Dated in the future")
+        for index in np.flatnonzero(events.date > np.datetime64(today, 'D'))
+    ]
+
+
+def _plain(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _describe(value):
+    return 'none' if np.isnan(value) else f"{value:.2f}"
+
+
+CHECK_FUNCTIONS = {
+    'wrong_unit': check_wrong_unit,
+    'reading_backwards': check_reading_backwards,
+    'duplicate_fill_up': check_duplicate_fill_up,
+    'efficiency_mismatch': check_efficiency_mismatch,
+    'future_date': check_future_date,
+}
+
+
+def _stream(vehicle_ids):
+    # One vehicle's rows at a time from a single ordered query
+    events = Event.objects.filter(vehicle_id__in=vehicle_ids).order_by('vehicle_id', 'date', 'id')
+    rows = []
+    current = None
+    for row in events.values_list(*FIELDS).iterator(chunk_size=FETCH_SIZE):
+        if row[0] != current and rows:
+            yield current, EventColumns(rows)
+            rows = []
+        current = row[0]
+        rows.append(row)
+    if rows:
+        yield current, EventColumns(rows)
+
+
+def check_vehicles(vehicle_ids, checks=CHECKS, today=None):
+    """
+    Run ``checks`` over the events of ``vehicle_ids``. Returns
+    ``(events checked, anomalies)``, anomalies as JSON-ready dicts.
+    """
+    today = today or date.today()
+    vehicles = {
+        pk: {'id': pk, 'type': vehicle_type, 'starting_mileage': starting_mileage}
+        for pk, vehicle_type, starting_mileage in Vehicle.objects.filter(pk__in=vehicle_ids).values_list(
+            'id', 'type', 'starting_mileage'
+        )
+    }
+    scanned = 0
+    anomalies = []
+    for vehicle_id, events in _stream(list(vehicles)):
+        scanned += len(events)
+        for check in checks:
+            anomalies.extend(CHECK_FUNCTIONS[check](vehicles[vehicle_id], events, today))
+    return scanned, anomalies
+
+
+def fix_anomalies(anomalies, chunk_size=200):
+    """
+    Repair the fixable ``anomalies`` and bring the derived data of their
+    vehicles up to date. Returns ``{check: events fixed}``.
+    """
+    by_check = {}
+    for anomaly in anomalies:
+        if anomaly['fixable']:
+            by_check.setdefault(anomaly['check'], []).append(anomaly)
+    fixed = {}
+    vehicle_ids = sorted({anomaly['vehicle_id'] for found in by_check.values() for anomaly in found})
+    if not vehicle_ids:
+        return fixed
+
+    with transaction.atomic():
+        if 'wrong_unit' in by_check:
+            event_ids = [anomaly['event_id'] for anomaly in by_check['wrong_unit']]
+            # update() skips the signals; update_derived_data below covers them
+            fixed['wrong_unit'] = (
+                Event.objects.filter(pk__in=event_ids, vehicle__type='car', miles__isnull=True)
+                .update(miles=F('hours'), hours=None)
+                + Event.objects.filter(pk__in=event_ids, hours__isnull=True).exclude(vehicle__type='car')
+                .update(hours=F('miles'), miles=None)
+            )
+        if 'duplicate_fill_up' in by_check:
+            fixed['duplicate_fill_up'] = Event.objects.filter(
+                pk__in=[anomaly['event_id'] for anomaly in by_check['duplicate_fill_up']], event_type='gas'
+            ).delete()[1].get(Event._meta.label, 0)
+        if 'efficiency_mismatch' in by_check:
+            fixed['efficiency_mismatch'] = len(by_check['efficiency_mismatch'])
+
+        # Efficiency, readings, rollups and forecasts all follow the fixes
+        for start in range(0, len(vehicle_ids), chunk_size):
+            update_derived_data(vehicle_ids[start:start + chunk_size])
+
+    logger.info(f"Fixed event anomalies for {len(vehicle_ids)} vehicles: {fixed}")
+    return fixed
@@ -0,0 +1,237 @@
+"""
+Persistent background jobs.
+
+Jobs are rows in the Job table, so enqueueing inside a transaction only
+makes the job visible once that transaction commits, and nothing is lost if
+Redis or a worker restarts. Handlers are registered by name:
+
+    @job('vehicles.render_image')
+    def render_image(vehicle_id):
+        ...
+
+    enqueue('vehicles.render_image', vehicle_id=vehicle.pk, key=f'render_image:{vehicle.pk}')
+
+debounce() instead queues a keyed job to run a little later, pushing it back
+while more changes arrive, for work that should follow a burst of writes.
+
+The run_worker command claims jobs with SELECT ... FOR UPDATE SKIP LOCKED
+(a conditional UPDATE also guards backends without it, e.g. SQLite), so any
+number of worker processes can share the queue. A failing job is retried
+with exponential backoff until it has used max_attempts; jobs whose worker
+died are requeued once their lock is older than JOB_LOCK_TIMEOUT.
+Handlers return a JSON-serialisable result, stored on the job, and may
+report how far along they are with set_progress().
+"""
+import logging
+import random
+import traceback
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('tracker')
+
+REGISTRY = {}
+
+# Times to retry inserting a keyed job that races another process
+KEY_ATTEMPTS = 3
+
+# The job being run by this thread, for set_progress()
+_current_job = ContextVar('current_job', default=None)
+
+
+class JobSpec:
+    def __init__(self, name, func, max_attempts=None, priority=0):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+
+def job(name, max_attempts=None, priority=0):
+    """Register the decorated function as the handler for jobs called ``name``"""
+    def decorator(func):
+        REGISTRY[name] = JobSpec(name, func, max_attempts, priority)
+        func.job_name = name
+        return func
+    return decorator
+
+
+def _job_fields(name, key, run_at, priority, max_attempts, created_by, args):
+    spec = REGISTRY.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown job '{name}'")
+    return dict(
+        name=name,
+        args=args,
+        key=key,
+        run_at=run_at or timezone.now(),
+        priority=spec.priority if priority is None else priority,
+        max_attempts=max_attempts or spec.max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+        created_by=created_by,
+    )
+
+
+def enqueue(name, key='', run_at=None, priority=None, max_attempts=None, created_by=None, **args):
+    """
+    Queue a ``name`` job called with ``args``. When ``key`` is given and a
+    queued or running job already holds it, that job is returned instead.
+    """
+    fields = _job_fields(name, key, run_at, priority, max_attempts, created_by, args)
+    for attempt in range(KEY_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return Job.objects.create(**fields)
+        except IntegrityError:
+            if not key or attempt == KEY_ATTEMPTS - 1:
+                raise
+            existing = Job.objects.filter(key=key, status__in=Job.ACTIVE_STATUSES).first()
+            if existing is not None:
+                return existing
+            # The job holding the key finished in between; try again
+
+
+def debounce(name, key, delay, priority=None, max_attempts=None, created_by=None, **args):
+    """
+    Queue a ``name`` job to run ``delay`` from now, or push the queued job
+    holding ``key`` back to then. A running job may have read its data
+    before this call, so it doesn't count: a follow-up is queued under
+    ``<key>:next`` to run after it.
+    """
+    slots = (key, f"{key}:next")
+    for attempt in range(KEY_ATTEMPTS):
+        now = timezone.now()
+        held = {job.key: job for job in Job.objects.filter(key__in=slots, status__in=Job.ACTIVE_STATUSES)}
+        queued = [job for job in held.values() if job.status == 'queued']
+        if queued:
+            job = queued[0]
+            if Job.objects.filter(pk=job.pk, status='queued').update(run_at=now + delay, args=args,
+                                                                     updated_at=now):
+                job.run_at, job.args = now + delay, args
+                return job
+            # Claimed in between; look again
+            continue
+        free = [slot for slot in slots if slot not in held]
+        if not free:
+            break
+        fields = _job_fields(name, free[0], now + delay, priority, max_attempts, created_by, args)
+        try:
+            with transaction.atomic():
+                return Job.objects.create(**fields)
+        except IntegrityError:
+            # Another process queued it first; push that one back instead
+            continue
+    # Both keys are busy running; an unkeyed job still picks up this change
+    return enqueue(name, run_at=timezone.now() + delay, priority=priority, max_attempts=max_attempts,
+                   created_by=created_by, **args)
+
+
+def claim(worker_id, names=None):
+    """Lock and return the next due job, or None when there is nothing to run"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = Job.objects.filter(status='queued', run_at__lte=now)
+        if names:
+            jobs = jobs.filter(name__in=names)
+        candidate = jobs.order_by('-priority', 'run_at', 'id').select_for_update(skip_locked=True).first()
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(pk=candidate.pk, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, progress=0,
+            attempts=F('attempts') + 1, updated_at=now,
+        )
+    if not claimed:
+        return None
+    return Job.objects.get(pk=candidate.pk)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times"""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 30)
+    delay = min(base * 2 ** max(0, attempts - 1), getattr(settings, 'JOB_RETRY_MAX_DELAY', 60 * 60))
+    # Jitter so jobs that failed together don't all retry together
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run(job):
+    """Run a claimed job and record its outcome; returns True on success"""
+    spec = REGISTRY.get(job.name)
+    running = Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by)
+    token = _current_job.set(job)
+    try:
+        if spec is None:
+            raise LookupError(f"No handler registered for job '{job.name}'")
+        result = spec.func(**job.args)
+    except Exception as e:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if spec is not None and job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            running.update(status='queued', run_at=now + timedelta(seconds=delay), locked_by='',
+                           locked_at=None, error=error, updated_at=now)
+            logger.warning(f"Job {job} failed (attempt {job.attempts}/{job.max_attempts}), "
+                           f"retrying in {delay:.0f}s: {e}")
+        else:
+            running.update(status='failed', locked_by='', locked_at=None, error=error,
+                           finished_at=now, updated_at=now)
+            logger.error(f"Job {job} failed permanently after {job.attempts} attempts: {e}")
+        return False
+    finally:
+        _current_job.reset(token)
+
+    now = timezone.now()
+    running.update(status='succeeded', result=result, error='', locked_by='', locked_at=None,
+                   progress=100, finished_at=now, updated_at=now)
+    return True
+
+
+def current_job():
+    """The job this thread is running, or None outside a job"""
+    return _current_job.get()
+
+
+def set_progress(percent):
+    """Record how far the running job has got; does nothing outside a job"""
+    job = _current_job.get()
+    if job is None:
+        return
+    # Also renews the lock, so long jobs that report progress aren't
+    # mistaken for ones whose worker died
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        progress=max(0, min(100, int(percent))), locked_at=now, updated_at=now,
+    )
+
+
+def requeue_stale(timeout=None):
+    """Requeue (or fail) running jobs whose worker stopped renewing them; returns the count"""
+    if timeout is None:
+        timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', 15 * 60)
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - timedelta(seconds=timeout))
+    error = 'Worker stopped before the job finished'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', locked_at=None, error=error, finished_at=now, updated_at=now,
+    )
+    requeued = stale.update(status='queued', run_at=now, locked_by='', locked_at=None, error=error,
+                            updated_at=now)
+    if failed or requeued:
+        logger.warning(f"Recovered stale jobs: {requeued} requeued, {failed} failed")
+    return failed + requeued
+
+
+def purge_finished(days=None):
+    """Delete finished jobs older than ``days`` (JOB_RETENTION_DAYS); returns the count"""
+    if days is None:
+        days = getattr(settings, 'JOB_RETENTION_DAYS', 14)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(
+        status__in=('succeeded', 'failed', 'cancelled'), finished_at__lt=cutoff
+    ).delete()
+    return deleted
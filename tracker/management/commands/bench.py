@@ -0,0 +1,197 @@
+import json
+import math
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from tracker.instrumentation import QueryRecorder
+from tracker.models import Event, Vehicle
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Time the main views and APIs with the test client; report p50/p95 latency and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username to request pages as (e.g. fleet-0-0 from generate_fleet)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed requests per URL (default: 20)',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Untimed requests per URL first (default: 2)',
+        )
+        parser.add_argument(
+            '--only',
+            action='append',
+            default=[],
+            help='Only run benchmarks whose name contains this text (repeatable)',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file (e.g. to use as a baseline)',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Compare against results previously written with --output',
+        )
+        parser.add_argument(
+            '--fail-over',
+            type=float,
+            help='Exit with an error if any p50 is this many percent slower than the baseline, '
+                 'or any query count grew',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' not found")
+
+        baseline = None
+        if options.get('baseline'):
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+
+        client = self.make_client(user)
+        results = {}
+        for name, url in self.get_urls(user):
+            if options['only'] and not any(text in name for text in options['only']):
+                continue
+            results[name] = self.run(client, url, max(1, options['repeat']), max(0, options['warmup']))
+            self.report(name, results[name], baseline.get(name) if baseline else None)
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'user': user.username,
+                    'repeat': options['repeat'],
+                    'events': Event.objects.filter(vehicle__family__members=user).count(),
+                    'results': results,
+                }, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+        if baseline is not None and options.get('fail_over') is not None:
+            regressions = self.regressions(results, baseline, options['fail_over'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def make_client(self, user):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host and host != '*' and not host.startswith('.')]
+        # Report server errors as a 500 status rather than stopping the run
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost', raise_request_exception=False)
+        client.force_login(user)
+        return client
+
+    def get_urls(self, user):
+        vehicles = Vehicle.objects.filter(family__members=user)
+        # The vehicle with the most events is the interesting one to time
+        vehicle = max(vehicles, key=lambda v: v.events.count(), default=None)
+        event = Event.objects.filter(vehicle__family__members=user).order_by('-date', '-id').first()
+
+        urls = [
+            ('dashboard', reverse('dashboard')),
+            ('family_list', reverse('family_list')),
+            ('vehicle_list', reverse('vehicle_list')),
+            ('event_list', reverse('event_list')),
+            ('event_list_filtered', reverse('event_list') + '?type=gas&days=365'),
+            ('todo_list', reverse('todo_list')),
+            ('location_list', reverse('location_list')),
+            ('maintenance_schedule_list', reverse('maintenance_schedule_list')),
+            ('reports', reverse('reports')),
+            ('export_events', reverse('export_data', args=['events'])),
+            ('api_v1_vehicles', '/api/v1/vehicles/'),
+            ('api_v1_events', '/api/v1/events/'),
+            ('api_v1_schedules', '/api/v1/maintenance-schedules/'),
+        ]
+        if vehicle:
+            urls += [
+                ('vehicle_detail', reverse('vehicle_detail', args=[vehicle.pk])),
+                ('vehicle_report', reverse('vehicle_report', args=[vehicle.pk])),
+                ('api_charts', reverse('vehicle_charts_api', args=[vehicle.pk])),
+                ('api_mileage', reverse('vehicle_mileage_api', args=[vehicle.pk])),
+                ('api_events', reverse('vehicle_events_api', args=[vehicle.pk])),
+                ('api_vehicle_detail', reverse('vehicle_detail_api', args=[vehicle.pk])),
+            ]
+        if event:
+            urls.append(('event_detail', reverse('event_detail', args=[event.pk])))
+        return urls
+
+    def run(self, client, url, repeat, warmup):
+        for _ in range(warmup):
+            self.fetch(client, url)
+
+        timings = []
+        queries = []
+        status = None
+        for _ in range(repeat):
+            recorder = QueryRecorder()
+            started = time.perf_counter()
+            with recorder.record():
+                status = self.fetch(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(recorder.count)
+
+        return {
+            'url': url,
+            'status': status,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(queries),
+        }
+
+    def fetch(self, client, url):
+        response = client.get(url, secure=getattr(settings, 'SECURE_SSL_REDIRECT', False))
+        # Streamed responses (exports) do their work while being read
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    def report(self, name, result, previous):
+        line = (f"{name:<28} {result['status']}  p50 {result['p50_ms']:>9.2f}ms  "
+                f"p95 {result['p95_ms']:>9.2f}ms  {result['queries']:>4} queries")
+        if previous:
+            change = self.change(result['p50_ms'], previous['p50_ms'])
+            line += f"  (p50 {change:+.1f}%, queries {result['queries'] - previous['queries']:+d})"
+        style = self.style.WARNING if result['status'] != 200 else (lambda text: text)
+        self.stdout.write(style(line))
+
+    def change(self, current, previous):
+        if not previous:
+            return 0.0
+        return (current - previous) / previous * 100
+
+    def regressions(self, results, baseline, threshold):
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            change = self.change(result['p50_ms'], previous['p50_ms'])
+            if change > threshold:
+                regressions.append(f"  {name}: p50 {previous['p50_ms']}ms -> {result['p50_ms']}ms ({change:+.1f}%)")
+            if result['queries'] > previous['queries']:
+                regressions.append(f"  {name}: queries {previous['queries']} -> {result['queries']}")
+        return regressions
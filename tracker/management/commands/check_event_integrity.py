@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from tracker.integrity import CHECKS, check_vehicles, fix_anomalies
+from tracker.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = ("Check every vehicle's event history for backwards readings, duplicate fill-ups, readings in "
+            "the wrong unit, stale efficiency and future dates, in parallel worker processes")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only check a specific vehicle ID',
+        )
+        parser.add_argument(
+            '--family-id',
+            type=int,
+            help='Only check vehicles in a specific family ID',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Number of vehicles each worker checks at a time (default: 100)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes to check with; 1 checks in this process (default: CPU count)',
+        )
+        parser.add_argument(
+            '--check',
+            action='append',
+            choices=CHECKS,
+            help='Only run this check; repeat for more (default: all)',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Repair wrong units, duplicate fill-ups and stale efficiency',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('text', 'jsonl'),
+            default='text',
+            help='text for people, or jsonl: one anomaly per line and a final summary line (default: text)',
+        )
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.order_by('id')
+        if options.get('vehicle_id'):
+            vehicles = vehicles.filter(pk=options['vehicle_id'])
+        if options.get('family_id'):
+            vehicles = vehicles.filter(family_id=options['family_id'])
+
+        vehicle_ids = list(vehicles.values_list('id', flat=True))
+        checks = tuple(options['check'] or CHECKS)
+        chunk_size = max(1, options['chunk_size'])
+        chunks = [vehicle_ids[start:start + chunk_size] for start in range(0, len(vehicle_ids), chunk_size)]
+        jsonl = options['format'] == 'jsonl'
+
+        scanned = 0
+        anomalies = []
+        for chunk, (count, found) in self._run(chunks, checks, options['workers']):
+            scanned += count
+            anomalies.extend(found)
+            if jsonl:
+                for anomaly in found:
+                    self.stdout.write(json.dumps(anomaly))
+            else:
+                self.stdout.write(
+                    f'  Vehicles {chunk[0]}-{chunk[-1]} ({len(chunk)}): {count} events, {len(found)} anomalies'
+                )
+                for anomaly in found:
+                    self.stdout.write(
+                        f"    [{anomaly['check']}] vehicle {anomaly['vehicle_id']} event {anomaly['event_id']} "
+                        f"({anomaly['date']}): {anomaly['message']}"
+                    )
+
+        fixed = fix_anomalies(anomalies) if options['fix'] else {}
+        by_check = Counter(anomaly['check'] for anomaly in anomalies)
+
+        if jsonl:
+            self.stdout.write(json.dumps({'summary': {
+                'vehicles': len(vehicle_ids),
+                'events': scanned,
+                'anomalies': dict(by_check),
+                'fixed': fixed,
+            }}))
+            return
+
+        summary = f'Checked {scanned} events on {len(vehicle_ids)} vehicles'
+        if not anomalies:
+            self.stdout.write(self.style.SUCCESS(f'{summary}: no anomalies found.'))
+            return
+        counts = ', '.join(f'{by_check[check]} {check}' for check in checks if by_check[check])
+        self.stdout.write(self.style.WARNING(f'{summary}: {len(anomalies)} anomalies ({counts}).'))
+        if fixed:
+            self.stdout.write(self.style.SUCCESS(
+                'Fixed ' + ', '.join(f'{count} {check}' for check, count in fixed.items()) + '.'
+            ))
+        elif not options['fix'] and any(anomaly['fixable'] for anomaly in anomalies):
+            self.stdout.write('Run with --fix to repair the fixable ones.')
+
+    def _run(self, chunks, checks, workers):
+        """Yield ``(chunk, (events checked, anomalies))`` as each chunk finishes"""
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield chunk, check_vehicles(chunk, checks)
+            return
+
+        # Spawned workers set Django up fresh and open their own connections;
+        # forked ones would inherit this process's database socket
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context,
+                                 initializer=django.setup) as pool:
+            futures = {pool.submit(check_vehicles, chunk, checks): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from tracker.forecast import update_forecasts
+from tracker.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = ("Refit vehicles' usage rates and reproject their maintenance schedules' due dates, "
+            "a chunk of vehicles at a time")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only forecast a specific vehicle ID',
+        )
+        parser.add_argument(
+            '--family-id',
+            type=int,
+            help='Only forecast vehicles in a specific family ID',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of vehicles whose readings are fitted together (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.order_by('id')
+        if options.get('vehicle_id'):
+            vehicles = vehicles.filter(pk=options['vehicle_id'])
+        if options.get('family_id'):
+            vehicles = vehicles.filter(family_id=options['family_id'])
+
+        vehicle_ids = list(vehicles.values_list('id', flat=True))
+        if not vehicle_ids:
+            self.stdout.write(self.style.SUCCESS('No vehicles to forecast.'))
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        rates_total = 0
+        schedules_total = 0
+        for start in range(0, len(vehicle_ids), chunk_size):
+            chunk = vehicle_ids[start:start + chunk_size]
+            rates, schedules = update_forecasts(chunk)
+            rates_total += rates
+            schedules_total += schedules
+            self.stdout.write(
+                f'  Vehicles {chunk[0]}-{chunk[-1]} ({len(chunk)}): {rates} rates, {schedules} schedules changed'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast {len(vehicle_ids)} vehicles: {rates_total} usage rates and '
+            f'{schedules_total} schedule due dates changed.'
+        ))
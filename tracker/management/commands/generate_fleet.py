@@ -0,0 +1,344 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from tracker.importer import update_derived_data
+from tracker.models import (Event, Family, Location, MaintenanceCategory, MaintenanceSchedule,
+                            TodoItem, Vehicle)
+from tracker.search import update_search_vectors
+
+MAKES = {
+    'car': [('Toyota', 'Camry'), ('Honda', 'Civic'), ('Ford', 'F-150'), ('Subaru', 'Outback'), ('Tesla', 'Model 3')],
+    'boat': [('Sea Ray', 'SPX 190'), ('Boston Whaler', 'Montauk'), ('Bayliner', 'Element'), ('Yamaha', 'AR190')],
+    'other': [('Kubota', 'BX2380'), ('Polaris', 'Ranger'), ('John Deere', 'X350'), ('Honda', 'EU2200i')],
+}
+
+CATEGORIES = ['Oil Change', 'Tire Rotation', 'Brake Service', 'Air Filter Replacement', 'Battery Replacement']
+
+PLACES = ['Lake Harriet', 'Grand Marais', 'Duluth Harbor', 'Stillwater', 'Red Wing', 'Itasca State Park',
+          'Lake Minnetonka', 'Brainerd', 'Ely', 'Lutsen']
+
+# Share of events by type, and how far each vehicle type moves per day
+EVENT_MIX = [('gas', 0.6), ('outing', 0.25), ('maintenance', 0.15)]
+DAILY_USE = {'car': (25, 45), 'boat': (0.1, 0.6), 'other': (0.2, 1.0)}
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic fleet (users, families, vehicles, events, schedules, todos, locations) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--families',
+            type=int,
+            default=10,
+            help='Number of families to create (default: 10)',
+        )
+        parser.add_argument(
+            '--members',
+            type=int,
+            default=2,
+            help='Users per family (default: 2)',
+        )
+        parser.add_argument(
+            '--vehicles',
+            type=int,
+            default=3,
+            help='Vehicles per family, cycling through every vehicle type (default: 3)',
+        )
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=100000,
+            help='Total events spread across all vehicles (default: 100000)',
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=5,
+            help='Years of history ending today (default: 5)',
+        )
+        parser.add_argument(
+            '--locations',
+            type=int,
+            default=5,
+            help='Locations per family (default: 5)',
+        )
+        parser.add_argument(
+            '--todos',
+            type=int,
+            default=4,
+            help='Todo items per vehicle (default: 4)',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='fleet',
+            help='Username prefix for generated users (default: fleet)',
+        )
+        parser.add_argument(
+            '--password',
+            default='fleet-password',
+            help='Password for every generated user (default: fleet-password)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed, for repeatable data (default: 0)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk INSERT (default: 5000)',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete data previously generated with the same prefix first',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = max(1, options['batch_size'])
+        prefix = options['prefix']
+        started = time.perf_counter()
+
+        existing = User.objects.filter(username__startswith=f'{prefix}-')
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(
+                    f"Users named '{prefix}-*' already exist; use --clear to replace them or a different --prefix"
+                )
+            # Deleting the families first lets the event signal handlers skip
+            # per-event bookkeeping for the cascade
+            deleted, _ = Family.objects.filter(created_by__in=existing).delete()
+            deleted += existing.delete()[0]
+            self.stdout.write(self.style.WARNING(f'Deleted {deleted} rows from a previous run.'))
+
+        with transaction.atomic():
+            users, families = self.create_families(options)
+            categories = self.get_categories()
+            locations = self.create_locations(families, options['locations'])
+            vehicles = self.create_vehicles(families, options['vehicles'], options['years'])
+        self.stdout.write(
+            f'  {len(users)} users, {len(families)} families, {len(vehicles)} vehicles, {len(locations)} locations'
+        )
+
+        members = {family.pk: [user for user in users if user.family_index == index]
+                   for index, family in enumerate(families)}
+        locations_by_family = {}
+        for location in locations:
+            locations_by_family.setdefault(location.family_id, []).append(location)
+
+        event_count = self.create_events(vehicles, members, categories, locations_by_family, options)
+        schedule_count = self.create_schedules(vehicles, members, categories)
+        todo_count = self.create_todos(vehicles, members, options['todos'])
+
+        # Events were bulk inserted, so bring efficiency, readings, schedules
+        # and monthly stats up to date the way the importer does
+        vehicle_ids = [vehicle.pk for vehicle in vehicles]
+        for start in range(0, len(vehicle_ids), 200):
+            with transaction.atomic():
+                update_derived_data(vehicle_ids[start:start + 200])
+        # Todos and locations were bulk inserted too
+        update_search_vectors(TodoItem.objects.filter(created_by__in=users))
+        update_search_vectors(Location.objects.filter(family__in=families))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {event_count} events, {schedule_count} schedules and {todo_count} todos '
+            f'in {elapsed:.1f}s. Log in as {users[0].username} / {options["password"]}'
+        ))
+
+    def create_families(self, options):
+        password = make_password(options['password'])
+        per_family = max(1, options['members'])
+        users = []
+        for family_index in range(options['families']):
+            for member in range(per_family):
+                user = User(
+                    username=f"{options['prefix']}-{family_index}-{member}",
+                    email=f"{options['prefix']}-{family_index}-{member}@example.com",
+                    password=password,
+                )
+                user.family_index = family_index
+                users.append(user)
+        created = User.objects.bulk_create(users, batch_size=self.batch_size)
+
+        # The first member of each family creates it
+        families = Family.objects.bulk_create(
+            [Family(name=f"{options['prefix'].title()} Family {creator.family_index + 1}", created_by=creator)
+             for creator in created[::per_family]],
+            batch_size=self.batch_size,
+        )
+        Membership = Family.members.through
+        Membership.objects.bulk_create(
+            [Membership(family_id=families[user.family_index].pk, user_id=user.pk) for user in created],
+            batch_size=self.batch_size,
+        )
+        return created, families
+
+    def get_categories(self):
+        categories = list(MaintenanceCategory.objects.filter(name__in=CATEGORIES))
+        missing = set(CATEGORIES) - {category.name for category in categories}
+        if missing:
+            categories += MaintenanceCategory.objects.bulk_create(
+                [MaintenanceCategory(name=name) for name in sorted(missing)]
+            )
+        return categories
+
+    def create_locations(self, families, per_family):
+        locations = []
+        for family in families:
+            for index in range(per_family):
+                place = PLACES[index % len(PLACES)]
+                locations.append(Location(
+                    name=place if index < len(PLACES) else f'{place} {index // len(PLACES) + 1}',
+                    family=family,
+                    created_by_id=family.created_by_id,
+                    latitude=Decimal(str(round(self.rng.uniform(43.5, 49.0), 6))),
+                    longitude=Decimal(str(round(self.rng.uniform(-97.0, -89.5), 6))),
+                ))
+                # bulk_create skips save()
+                locations[-1].refresh_geohash()
+        return Location.objects.bulk_create(locations, batch_size=self.batch_size)
+
+    def create_vehicles(self, families, per_family, years):
+        types = [value for value, _ in Vehicle.TYPE_CHOICES]
+        this_year = date.today().year
+        vehicles = []
+        for family in families:
+            for index in range(per_family):
+                vehicle_type = types[index % len(types)]
+                make, model = self.rng.choice(MAKES.get(vehicle_type, MAKES['other']))
+                vehicles.append(Vehicle(
+                    family=family,
+                    name=f'{make} {model}',
+                    make=make,
+                    model=model,
+                    year=self.rng.randint(this_year - years - 10, this_year - years),
+                    type=vehicle_type,
+                    starting_mileage=self.rng.randint(0, 60000) if vehicle_type == 'car' else None,
+                ))
+        return Vehicle.objects.bulk_create(vehicles, batch_size=self.batch_size)
+
+    def create_events(self, vehicles, members, categories, locations_by_family, options):
+        if not vehicles:
+            return 0
+        end = date.today()
+        start = end - timedelta(days=365 * options['years'])
+        days = (end - start).days
+        per_vehicle, extra = divmod(options['events'], len(vehicles))
+        event_types = [event_type for event_type, _ in EVENT_MIX]
+        weights = [weight for _, weight in EVENT_MIX]
+
+        batch = []
+        created = 0
+        for index, vehicle in enumerate(vehicles):
+            count = per_vehicle + (1 if index < extra else 0)
+            users = members[vehicle.family_id]
+            locations = locations_by_family.get(vehicle.family_id) or [None]
+            low, high = DAILY_USE.get(vehicle.type, DAILY_USE['other'])
+            reading = float(vehicle.starting_mileage or 0)
+            previous_day = 0
+
+            for offset in sorted(self.rng.randrange(days) for _ in range(count)):
+                reading += (offset - previous_day) * self.rng.uniform(low, high)
+                previous_day = offset
+                event_type = self.rng.choices(event_types, weights)[0]
+                event = Event(
+                    vehicle_id=vehicle.pk,
+                    created_by_id=self.rng.choice(users).pk,
+                    event_type=event_type,
+                    date=start + timedelta(days=offset),
+                )
+                if vehicle.type == 'car':
+                    event.miles = Decimal(f'{reading:.1f}')
+                else:
+                    event.hours = Decimal(f'{reading:.2f}')
+
+                if event_type == 'gas':
+                    gallons = self.rng.uniform(6, 18) if vehicle.type == 'car' else self.rng.uniform(10, 40)
+                    event.gallons = Decimal(f'{gallons:.3f}')
+                    event.price_per_gallon = Decimal(f'{self.rng.uniform(2.8, 5.2):.3f}')
+                    event.total_cost = (event.gallons * event.price_per_gallon).quantize(Decimal('0.01'))
+                    if self.rng.random() < 0.7:
+                        event.location = self.rng.choice(locations)
+                elif event_type == 'maintenance':
+                    event.maintenance_category = self.rng.choice(categories)
+                    event.total_cost = Decimal(f'{self.rng.uniform(30, 900):.2f}')
+                else:
+                    event.location = self.rng.choice(locations)
+                    if self.rng.random() < 0.3:
+                        event.total_cost = Decimal(f'{self.rng.uniform(5, 150):.2f}')
+                    if self.rng.random() < 0.2:
+                        event.notes = f'Trip to {event.location.name}' if event.location else 'Trip'
+                batch.append(event)
+
+                if len(batch) >= self.batch_size:
+                    created += self.flush_events(batch)
+                    batch = []
+
+            if (index + 1) % 50 == 0:
+                self.stdout.write(f'  {index + 1}/{len(vehicles)} vehicles, {created + len(batch)} events')
+
+        if batch:
+            created += self.flush_events(batch)
+        return created
+
+    def flush_events(self, batch):
+        Event.objects.bulk_create(batch, batch_size=self.batch_size)
+        return len(batch)
+
+    def create_schedules(self, vehicles, members, categories):
+        schedules = []
+        for vehicle in vehicles:
+            for category in self.rng.sample(categories, min(2, len(categories))):
+                schedule = MaintenanceSchedule(
+                    vehicle_id=vehicle.pk,
+                    maintenance_type=category,
+                    name=f'{category.name} ({vehicle.name})',
+                    created_by_id=members[vehicle.family_id][0].pk,
+                    interval_days=self.rng.choice([90, 180, 365]),
+                )
+                if vehicle.type == 'car':
+                    schedule.interval_miles = self.rng.choice([3000, 5000, 7500])
+                else:
+                    schedule.interval_hours = self.rng.choice([50, 100, 200])
+                schedules.append(schedule)
+        MaintenanceSchedule.objects.bulk_create(schedules, batch_size=self.batch_size)
+        return len(schedules)
+
+    def create_todos(self, vehicles, members, per_vehicle):
+        todos = []
+        shared = []
+        today = date.today()
+        for vehicle in vehicles:
+            users = members[vehicle.family_id]
+            for index in range(per_vehicle):
+                creator = self.rng.choice(users)
+                todo = TodoItem(
+                    created_by_id=creator.pk,
+                    vehicle_id=vehicle.pk if index % 3 else None,
+                    title=self.rng.choice(['Wash', 'Check tire pressure', 'Renew registration',
+                                           'Replace wipers', 'Winterize', 'Detail interior']),
+                    completed=self.rng.random() < 0.4,
+                    due_date=today + timedelta(days=self.rng.randint(-60, 120)),
+                )
+                todos.append(todo)
+                others = [user for user in users if user.pk != creator.pk]
+                shared.append(others[:1] if others and self.rng.random() < 0.5 else [])
+
+        created = TodoItem.objects.bulk_create(todos, batch_size=self.batch_size)
+        Share = TodoItem.shared_with.through
+        Share.objects.bulk_create(
+            [Share(todoitem_id=todo.pk, user_id=user.pk)
+             for todo, users in zip(created, shared) for user in users],
+            batch_size=self.batch_size,
+        )
+        return len(created)
@@ -0,0 +1,129 @@
+import csv
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from tracker.importer import COLUMN_MAPPINGS, IMPORT_FIELDS, EventImporter, EventImportError
+from tracker.models import Event, Family, Vehicle
+
+
+class Command(BaseCommand):
+    help = 'Import gas fill-ups, maintenance and outings from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the CSV file to import')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username recorded as the creator of the imported events',
+        )
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Import every row into this vehicle ID',
+        )
+        parser.add_argument(
+            '--family-id',
+            type=int,
+            help='Match rows to vehicles of this family ID by the vehicle name column',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(COLUMN_MAPPINGS),
+            help='Column mapping of a known export format (default: detect from the header)',
+        )
+        parser.add_argument(
+            '--map',
+            action='append',
+            default=[],
+            metavar='FIELD=COLUMN',
+            help=f'Map a CSV column to an event field; repeatable. Fields: {", ".join(IMPORT_FIELDS)}',
+        )
+        parser.add_argument(
+            '--event-type',
+            choices=[key for key, label in Event.EVENT_TYPES],
+            default='gas',
+            help='Event type for rows without an event type column (default: gas)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of events inserted per INSERT statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write rejected and duplicate rows to this CSV file',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the file without importing anything',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        vehicle = None
+        if options.get('vehicle_id'):
+            try:
+                vehicle = Vehicle.objects.get(pk=options['vehicle_id'])
+            except Vehicle.DoesNotExist:
+                raise CommandError(f"Vehicle {options['vehicle_id']} does not exist")
+            vehicles = [vehicle]
+        elif options.get('family_id'):
+            if not Family.objects.filter(pk=options['family_id']).exists():
+                raise CommandError(f"Family {options['family_id']} does not exist")
+            vehicles = Vehicle.objects.filter(family_id=options['family_id'])
+        else:
+            raise CommandError('Pass --vehicle-id or --family-id')
+
+        mapping = options.get('format')
+        if options['map']:
+            mapping = {}
+            for item in options['map']:
+                field, sep, column = item.partition('=')
+                if not sep:
+                    raise CommandError(f"Invalid --map '{item}', expected FIELD=COLUMN")
+                mapping[field.strip()] = column
+
+        importer = EventImporter(
+            user, vehicles, vehicle=vehicle, mapping=mapping,
+            default_event_type=options['event_type'],
+            batch_size=max(1, options['batch_size']),
+        )
+
+        started = time.monotonic()
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+                result = importer.run(f, dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(f"Can't read {options['csv_file']}: {e}")
+        except EventImportError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line, reason in result.rejects[:20]:
+            self.stdout.write(f'  - Line {line}: {reason}')
+        if result.rejected > 20:
+            self.stdout.write(f'  ... and {result.rejected - 20} more rejected rows')
+
+        if options.get('report'):
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Line', 'Status', 'Reason'])
+                writer.writerows((line, 'rejected', reason) for line, reason in result.rejects)
+                writer.writerows((line, 'duplicate', reason) for line, reason in result.duplicate_rows)
+            self.stdout.write(f'Report written to {options["report"]}')
+
+        summary = (
+            f'{result.total} rows: {result.imported} imported, {result.duplicates} duplicates, '
+            f'{result.rejected} rejected in {elapsed:.1f}s'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run mode - no changes made. {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from tracker.images import has_image, process_vehicle_image
+from tracker.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = ('Render thumbnail, card and full size WebP/JPEG copies of pending vehicle images now '
+            '(run_worker normally does this in the background)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only process a specific vehicle ID',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-render every vehicle image, not just pending ones (e.g. after changing the sizes)',
+        )
+        parser.add_argument(
+            '--failed',
+            action='store_true',
+            help='Retry images whose rendering failed',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Pending images looked up per query (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        if options['all'] or options.get('vehicle_id'):
+            vehicles = Vehicle.objects.filter(has_image())
+            if options.get('vehicle_id'):
+                vehicles = vehicles.filter(pk=options['vehicle_id'])
+            queued = vehicles.update(image_status='pending')
+            self.stdout.write(f'Marked {queued} images for rendering')
+        elif options['failed']:
+            queued = Vehicle.objects.filter(image_status='failed').update(image_status='pending')
+            self.stdout.write(f'Marked {queued} failed images for rendering')
+
+        pending = Vehicle.objects.filter(image_status='pending').order_by('updated_at')
+        if options.get('vehicle_id'):
+            pending = pending.filter(pk=options['vehicle_id'])
+
+        batch_size = max(1, options['batch_size'])
+        total = 0
+        while True:
+            vehicle_ids = list(pending.values_list('id', flat=True)[:batch_size])
+            for vehicle_id in vehicle_ids:
+                if process_vehicle_image(vehicle_id):
+                    total += 1
+                    self.stdout.write(f'  Vehicle {vehicle_id}: rendered')
+                else:
+                    self.stdout.write(self.style.WARNING(f'  Vehicle {vehicle_id}: skipped or failed'))
+
+            if len(vehicle_ids) < batch_size:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {total} vehicle images.'))
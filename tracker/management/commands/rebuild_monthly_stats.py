@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from tracker.models import Vehicle
+from tracker.rollups import rebuild_monthly_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-vehicle monthly stats rollup from events, a chunk of vehicles at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only rebuild a specific vehicle ID',
+        )
+        parser.add_argument(
+            '--family-id',
+            type=int,
+            help='Only rebuild vehicles in a specific family ID',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Number of vehicles aggregated per query (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.order_by('id')
+        if options.get('vehicle_id'):
+            vehicles = vehicles.filter(pk=options['vehicle_id'])
+        if options.get('family_id'):
+            vehicles = vehicles.filter(family_id=options['family_id'])
+
+        vehicle_ids = list(vehicles.values_list('id', flat=True))
+        if not vehicle_ids:
+            self.stdout.write(self.style.SUCCESS('No vehicles to rebuild.'))
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        rows_total = 0
+        for start in range(0, len(vehicle_ids), chunk_size):
+            chunk = vehicle_ids[start:start + chunk_size]
+            rows = rebuild_monthly_stats(chunk)
+            rows_total += rows
+            self.stdout.write(
+                f'  Vehicles {chunk[0]}-{chunk[-1]} ({len(chunk)}): {rows} months'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt monthly stats for {len(vehicle_ids)} vehicles: {rows_total} months.'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from tracker.models import Event, Location, TodoItem
+from tracker.search import is_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search vectors of events, todos and locations, a chunk of rows at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Only rows without a search vector (e.g. after a bulk load)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of rows updated per query (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING('Full-text search needs PostgreSQL; nothing to rebuild.'))
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        for model in (Event, TodoItem, Location):
+            rows = model.objects.order_by('id')
+            if options['missing']:
+                rows = rows.filter(search_vector__isnull=True)
+            ids = list(rows.values_list('id', flat=True))
+            updated = 0
+            for start in range(0, len(ids), chunk_size):
+                updated += update_search_vectors(model.objects.filter(pk__in=ids[start:start + chunk_size]))
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {updated} rows')
+
+        self.stdout.write(self.style.SUCCESS('Rebuilt search vectors.'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from tracker.efficiency import recompute_efficiency
+from tracker.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = 'Recompute MPG / gallons per hour for every gas fill-up, a chunk of vehicles at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only recompute a specific vehicle ID',
+        )
+        parser.add_argument(
+            '--family-id',
+            type=int,
+            help='Only recompute vehicles in a specific family ID',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Number of vehicles recomputed per UPDATE statement (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.order_by('id')
+        if options.get('vehicle_id'):
+            vehicles = vehicles.filter(pk=options['vehicle_id'])
+        if options.get('family_id'):
+            vehicles = vehicles.filter(family_id=options['family_id'])
+
+        vehicle_ids = list(vehicles.values_list('id', flat=True))
+        if not vehicle_ids:
+            self.stdout.write(self.style.SUCCESS('No vehicles to recompute.'))
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        changed_total = 0
+        for start in range(0, len(vehicle_ids), chunk_size):
+            chunk = vehicle_ids[start:start + chunk_size]
+            changed = recompute_efficiency(chunk)
+            changed_total += changed
+            self.stdout.write(
+                f'  Vehicles {chunk[0]}-{chunk[-1]} ({len(chunk)}): {changed} fill-ups changed'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed efficiency for {len(vehicle_ids)} vehicles: {changed_total} fill-ups changed.'
+        ))
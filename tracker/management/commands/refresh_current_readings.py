@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from tracker.models import Event, Vehicle
+
+
+class Command(BaseCommand):
+    help = 'Backfill or verify the denormalized current mileage/hours reading on vehicles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report vehicles whose stored reading is out of date',
+        )
+        parser.add_argument(
+            '--vehicle-id',
+            type=int,
+            help='Only process a specific vehicle ID',
+        )
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        vehicle_id = options.get('vehicle_id')
+
+        vehicles = Vehicle.objects.all()
+        if vehicle_id:
+            vehicles = vehicles.filter(pk=vehicle_id)
+
+        mismatched = []
+        checked = 0
+        # One annotated query per reading unit instead of one query per vehicle
+        for field, type_filter in (('miles', {'type': 'car'}), ('hours', {})):
+            latest = Event.objects.filter(
+                vehicle=OuterRef('pk'),
+                **{f'{field}__isnull': False}
+            ).order_by('-date', '-id')
+
+            queryset = vehicles.filter(**type_filter) if type_filter else vehicles.exclude(type='car')
+            queryset = queryset.annotate(
+                latest_event_id=Subquery(latest.values('id')[:1]),
+                latest_date=Subquery(latest.values('date')[:1]),
+                latest_reading=Subquery(latest.values(field)[:1]),
+            )
+
+            for vehicle in queryset.iterator(chunk_size=500):
+                checked += 1
+                if (vehicle.current_reading_event_id != vehicle.latest_event_id
+                        or vehicle.current_reading_date != vehicle.latest_date
+                        or vehicle.current_reading != vehicle.latest_reading):
+                    vehicle.current_reading = vehicle.latest_reading
+                    vehicle.current_reading_date = vehicle.latest_date
+                    vehicle.current_reading_event_id = vehicle.latest_event_id
+                    mismatched.append(vehicle)
+
+        for vehicle in mismatched:
+            self.stdout.write(
+                f'  - Vehicle {vehicle.id}: {vehicle.name} ({vehicle.type}) '
+                f'-> {vehicle.current_reading} on {vehicle.current_reading_date}'
+            )
+
+        if verify:
+            if mismatched:
+                self.stdout.write(self.style.WARNING(
+                    f'{len(mismatched)} of {checked} vehicles have an out of date reading.'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'All {checked} vehicle readings are up to date.'))
+            return
+
+        Vehicle.objects.bulk_update(
+            mismatched,
+            ['current_reading', 'current_reading_date', 'current_reading_event'],
+            batch_size=500,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {len(mismatched)} of {checked} vehicle readings.'
+        ))
@@ -0,0 +1,88 @@
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tracker import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs; start several to work the queue in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            action='append',
+            default=[],
+            help='Only run jobs with this name (repeatable)',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no jobs are due instead of waiting for more',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=getattr(settings, 'JOB_POLL_INTERVAL', 2),
+            help='Seconds to wait between polls when the queue is empty (default: JOB_POLL_INTERVAL)',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            help='Exit after running this many jobs (e.g. to recycle the process)',
+        )
+        parser.add_argument(
+            '--worker-id',
+            default=f'{socket.gethostname()}:{os.getpid()}',
+            help='Name recorded on claimed jobs (default: host:pid)',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker_id = options['worker_id']
+        names = options['only'] or None
+        unknown = [name for name in names or () if name not in jobs.REGISTRY]
+        if unknown:
+            self.stdout.write(self.style.WARNING(f"No handler registered for: {', '.join(unknown)}"))
+        self.stdout.write(f"Worker {worker_id} running {', '.join(names or sorted(jobs.REGISTRY))}")
+
+        ran = failed = 0
+        last_sweep = 0
+        while not self.stopping:
+            close_old_connections()
+            # Recover jobs from dead workers and drop old history now and then
+            if time.monotonic() - last_sweep > 60:
+                jobs.requeue_stale()
+                jobs.purge_finished()
+                last_sweep = time.monotonic()
+
+            job = jobs.claim(worker_id, names)
+            if job is None:
+                if options['burst']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            started = time.perf_counter()
+            ok = jobs.run(job)
+            ran += 1
+            failed += not ok
+            elapsed = (time.perf_counter() - started) * 1000
+            style = self.style.SUCCESS if ok else self.style.WARNING
+            self.stdout.write(style(f"  {job.name} #{job.pk}: {'ok' if ok else 'failed'} in {elapsed:.0f}ms"))
+
+            if options.get('max_jobs') and ran >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker_id} stopped after {ran} jobs ({failed} failed)."))
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
@@ -0,0 +1,200 @@
+"""
+Request middleware.
+
+Every middleware here is both sync and async capable, so async views keep
+running on the event loop when served over ASGI.
+
+AccessContextMiddleware attaches the user's AccessContext as ``request.access``
+(and ``request.aaccess()`` for async views).
+
+StaticFilesMiddleware is WhiteNoise with an async code path.
+
+SQLInstrumentationMiddleware is opt-in (SQL_INSTRUMENTATION = True). Each
+request gets a Server-Timing header with its SQL time, query count and total
+time, and one structured (JSON) log line on the ``tracker.sql`` logger.
+Statement shapes repeated more than SQL_N_PLUS_ONE_THRESHOLD times are logged
+as likely N+1 queries at WARNING level.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .access import aget_access, get_access
+from .instrumentation import QueryRecorder, fingerprint_id
+
+logger = logging.getLogger('tracker.sql')
+
+
+class HybridMiddleware:
+    """Base for middleware that calls ``__acall__`` when the next handler is async"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class AccessContextMiddleware(HybridMiddleware):
+    """Attach a lazily built ``request.access``; must follow AuthenticationMiddleware"""
+
+    def __call__(self, request):
+        self.attach(request)
+        return super().__call__(request)
+
+    def attach(self, request):
+        request.access = SimpleLazyObject(lambda: get_access(request.user))
+
+        async def aaccess():
+            return await aget_access(await request.auser())
+
+        request.aaccess = aaccess
+
+
+class StaticFilesMiddleware(HybridMiddleware, WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware (6.x is sync only) that doesn't force every request
+    under ASGI through a thread. Static file lookups are in memory outside
+    DEBUG (WHITENOISE_AUTOREFRESH off), so they are safe on the event loop.
+    """
+
+    def __init__(self, get_response):
+        WhiteNoiseMiddleware.__init__(self, get_response)
+        HybridMiddleware.__init__(self, get_response)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return WhiteNoiseMiddleware.__call__(self, request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class SQLInstrumentationMiddleware(HybridMiddleware):
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.threshold = getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        recording = ExitStack()
+        recording.enter_context(recorder.record())
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            recording.close()
+            raise
+
+        if response.streaming:
+            return self._stream(request, response, recording, recorder, started)
+
+        recording.close()
+        self._add_header(response, recorder, started)
+        self._log(request, response, recorder, started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        recording = ExitStack()
+        # Connections are per thread and the async ORM queries from a worker
+        # thread, so install and remove the execute wrappers in that thread
+        await sync_to_async(recording.enter_context)(recorder.record())
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(recording.close)()
+            raise
+
+        if response.streaming:
+            return self._stream(request, response, recording, recorder, started)
+
+        await sync_to_async(recording.close)()
+        self._add_header(response, recorder, started)
+        self._log(request, response, recorder, started)
+        return response
+
+    def _stream(self, request, response, recording, recorder, started):
+        # Streamed bodies (CSV exports) query while they are sent, so keep
+        # recording until the last chunk. Headers are already gone by then;
+        # only the log line has the full numbers.
+        finish = self._afinish_streaming if response.is_async else self._finish_streaming
+        response.streaming_content = finish(
+            response.streaming_content, recording, recorder, request, response, started
+        )
+        self._add_header(response, recorder, started, partial=True)
+        return response
+
+    def _finish_streaming(self, content, recording, recorder, request, response, started):
+        try:
+            yield from content
+        finally:
+            recording.close()
+            self._log(request, response, recorder, started, streamed=True)
+
+    async def _afinish_streaming(self, content, recording, recorder, request, response, started):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            await sync_to_async(recording.close)()
+            self._log(request, response, recorder, started, streamed=True)
+
+    def _add_header(self, response, recorder, started, partial=False):
+        total_ms = round((time.perf_counter() - started) * 1000, 2)
+        queries = f"{recorder.count} queries" + (' before streaming' if partial else '')
+        metrics = [
+            f'sql;dur={recorder.duration_ms};desc="{queries}"',
+            f'app;dur={total_ms}',
+        ]
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            metrics.append(f'nplusone;desc="{len(repeated)} repeated statements"')
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([existing] if existing else []) + metrics)
+
+    def _log(self, request, response, recorder, started, streamed=False):
+        repeated = recorder.repeated(self.threshold)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': getattr(getattr(request, 'resolver_match', None), 'view_name', None),
+            'queries': recorder.count,
+            'sql_ms': recorder.duration_ms,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+            'streamed': streamed,
+            'repeated': [
+                {'fingerprint': fingerprint_id(shape), 'count': count, 'sql': shape[:300]}
+                for shape, count in repeated
+            ],
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
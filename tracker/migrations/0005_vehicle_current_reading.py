@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 18:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_current_reading(apps, schema_editor):
+    Vehicle = apps.get_model('tracker', 'Vehicle')
+    Event = apps.get_model('tracker', 'Event')
+
+    for field, vehicles in (('miles', Vehicle.objects.filter(type='car')),
+                            ('hours', Vehicle.objects.exclude(type='car'))):
+        latest = Event.objects.filter(
+            vehicle=OuterRef('pk'),
+            **{f'{field}__isnull': False}
+        ).order_by('-date', '-id')
+        vehicles.update(
+            current_reading=Subquery(latest.values(field)[:1]),
+            current_reading_date=Subquery(latest.values('date')[:1]),
+            current_reading_event=Subquery(latest.values('id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_add_gallonsperhour_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='current_reading',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='current_reading_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='current_reading_event',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tracker.event'),
+        ),
+        migrations.RunPython(backfill_current_reading, migrations.RunPython.noop),
+    ]
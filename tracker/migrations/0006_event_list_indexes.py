@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 18:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_vehicle_current_reading'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='tracker_eve_vehicle_839455_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['vehicle', 'date', 'id'], name='tracker_eve_vehicle_8cb43e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['vehicle', 'event_type', 'date', 'id'], name='tracker_eve_vehicle_4b91e1_idx'),
+        ),
+    ]
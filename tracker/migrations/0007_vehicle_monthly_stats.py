@@ -0,0 +1,98 @@
+# Generated by Django 5.2 on 2026-10-18 18:41
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, When, Q, F, Sum, Count, Max, Min
+from django.db.models.functions import TruncMonth
+
+
+def backfill_monthly_stats(apps, schema_editor):
+    # Same rollup as tracker.rollups.rebuild_monthly_stats, on the
+    # historical models
+    Vehicle = apps.get_model('tracker', 'Vehicle')
+    Event = apps.get_model('tracker', 'Event')
+    VehicleMonthlyStats = apps.get_model('tracker', 'VehicleMonthlyStats')
+
+    is_car = Q(vehicle__type='car')
+    decimal = models.DecimalField(max_digits=10, decimal_places=2)
+    reading = Case(When(is_car, then=F('miles')), default=F('hours'), output_field=decimal)
+    efficiency = Case(When(is_car, then=F('milespergallon')), default=F('gallonsperhour'), output_field=decimal)
+    gas, maintenance, outing = Q(event_type='gas'), Q(event_type='maintenance'), Q(event_type='outing')
+
+    vehicles = Vehicle.objects.in_bulk()
+    months = Event.objects.annotate(period=TruncMonth('date')).order_by().values('vehicle_id', 'period').annotate(
+        gas_count=Count('id', filter=gas),
+        maintenance_count=Count('id', filter=maintenance),
+        outing_count=Count('id', filter=outing),
+        gas_cost=Sum('total_cost', filter=gas),
+        maintenance_cost=Sum('total_cost', filter=maintenance),
+        outing_cost=Sum('total_cost', filter=outing),
+        gallons=Sum('gallons', filter=gas),
+        efficiency_total=Sum(efficiency, filter=gas),
+        efficiency_count=Count(efficiency, filter=gas),
+        start_reading=Min(reading),
+        end_reading=Max(reading),
+    ).order_by('vehicle_id', 'period')
+
+    rows = []
+    previous = {}
+    for values in months.iterator():
+        vehicle = vehicles[values['vehicle_id']]
+        distance = Decimal('0')
+        if values['end_reading'] is not None:
+            start = previous.get(vehicle.pk)
+            if start is None and vehicle.type == 'car' and vehicle.starting_mileage is not None:
+                start = Decimal(vehicle.starting_mileage)
+            if start is None:
+                start = values['start_reading']
+            distance = max(values['end_reading'] - start, Decimal('0'))
+            previous[vehicle.pk] = values['end_reading']
+        rows.append(VehicleMonthlyStats(
+            vehicle_id=vehicle.pk,
+            month=values['period'],
+            distance=distance,
+            end_reading=values['end_reading'],
+            **{field: values[field] or 0 for field in (
+                'gas_count', 'maintenance_count', 'outing_count', 'gas_cost', 'maintenance_cost',
+                'outing_cost', 'gallons', 'efficiency_total', 'efficiency_count',
+            )},
+        ))
+    VehicleMonthlyStats.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_event_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('gas_count', models.PositiveIntegerField(default=0)),
+                ('maintenance_count', models.PositiveIntegerField(default=0)),
+                ('outing_count', models.PositiveIntegerField(default=0)),
+                ('gas_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('maintenance_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('outing_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('gallons', models.DecimalField(decimal_places=3, default=0, max_digits=12)),
+                ('distance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('end_reading', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('efficiency_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('efficiency_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='tracker.vehicle')),
+            ],
+            options={
+                'verbose_name_plural': 'Vehicle monthly stats',
+                'ordering': ['vehicle', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'month'), name='unique_vehicle_month_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_monthly_stats, migrations.RunPython.noop),
+    ]
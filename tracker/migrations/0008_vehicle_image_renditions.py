@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def queue_existing_images(apps, schema_editor):
+    # Existing uploads were resized inline; have the worker render them
+    Vehicle = apps.get_model('tracker', 'Vehicle')
+    Vehicle.objects.filter(~Q(image='') & Q(image__isnull=False)).update(image_status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_vehicle_monthly_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('', 'No image'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='vehicle_images/'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 19:13
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def queue_pending_images(apps, schema_editor):
+    # Images marked pending for the old polling command now need a job
+    Vehicle = apps.get_model('tracker', 'Vehicle')
+    Job = apps.get_model('tracker', 'Job')
+    Job.objects.bulk_create(
+        Job(name='vehicles.render_image', args={'vehicle_id': vehicle_id})
+        for vehicle_id in Vehicle.objects.filter(image_status='pending').values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_vehicle_image_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Registered job name', max_length=100)),
+                ('args', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('key', models.CharField(blank=True, default='', max_length=200)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=10)),
+                ('priority', models.SmallIntegerField(default=0, help_text='Higher runs first')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['-priority', 'run_at', 'id'], name='job_queued_idx'), models.Index(condition=models.Q(('status', 'running')), fields=['locked_at'], name='job_running_idx'), models.Index(fields=['status', 'finished_at'], name='job_finished_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running']), models.Q(('key', ''), _negated=True)), fields=('key',), name='unique_active_job_key')],
+            },
+        ),
+        migrations.RunPython(queue_pending_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+from tracker.geo import encode
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('tracker', 'Location')
+    locations = list(Location.objects.filter(latitude__isnull=False, longitude__isnull=False))
+    for location in locations:
+        location.geohash = encode(location.latitude, location.longitude)
+    Location.objects.bulk_update(locations, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_vehicle_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
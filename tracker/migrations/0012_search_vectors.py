@@ -0,0 +1,77 @@
+# Generated by Django 5.2 on 2026-10-18 19:26
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# (index, table) pairs; GIN indexes only exist on PostgreSQL, so they're
+# created here rather than declared in the models' Meta
+SEARCH_INDEXES = (
+    ('tracker_event_search_idx', 'tracker_event'),
+    ('tracker_todoitem_search_idx', 'tracker_todoitem'),
+    ('tracker_location_search_idx', 'tracker_location'),
+)
+
+
+def _vector(*weighted):
+    vector = None
+    for source, weight in weighted:
+        part = SearchVector(source, weight=weight, config='english')
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Event = apps.get_model('tracker', 'Event')
+    TodoItem = apps.get_model('tracker', 'TodoItem')
+    Location = apps.get_model('tracker', 'Location')
+    MaintenanceCategory = apps.get_model('tracker', 'MaintenanceCategory')
+
+    category = Subquery(
+        MaintenanceCategory.objects.filter(pk=OuterRef('maintenance_category_id')).values('name')[:1]
+    )
+    Event.objects.update(search_vector=_vector((category, 'A'), ('notes', 'B')))
+    TodoItem.objects.update(search_vector=_vector(('title', 'A'), ('description', 'B')))
+    Location.objects.update(search_vector=_vector(('name', 'A'), ('address', 'B')))
+
+    quote = schema_editor.quote_name
+    for index, table in SEARCH_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(index)} ON {quote(table)} USING gin ({quote('search_vector')})"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index, _ in SEARCH_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(index)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_location_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='todoitem',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
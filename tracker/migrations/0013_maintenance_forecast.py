@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maintenanceschedule',
+            name='forecast_basis',
+            field=models.CharField(blank=True, choices=[('days', 'Days'), ('miles', 'Miles'), ('hours', 'Hours')], default='', editable=False, max_length=5),
+        ),
+        migrations.AddField(
+            model_name='maintenanceschedule',
+            name='forecast_due_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='usage_rate',
+            field=models.DecimalField(blank=True, decimal_places=3, editable=False, max_digits=10, null=True),
+        ),
+    ]
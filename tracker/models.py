@@ -1,11 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, When, Q, F, Value, ExpressionWrapper
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
-from imagekit.models import ProcessedImageField
-from imagekit.processors import ResizeToFill
 import logging
 
+from .geo import encode as geohash_encode
+
 logger = logging.getLogger(__name__)
 
 class Family(models.Model):
@@ -38,33 +42,126 @@ class Vehicle(models.Model):
     starting_mileage = models.PositiveIntegerField(null=True, blank=True)
     model = models.CharField(max_length=100)
     type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='car')
-    image = ProcessedImageField(
+    IMAGE_STATUS_CHOICES = [
+        ('', 'No image'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
+    # The upload is stored as-is; a background job renders the sized
+    # WebP/JPEG copies listed in image_renditions (see tracker.images)
+    image = models.ImageField(
         upload_to='vehicle_images/',
-        processors=[ResizeToFill(800, 600)],
-        format='JPEG',
-        options={'quality': 85},
         null=True, 
         blank=True
     )
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default='', blank=True,
+                                    editable=False)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Denormalized latest odometer/hour-meter reading, maintained from the
+    # vehicle's events (see refresh_current_reading)
+    current_reading = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True,
+                                          editable=False)
+    current_reading_date = models.DateField(null=True, blank=True, editable=False)
+    current_reading_event = models.ForeignKey('Event', on_delete=models.SET_NULL, null=True, blank=True,
+                                              related_name='+', editable=False)
+    # Miles or hours a day over the recent readings, fitted by
+    # tracker.forecast; None until there are enough of them
+    usage_rate = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.year} {self.make} {self.model} ({self.name})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so save() can tell what derived data is stale
+        instance._loaded_values = {
+            field: instance.__dict__.get(field) for field in ('type', 'starting_mileage', 'family_id')
+        }
+        if 'image' in instance.__dict__:
+            instance._loaded_values['image'] = instance.__dict__['image'] or ''
+        return instance
+    
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_values', {})
+        type_changed = self.pk and 'type' in loaded and loaded['type'] != self.type
+        # Switching between miles and hours changes which readings count
+        if type_changed:
+            self.refresh_current_reading(save=False)
+        # A new or cleared upload invalidates the renditions; the worker picks
+        # up pending images
+        image_name = self.image.name or ''
+        image_changed = loaded.get('image', image_name if self.pk else '') != image_name
+        stale_renditions = None
+        if image_changed:
+            stale_renditions = self.image_renditions
+            self.image_status = 'pending' if image_name else ''
+            self.image_renditions = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'image_status', 'image_renditions'}
+        super().save(*args, **kwargs)
+        if image_changed and image_name:
+            from .jobs import enqueue
+            # The stored name, which saving may have changed from the upload's
+            enqueue('vehicles.render_image', vehicle_id=self.pk, image=self.image.name)
+        if stale_renditions:
+            from .images import delete_renditions
+            transaction.on_commit(lambda: delete_renditions(stale_renditions))
+        
+        # Efficiency depends on the unit and, for the first fill-up, the
+        # starting mileage
+        if loaded and (type_changed or loaded['starting_mileage'] != self.starting_mileage):
+            from .efficiency import recompute_vehicle_efficiency
+            from .rollups import rebuild_monthly_stats
+            recompute_vehicle_efficiency(self)
+            rebuild_monthly_stats([self.pk])
+        self._loaded_values = {'type': self.type, 'starting_mileage': self.starting_mileage,
+                               'family_id': self.family_id, 'image': self.image.name or ''}
+    
     def get_unit(self):
         return "miles" if self.type == 'car' else "hours"
     
+    def get_reading_field(self):
+        """Event field holding this vehicle's odometer or hour-meter reading"""
+        return 'miles' if self.type == 'car' else 'hours'
+    
     def get_latest_miles_or_hours(self):
-        latest_event = self.events.order_by('-date').first()
-        if not latest_event:
-            return 0
-            
-        if self.type == 'car' and latest_event.miles:
-            return latest_event.miles
-        elif self.type != 'car' and latest_event.hours:
-            return latest_event.hours
-        return 0
+        return self.current_reading or 0
+    
+    def refresh_current_reading(self, save=True):
+        """
+        Recompute the current reading from the most recent event that has one.
+        Ties on date go to the most recently created event.
+        """
+        field = self.get_reading_field()
+        latest = self.events.filter(
+            **{f'{field}__isnull': False}
+        ).order_by('-date', '-id').values_list('id', 'date', field).first()
+        
+        if latest:
+            event_id, reading_date, reading = latest
+        else:
+            event_id, reading_date, reading = None, None, None
+        
+        self.current_reading = reading
+        self.current_reading_date = reading_date
+        self.current_reading_event_id = event_id
+        
+        if save and self.pk:
+            # Touch updated_at too: conditional GETs use it to notice events
+            # being deleted
+            Vehicle.objects.filter(pk=self.pk).update(
+                current_reading=reading,
+                current_reading_date=reading_date,
+                current_reading_event_id=event_id,
+                updated_at=timezone.now(),
+            )
+        return reading
 
 class Location(models.Model):
     name = models.CharField(max_length=100)
@@ -76,9 +173,27 @@ class Location(models.Model):
     # Keep created_by for tracking who created it
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_locations')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Grid cell of the coordinates for nearby lookups (see tracker.geo);
+    # blank when they aren't set
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_index=True)
+    # Maintained by tracker.search; GIN indexed on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
     
     def __str__(self):
         return self.name
+    
+    def refresh_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+    
+    def save(self, *args, **kwargs):
+        self.refresh_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
 class MaintenanceCategory(models.Model):
     name = models.CharField(max_length=100)
@@ -128,61 +243,32 @@ class Event(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by tracker.search; GIN indexed on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
     
     def __str__(self):
         return f"{self.get_event_type_display()} - {self.vehicle} - {self.date}"
 
+    # Fields whose loaded values signal handlers compare against, e.g. to
+    # refresh the vehicle an event was moved away from
+    TRACKED_FIELDS = ('vehicle_id', 'event_type', 'date', 'miles', 'hours', 'gallons', 'total_cost')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: instance.__dict__.get(field) for field in cls.TRACKED_FIELDS
+        }
+        return instance
+
     def save(self, *args, **kwargs):
         # Calculate total cost if gallons and price_per_gallon are provided
         if self.gallons and self.price_per_gallon and not self.total_cost:
             self.total_cost = self.gallons * self.price_per_gallon
         
-        # Calculate MPG for gas fill-ups (cars) or gallons per hour (boats/other)
-        if self.event_type == 'gas' and self.gallons and self.gallons > 0:
-            if self.vehicle.type == 'car' and self.miles:
-                # Calculate MPG for cars
-                prev_event = Event.objects.filter(
-                    vehicle=self.vehicle,
-                    event_type='gas',
-                    date__lt=self.date  # Events before this one
-                ).order_by('-date').first()
-                
-                # Calculate distance driven
-                if prev_event and prev_event.miles:
-                    # Miles driven since last fill-up
-                    miles_driven = self.miles - prev_event.miles
-                else:
-                    # If no previous gas event, use starting_mileage if available
-                    if self.vehicle.starting_mileage:
-                        miles_driven = self.miles - self.vehicle.starting_mileage
-                    else:
-                        # Fallback to current miles value if we can't calculate difference
-                        miles_driven = self.miles
-                
-                # Calculate MPG
-                if miles_driven > 0:
-                    self.milespergallon = round(miles_driven / self.gallons, 2)
-                    
-            elif self.vehicle.type != 'car' and self.hours:
-                # Calculate gallons per hour for boats/other vehicles
-                prev_event = Event.objects.filter(
-                    vehicle=self.vehicle,
-                    event_type='gas',
-                    date__lt=self.date  # Events before this one
-                ).order_by('-date').first()
-                
-                # Calculate hours run
-                if prev_event and prev_event.hours:
-                    # Hours run since last fill-up
-                    hours_run = self.hours - prev_event.hours
-                else:
-                    # If no previous gas event, we can't calculate consumption rate
-                    # For first fill-up on hour-based vehicles, we need at least two data points
-                    hours_run = 0
-                
-                # Calculate gallons per hour
-                if hours_run > 0:
-                    self.gallonsperhour = round(self.gallons / hours_run, 2)
+        # MPG / gallons per hour depend on neighbouring fill-ups, so they are
+        # recomputed for the vehicle's affected history after the save
+        # (see tracker.efficiency and tracker.signals)
         
         # Check for maintenance schedules to mark as completed
         if self.event_type == 'maintenance' and self.maintenance_category:
@@ -238,7 +324,8 @@ class Event(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['vehicle', 'date']),
+            models.Index(fields=['vehicle', 'date', 'id']),
+            models.Index(fields=['vehicle', 'event_type', 'date', 'id']),
             models.Index(fields=['event_type']),
             models.Index(fields=['created_by', 'date']),  # Changed from user to created_by
         ]
@@ -255,6 +342,8 @@ class TodoItem(models.Model):
     due_date = models.DateField(null=True, blank=True)
     priority = models.IntegerField(default=0)  # 0=normal, 1=medium, 2=high
     shared_with = models.ManyToManyField(User, related_name='shared_todos', blank=True)
+    # Maintained by tracker.search; GIN indexed on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['completed', '-priority', 'due_date', 'created_at']
@@ -267,6 +356,85 @@ class TodoItem(models.Model):
         return self.title
 
 
+class DaysSince(models.Func):
+    """Whole days from a date column to a fixed date (``date - column``)"""
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, today, **extra):
+        super().__init__(Value(today, output_field=models.DateField()), expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: date - date is an integer number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)',
+                              arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+class MaintenanceScheduleQuerySet(models.QuerySet):
+    def with_due_status(self, today=None):
+        """
+        Annotate each schedule with how far it is from coming due, in one query.
+
+        ``days_until_due``, ``miles_until_due`` and ``hours_until_due`` are the
+        remaining interval (negative when overdue) or None when that interval
+        doesn't apply or there is no reading yet. ``due_now`` mirrors ``is_due()``.
+        """
+        from datetime import date
+
+        today = today or date.today()
+        current_reading = F('vehicle__current_reading')
+        decimal = models.DecimalField(max_digits=12, decimal_places=2)
+
+        return self.annotate(
+            days_until_due=Case(
+                When(interval_days__gt=0, last_performed__isnull=False,
+                     then=F('interval_days') - DaysSince(F('last_performed'), today)),
+                default=None,
+                output_field=models.IntegerField(),
+            ),
+            miles_until_due=Case(
+                When(vehicle__type='car', vehicle__current_reading__isnull=False,
+                     interval_miles__gt=0, last_miles__gt=0,
+                     then=ExpressionWrapper(
+                         F('interval_miles') - (current_reading - F('last_miles')),
+                         output_field=decimal)),
+                default=None,
+                output_field=decimal,
+            ),
+            hours_until_due=Case(
+                When(~Q(vehicle__type='car'), vehicle__current_reading__isnull=False,
+                     interval_hours__gt=0, last_hours__gt=0,
+                     then=ExpressionWrapper(
+                         F('interval_hours') - (current_reading - F('last_hours')),
+                         output_field=decimal)),
+                default=None,
+                output_field=decimal,
+            ),
+        ).annotate(
+            due_now=Case(
+                When(last_performed__isnull=True, then=Value(True)),
+                When(days_until_due__lte=0, then=Value(True)),
+                When(miles_until_due__lte=0, then=Value(True)),
+                When(hours_until_due__lte=0, then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+
+    def due(self, today=None):
+        """Active schedules that are due, with the due status annotations"""
+        return self.filter(is_active=True).with_due_status(today).filter(due_now=True)
+
+
 class MaintenanceSchedule(models.Model):
     """Model for scheduling recurring maintenance"""
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='maintenance_schedules')
@@ -292,13 +460,75 @@ class MaintenanceSchedule(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # When the first interval is projected to run out at the vehicle's usage
+    # rate, and which one it is (see tracker.forecast)
+    FORECAST_BASIS_CHOICES = [
+        ('days', 'Days'),
+        ('miles', 'Miles'),
+        ('hours', 'Hours'),
+    ]
+    forecast_due_date = models.DateField(null=True, blank=True, editable=False)
+    forecast_basis = models.CharField(max_length=5, choices=FORECAST_BASIS_CHOICES, blank=True, default='',
+                                      editable=False)
+    
+    objects = MaintenanceScheduleQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.name} - {self.vehicle}"
     
+    def save(self, *args, **kwargs):
+        # Intervals or the last service may have changed; project again from
+        # the vehicle's stored usage rate when it is already loaded, otherwise
+        # leave it to the forecast job rather than fetch it on every save
+        from .forecast import project, queue_forecast
+        vehicle_loaded = MaintenanceSchedule.vehicle.is_cached(self)
+        if vehicle_loaded:
+            self.forecast_due_date, self.forecast_basis = project(self, self.vehicle)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'forecast_due_date', 'forecast_basis'}
+        super().save(*args, **kwargs)
+        if not vehicle_loaded:
+            queue_forecast(self.vehicle_id)
+    
+    def get_forecast_display(self):
+        """E.g. "Due around Mar 14, 2027 (miles)", or '' without a forecast"""
+        from datetime import date
+        
+        due = self.forecast_due_date
+        if not due:
+            return ''
+        verb = 'Was due around' if due < date.today() else 'Due around'
+        return f"{verb} {due:%b} {due.day}, {due.year} ({self.get_forecast_basis_display().lower()})"
+    
+    def get_due_details(self):
+        """
+        Describe how far each interval is from coming due, e.g. "Due in 300
+        miles" or "Overdue by 4 days". Needs with_due_status() annotations.
+        """
+        details = []
+        for remaining, unit, fmt in (
+            (getattr(self, 'miles_until_due', None), 'miles', '{:,.0f}'),
+            (getattr(self, 'hours_until_due', None), 'hours', '{:,.1f}'),
+            (getattr(self, 'days_until_due', None), 'days', '{}'),
+        ):
+            if remaining is None:
+                continue
+            if remaining < 0:
+                details.append(f"Overdue by {fmt.format(abs(remaining))} {unit}")
+            elif remaining == 0:
+                details.append(f"Due now ({unit})")
+            else:
+                details.append(f"Due in {fmt.format(remaining)} {unit}")
+        return details
+    
     def is_due(self):
         """Check if maintenance is due based on miles, hours, or days"""
         from datetime import date, timedelta
         
+        # Use the with_due_status() annotation when the row came from it
+        if hasattr(self, 'due_now'):
+            return self.due_now
+        
         # If no last performance data, it's due
         if not self.last_performed:
             return True
@@ -321,4 +551,135 @@ class MaintenanceSchedule(models.Model):
             if current_hours - self.last_hours >= self.interval_hours:
                 return True
                 
-        return False
\ No newline at end of file
+        return False
+
+class VehicleMonthlyStats(models.Model):
+    """
+    Per-vehicle monthly rollup of events, kept up to date on event writes
+    (see tracker.rollups) so reports don't aggregate raw events.
+    """
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='monthly_stats')
+    month = models.DateField(help_text="First day of the month")
+    
+    gas_count = models.PositiveIntegerField(default=0)
+    maintenance_count = models.PositiveIntegerField(default=0)
+    outing_count = models.PositiveIntegerField(default=0)
+    
+    gas_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    maintenance_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outing_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    gallons = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    
+    # Miles for cars, hours for boats/other
+    distance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    end_reading = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    
+    # MPG for cars, gallons per hour otherwise; kept as a sum and count so
+    # quarters and years can be averaged over fill-ups
+    efficiency_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    efficiency_count = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Vehicle monthly stats"
+        ordering = ['vehicle', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'month'], name='unique_vehicle_month_stats'),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle.name} - {self.month:%Y-%m}"
+    
+    @property
+    def total_cost(self):
+        return self.gas_cost + self.maintenance_cost + self.outing_cost
+    
+    @property
+    def avg_efficiency(self):
+        if self.efficiency_count:
+            return round(self.efficiency_total / self.efficiency_count, 2)
+        return None
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the run_worker command (see
+    tracker.jobs). Finished jobs keep their result or error until purged.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    name = models.CharField(max_length=100, help_text="Registered job name")
+    args = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # Only one queued or running job may hold a given key
+    key = models.CharField(max_length=200, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    run_at = models.DateTimeField(default=timezone.now)
+    
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Percent done, reported by handlers through jobs.set_progress()
+    progress = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default='')
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's claim query, and its stale lock sweep
+            models.Index(fields=['-priority', 'run_at', 'id'], name='job_queued_idx',
+                         condition=Q(status='queued')),
+            models.Index(fields=['locked_at'], name='job_running_idx', condition=Q(status='running')),
+            models.Index(fields=['status', 'finished_at'], name='job_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], name='unique_active_job_key',
+                                    condition=Q(status__in=['queued', 'running']) & ~Q(key='')),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+    
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+
+class VehicleReport(models.Model):
+    """
+    A built vehicle report for one date range (see tracker.reports). Only
+    valid while the vehicle's data is still at ``data_version``.
+    """
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='reports')
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    # Latest change to the vehicle or its events when the report was built
+    data_version = models.DateTimeField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['vehicle', 'start_date', 'end_date', 'data_version'],
+                         name='vehicle_report_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle.name} report {self.start_date or '...'} - {self.end_date or '...'}"
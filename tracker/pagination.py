@@ -0,0 +1,78 @@
+"""
+Keyset (seek) pagination over ``(date, id)``.
+
+Pages are addressed by the position of the first or last row shown rather
+than by an offset, so fetching page N costs the same indexed range scan as
+page 1 and no COUNT(*) is needed.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+
+def encode_cursor(obj):
+    return f"{obj.date.isoformat()}.{obj.pk}"
+
+
+def decode_cursor(value):
+    """Return ``(date, id)`` for a cursor string, or None if it is invalid"""
+    if not value:
+        return None
+    try:
+        date_part, id_part = value.split('.', 1)
+        return date.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """One page of newest-first rows plus the cursors of its neighbours"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.has_previous and self.object_list else None
+
+
+def keyset_paginate(queryset, page_size, after=None, before=None):
+    """
+    Return a KeysetPage of ``queryset`` ordered newest first by (date, id).
+
+    ``after`` returns the rows that follow that cursor (older rows),
+    ``before`` the rows that precede it (newer rows). Each page reads at most
+    ``page_size + 1`` rows; the extra row only tells whether more exist.
+    Going back, whether older rows exist takes one more EXISTS query.
+    """
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+
+    if before:
+        cursor_date, cursor_id = before
+        rows = list(queryset.filter(
+            Q(date__gt=cursor_date) | Q(date=cursor_date, id__gt=cursor_id)
+        ).order_by('date', 'id')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        # Usually the cursor row itself, unless it was deleted since
+        has_next = bool(rows) and queryset.filter(
+            Q(date__lt=rows[-1].date) | Q(date=rows[-1].date, id__lt=rows[-1].pk)
+        ).exists()
+        return KeysetPage(rows, has_next=has_next, has_previous=has_previous)
+
+    if after:
+        cursor_date, cursor_id = after
+        queryset = queryset.filter(
+            Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id)
+        )
+    rows = list(queryset.order_by('-date', '-id')[:page_size + 1])
+    has_next = len(rows) > page_size
+    return KeysetPage(rows[:page_size], has_next=has_next, has_previous=after is not None)
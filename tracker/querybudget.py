@@ -0,0 +1,73 @@
+"""
+Query budgets for tests.
+
+Hold a block of code, or a set of URLs, to a maximum number of queries so an
+N+1 regression fails loudly with the offending statements listed:
+
+    with query_budget(6):
+        client.get('/vehicles/')
+
+    assert_url_budgets(client, {
+        reverse('dashboard'): 12,
+        reverse('vehicle_list'): 6,
+    })
+"""
+from contextlib import contextmanager
+
+from .instrumentation import QueryRecorder
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _describe(recorder, limit=5):
+    lines = [f"  {count}x {shape[:200]}" for shape, count in recorder.fingerprints.most_common(limit)]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None, label='block'):
+    """
+    Fail if the block runs more than ``max_queries`` queries, or (when
+    ``max_repeats`` is given) any one statement shape more than that many times.
+    """
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+
+    if recorder.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label} ran {recorder.count} queries, budget is {max_queries}. "
+            f"Most frequent:\n{_describe(recorder)}"
+        )
+    if max_repeats is not None:
+        repeated = recorder.repeated(max_repeats)
+        if repeated:
+            shape, count = repeated[0]
+            raise QueryBudgetExceeded(
+                f"{label} ran one statement {count} times (limit {max_repeats}), "
+                f"likely an N+1:\n  {shape[:300]}"
+            )
+
+
+def assert_url_budgets(client, budgets, max_repeats=None):
+    """
+    GET every URL in ``budgets`` (``{url: max_queries}``) with ``client`` and
+    fail listing every URL that is over budget or doesn't return 200.
+    """
+    failures = []
+    for url, max_queries in budgets.items():
+        try:
+            with query_budget(max_queries, max_repeats=max_repeats, label=url):
+                response = client.get(url)
+                # Streamed responses query while they are consumed
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+        except QueryBudgetExceeded as e:
+            failures.append(str(e))
+            continue
+        if response.status_code != 200:
+            failures.append(f"{url} returned {response.status_code}")
+    if failures:
+        raise QueryBudgetExceeded('\n'.join(failures))
@@ -0,0 +1,197 @@
+"""
+Vehicle reports built in the background.
+
+A report covers one vehicle and date range. Its data is stored as a
+VehicleReport tagged with the vehicle's data version - the latest change to
+the vehicle or any of its events, the timestamp conditional GETs use - so a
+stored report is served again until the data it was built from changes.
+
+Ranges with up to REPORT_INLINE_EVENT_LIMIT events are built during the
+request. Bigger ones are built by a 'reports.vehicle' job (see tracker.tasks)
+while the report page polls its progress.
+"""
+import json
+import logging
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+
+from .conditional import vehicle_last_modified
+from .downsample import Series, default_max_points
+from .jobs import enqueue, set_progress
+from .models import Event, VehicleReport
+from .rollups import PERIODS, month_start, period_breakdown, stats_totals
+
+logger = logging.getLogger('tracker')
+
+JOB_NAME = 'reports.vehicle'
+
+
+def _plain(value):
+    # Stored as JSON: Decimals would come back as strings, and report_context
+    # turns the ISO dates back into dates
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def build_report(vehicle, start=None, end=None):
+    """The report data for ``vehicle`` between ``start`` and ``end`` as a JSON-ready dict"""
+    all_events = Event.objects.filter(vehicle=vehicle)
+    events = all_events
+    if start:
+        events = events.filter(date__gte=start)
+    if end:
+        events = events.filter(date__lte=end)
+
+    # Totals come from the monthly rollup; only partial months at the ends
+    # of the date range are read from events
+    totals = stats_totals(vehicle.monthly_stats.all(), events=all_events, start=start, end=end)
+
+    # Month / quarter / year breakdowns, so switching period needs no rebuild
+    stats = vehicle.monthly_stats.all()
+    if start:
+        stats = stats.filter(month__gte=month_start(start))
+    if end:
+        stats = stats.filter(month__lte=end)
+    breakdowns = {}
+    for period in PERIODS:
+        rows = period_breakdown(stats, period)
+        rows.reverse()
+        breakdowns[period] = [{key: _plain(value) for key, value in row.items()} for row in rows]
+    set_progress(20)
+
+    reading_field = vehicle.get_reading_field()
+    is_car = reading_field == 'miles'
+    maintenance_events = [
+        {'date': _plain(day), 'category': category or '', 'reading': _plain(reading), 'total_cost': _plain(cost)}
+        for day, category, reading, cost in events.filter(event_type='maintenance').order_by(
+            '-date', '-id'
+        ).values_list('date', 'maintenance_category__name', reading_field, 'total_cost').iterator()
+    ]
+    set_progress(40)
+
+    gas_events = []
+    mpg_points = []
+    for event in events.filter(event_type='gas').only(
+        'date', 'event_type', 'miles', 'gallons', 'total_cost', 'milespergallon'
+    ).order_by('-date', '-id').iterator():
+        mpg = event.get_mpg()
+        gas_events.append({
+            'date': _plain(event.date),
+            'gallons': _plain(event.gallons),
+            'total_cost': _plain(event.total_cost),
+            'mpg': _plain(mpg),
+        })
+        if mpg:
+            mpg_points.append((event.date, float(mpg)))
+    set_progress(70)
+
+    # Oldest first and downsampled, so the chart stays light on long histories
+    series = Series()
+    for day, mpg in reversed(mpg_points):
+        series.append(day, mpg)
+    chart = series.downsample(default_max_points()).as_chart()
+    mpg_data = [{'date': day, 'mpg': mpg} for day, mpg in zip(chart['labels'], chart['data'])]
+
+    outing_events = [
+        {'date': _plain(day), 'location': location or '', 'reading': _plain(reading), 'notes': notes or ''}
+        for day, location, reading, notes in events.filter(event_type='outing').order_by(
+            '-date', '-id'
+        ).values_list('date', 'location__name', reading_field, 'notes').iterator()
+    ]
+    set_progress(90)
+
+    return {
+        'maintenance_events': maintenance_events,
+        'gas_events': gas_events,
+        'outing_events': outing_events,
+        'total_maintenance_cost': _plain(totals['maintenance_cost']),
+        'total_gas_cost': _plain(totals['gas_cost']),
+        'total_cost': _plain(totals['maintenance_cost'] + totals['gas_cost']),
+        # The rollup's efficiency is MPG for cars and GPH for boats/other
+        'avg_mpg': _plain(totals['avg_efficiency'] or 0) if is_car else None,
+        'avg_gph': None if is_car else _plain(totals['avg_efficiency'] or 0),
+        'mpg_data': mpg_data,
+        'breakdowns': breakdowns,
+    }
+
+
+def find_report(vehicle_id, start, end, version):
+    return VehicleReport.objects.filter(
+        vehicle_id=vehicle_id, start_date=start, end_date=end, data_version=version
+    ).first()
+
+
+def store_report(vehicle, start, end, version, data):
+    report = VehicleReport.objects.create(
+        vehicle=vehicle, start_date=start, end_date=end, data_version=version, data=data
+    )
+    # Reports built from older data can never be served again, whatever
+    # their range; drop them along with duplicates of this one
+    VehicleReport.objects.filter(vehicle=vehicle).filter(
+        Q(data_version__lt=version) | Q(start_date=start, end_date=end, data_version=version)
+    ).exclude(pk=report.pk).delete()
+    return report
+
+
+def refresh_report(vehicle, start=None, end=None):
+    """Return the current report for the range, building it if there is none"""
+    version = vehicle_last_modified(vehicle.pk)
+    report = find_report(vehicle.pk, start, end, version)
+    if report is None:
+        report = store_report(vehicle, start, end, version, build_report(vehicle, start, end))
+        logger.debug(f"Built report for vehicle {vehicle.pk} ({start} - {end})")
+    return report
+
+
+def get_report(vehicle, start=None, end=None, user=None):
+    """
+    Return ``(report, job)``. The report is None while a job is building it;
+    the job is None when a stored report was current or the range was small
+    enough to build now.
+    """
+    version = vehicle_last_modified(vehicle.pk)
+    report = find_report(vehicle.pk, start, end, version)
+    if report is not None:
+        return report, None
+
+    limit = getattr(settings, 'REPORT_INLINE_EVENT_LIMIT', 500)
+    events = Event.objects.filter(vehicle=vehicle)
+    if start:
+        events = events.filter(date__gte=start)
+    if end:
+        events = events.filter(date__lte=end)
+    if events[:limit + 1].count() <= limit:
+        return store_report(vehicle, start, end, version, build_report(vehicle, start, end)), None
+
+    # Keyed by the data version too, so an edit while a build is queued
+    # starts a new build rather than joining the stale one
+    key = f"{JOB_NAME}:{vehicle.pk}:{start or ''}:{end or ''}:{version.timestamp()}"
+    job = enqueue(JOB_NAME, key=key, created_by=user, vehicle_id=vehicle.pk,
+                  start=start.isoformat() if start else None, end=end.isoformat() if end else None)
+    return None, job
+
+
+def report_context(report, period):
+    """Template context for a stored report, showing the ``period`` breakdown"""
+    data = report.data
+    events = {
+        name: [dict(event, date=date.fromisoformat(event['date'])) for event in data[name]]
+        for name in ('maintenance_events', 'gas_events', 'outing_events')
+    }
+    return {
+        **events,
+        'total_maintenance_cost': data['total_maintenance_cost'],
+        'total_gas_cost': data['total_gas_cost'],
+        'total_cost': data['total_cost'],
+        'avg_mpg': data['avg_mpg'],
+        'avg_gph': data.get('avg_gph'),
+        'mpg_data': json.dumps(data['mpg_data']),
+        'breakdown': data['breakdowns'][period],
+        'report': report,
+    }
@@ -0,0 +1,256 @@
+"""
+Monthly per-vehicle rollups (VehicleMonthlyStats).
+
+Reports read these rows instead of aggregating raw events, so a month,
+quarter or year breakdown costs the same however long a vehicle's history
+is. Event writes refresh only the months they can affect; a full rebuild is
+one grouped query per chunk of vehicles.
+"""
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, Q, F, Sum, Count, Max, Min, DecimalField
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncYear
+
+from .models import Event, Vehicle, VehicleMonthlyStats
+
+logger = logging.getLogger('tracker')
+
+_IS_CAR = Q(vehicle__type='car')
+_READING = Case(When(_IS_CAR, then=F('miles')), default=F('hours'),
+                output_field=DecimalField(max_digits=10, decimal_places=2))
+_EFFICIENCY = Case(When(_IS_CAR, then=F('milespergallon')), default=F('gallonsperhour'),
+                   output_field=DecimalField(max_digits=8, decimal_places=2))
+
+_GAS = Q(event_type='gas')
+_MAINTENANCE = Q(event_type='maintenance')
+_OUTING = Q(event_type='outing')
+
+MONTH_AGGREGATES = {
+    'gas_count': Count('id', filter=_GAS),
+    'maintenance_count': Count('id', filter=_MAINTENANCE),
+    'outing_count': Count('id', filter=_OUTING),
+    'gas_cost': Sum('total_cost', filter=_GAS),
+    'maintenance_cost': Sum('total_cost', filter=_MAINTENANCE),
+    'outing_cost': Sum('total_cost', filter=_OUTING),
+    'gallons': Sum('gallons', filter=_GAS),
+    'efficiency_total': Sum(_EFFICIENCY, filter=_GAS),
+    'efficiency_count': Count(_EFFICIENCY, filter=_GAS),
+    'start_reading': Min(_READING),
+    'end_reading': Max(_READING),
+}
+
+STAT_FIELDS = (
+    'gas_count', 'maintenance_count', 'outing_count', 'gas_cost', 'maintenance_cost',
+    'outing_cost', 'gallons', 'efficiency_total', 'efficiency_count', 'end_reading',
+)
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _build_stats(vehicle, month, values, previous_reading):
+    """Turn one month's aggregate into a VehicleMonthlyStats row"""
+    stats = VehicleMonthlyStats(vehicle_id=vehicle.pk, month=month)
+    for field in STAT_FIELDS:
+        value = values[field]
+        if value is not None:
+            setattr(stats, field, value)
+
+    # Distance is the reading gained since the previous month with one; a
+    # car's first month counts from its starting mileage
+    if values['end_reading'] is not None:
+        start = previous_reading
+        if start is None and vehicle.type == 'car' and vehicle.starting_mileage is not None:
+            start = Decimal(vehicle.starting_mileage)
+        if start is None:
+            start = values['start_reading']
+        stats.distance = max(values['end_reading'] - start, Decimal('0'))
+    return stats
+
+
+def rebuild_monthly_stats(vehicle_ids):
+    """Recompute every month of ``vehicle_ids``. Returns the number of rows written."""
+    vehicle_ids = sorted({int(pk) for pk in vehicle_ids if pk is not None})
+    if not vehicle_ids:
+        return 0
+    vehicles = Vehicle.objects.in_bulk(vehicle_ids)
+
+    months = Event.objects.filter(vehicle_id__in=vehicle_ids).annotate(
+        period=TruncMonth('date')
+    ).order_by().values('vehicle_id', 'period').annotate(**MONTH_AGGREGATES).order_by('vehicle_id', 'period')
+
+    rows = []
+    previous_reading = {}
+    for values in months.iterator():
+        vehicle = vehicles[values['vehicle_id']]
+        stats = _build_stats(vehicle, values['period'], values, previous_reading.get(vehicle.pk))
+        if stats.end_reading is not None:
+            previous_reading[vehicle.pk] = stats.end_reading
+        rows.append(stats)
+
+    with transaction.atomic():
+        VehicleMonthlyStats.objects.filter(vehicle_id__in=vehicle_ids).delete()
+        VehicleMonthlyStats.objects.bulk_create(rows, batch_size=1000)
+
+    logger.debug(f"Rebuilt {len(rows)} monthly stats rows for vehicles {vehicle_ids}")
+    return len(rows)
+
+
+def refresh_month(vehicle, month):
+    """Recompute one month of one vehicle from its events"""
+    values = Event.objects.filter(
+        vehicle_id=vehicle.pk, date__gte=month, date__lt=next_month(month)
+    ).aggregate(events=Count('id'), **MONTH_AGGREGATES)
+
+    if not values['events']:
+        VehicleMonthlyStats.objects.filter(vehicle_id=vehicle.pk, month=month).delete()
+        return None
+
+    previous_reading = VehicleMonthlyStats.objects.filter(
+        vehicle_id=vehicle.pk, month__lt=month, end_reading__isnull=False
+    ).order_by('-month').values_list('end_reading', flat=True).first()
+
+    stats = _build_stats(vehicle, month, values, previous_reading)
+    defaults = {field: getattr(stats, field) for field in STAT_FIELDS + ('distance',)}
+    stats, _ = VehicleMonthlyStats.objects.update_or_create(
+        vehicle_id=vehicle.pk, month=month, defaults=defaults
+    )
+    return stats
+
+
+def refresh_monthly_stats(vehicle, dates):
+    """
+    Refresh the months an event change on ``dates`` can affect: the months
+    themselves, the next month with a reading (its distance starts from
+    ours) and the next month with a fill-up (its efficiency uses ours).
+    """
+    if not isinstance(vehicle, Vehicle):
+        vehicle = Vehicle.objects.get(pk=vehicle)
+    reading_field = vehicle.get_reading_field()
+
+    months = set()
+    for changed in {month_start(d) for d in dates if d is not None}:
+        months.add(changed)
+        later = Event.objects.filter(vehicle_id=vehicle.pk, date__gte=next_month(changed))
+        for follower in (
+            later.filter(**{f'{reading_field}__isnull': False}),
+            later.filter(event_type='gas'),
+        ):
+            follower_date = follower.order_by('date').values_list('date', flat=True).first()
+            if follower_date:
+                months.add(month_start(follower_date))
+
+    # Oldest first: each month's distance reads the previous month's reading
+    for month in sorted(months):
+        refresh_month(vehicle, month)
+    return len(months)
+
+
+PERIODS = {
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+
+
+def _period_label(period, value):
+    if period == 'month':
+        return value.strftime('%b %Y')
+    if period == 'quarter':
+        return f"Q{(value.month - 1) // 3 + 1} {value.year}"
+    return str(value.year)
+
+
+def _percent_change(current, previous):
+    if not previous:
+        return None
+    return round((Decimal(current) - Decimal(previous)) / Decimal(previous) * 100, 1)
+
+
+def period_breakdown(stats, period='month'):
+    """
+    Sum ``stats`` (a VehicleMonthlyStats queryset) by month, quarter or year,
+    oldest first. Each row is compared with the same period a year earlier.
+    """
+    trunc = PERIODS[period]
+    rows = list(
+        stats.annotate(period=trunc('month')).order_by().values('period').annotate(
+            gas_count=Sum('gas_count'),
+            maintenance_count=Sum('maintenance_count'),
+            outing_count=Sum('outing_count'),
+            gas_cost=Sum('gas_cost'),
+            maintenance_cost=Sum('maintenance_cost'),
+            outing_cost=Sum('outing_cost'),
+            gallons=Sum('gallons'),
+            distance=Sum('distance'),
+            efficiency_total=Sum('efficiency_total'),
+            efficiency_count=Sum('efficiency_count'),
+        ).order_by('period')
+    )
+
+    by_period = {row['period']: row for row in rows}
+    for row in rows:
+        row['label'] = _period_label(period, row['period'])
+        row['total_cost'] = row['gas_cost'] + row['maintenance_cost'] + row['outing_cost']
+        row['avg_efficiency'] = (
+            round(row['efficiency_total'] / row['efficiency_count'], 2) if row['efficiency_count'] else None
+        )
+        last_year = by_period.get(row['period'].replace(year=row['period'].year - 1))
+        row['cost_change'] = _percent_change(row['total_cost'], last_year['total_cost']) if last_year else None
+        row['distance_change'] = _percent_change(row['distance'], last_year['distance']) if last_year else None
+    return rows
+
+
+TOTAL_FIELDS = (
+    'gas_count', 'maintenance_count', 'outing_count', 'gas_cost', 'maintenance_cost',
+    'outing_cost', 'gallons', 'efficiency_total', 'efficiency_count',
+)
+
+
+def stats_totals(stats, events=None, start=None, end=None):
+    """
+    Totals of a VehicleMonthlyStats queryset. With ``start``/``end`` whole
+    months come from the rollup and only the partial months at either end
+    are aggregated from ``events`` (an Event queryset for the same vehicles).
+    Distance covers whole months only.
+    """
+    first_full = start if start is None or start.day == 1 else next_month(start)
+    # Exclusive bound: the month after ``end`` when it's the last day of a month
+    last_full = end if end is None or (end + timedelta(days=1)).day != 1 else next_month(end)
+    if last_full is not None:
+        last_full = month_start(last_full)
+    if first_full is not None:
+        stats = stats.filter(month__gte=first_full)
+    if last_full is not None:
+        stats = stats.filter(month__lt=last_full)
+
+    totals = stats.aggregate(distance=Sum('distance'), **{field: Sum(field) for field in TOTAL_FIELDS})
+    totals = {key: value or 0 for key, value in totals.items()}
+
+    edges = Q()
+    if first_full and last_full and first_full >= last_full:
+        # The range sits inside a single month
+        edges = Q(date__gte=start, date__lte=end)
+    else:
+        if start and start < first_full:
+            edges |= Q(date__gte=start, date__lt=first_full)
+        if end and last_full <= end:
+            edges |= Q(date__gte=last_full, date__lte=end)
+    if edges and events is not None:
+        partial = events.filter(edges).aggregate(**{field: MONTH_AGGREGATES[field] for field in TOTAL_FIELDS})
+        for field in TOTAL_FIELDS:
+            totals[field] += partial[field] or 0
+
+    totals['total_cost'] = totals['gas_cost'] + totals['maintenance_cost'] + totals['outing_cost']
+    totals['avg_efficiency'] = (
+        round(totals['efficiency_total'] / totals['efficiency_count'], 2) if totals['efficiency_count'] else None
+    )
+    return totals
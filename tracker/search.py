@@ -0,0 +1,168 @@
+"""
+Full-text search over events, todos and locations.
+
+On PostgreSQL each searchable model keeps a ``search_vector`` tsvector
+column, GIN indexed (see migration 0012), built from its text fields:
+
+    Event     maintenance category name (A), notes (B)
+    TodoItem  title (A), description (B)
+    Location  name (A), address (B)
+
+The column is refreshed by the post_save signals in tracker.signals and, for
+rows written in bulk, by update_search_vectors() (the importer calls it, and
+the rebuild_search_index command covers everything else). A search matches
+rows containing any of the words and ranks rows matching more of them, and
+matches in the heavier fields, first.
+
+Other databases (SQLite in development and tests) have no tsvector, so they
+fall back to case-insensitive substring matching, newest first.
+"""
+import logging
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.urls import reverse
+
+from .models import Event, Location, MaintenanceCategory, TodoItem
+
+logger = logging.getLogger('tracker')
+
+SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+
+
+def is_supported():
+    """Whether the database has tsvector columns to search"""
+    return connection.vendor == 'postgresql'
+
+
+def _vector(*weighted):
+    return reduce(
+        lambda vector, other: vector + other,
+        (SearchVector(source, weight=weight, config=SEARCH_CONFIG) for source, weight in weighted),
+    )
+
+
+def _event_vector():
+    # update() can't join, so read the category name with a subquery
+    category = Subquery(
+        MaintenanceCategory.objects.filter(pk=OuterRef('maintenance_category_id')).values('name')[:1]
+    )
+    return _vector((category, 'A'), ('notes', 'B'))
+
+
+VECTORS = {
+    Event: _event_vector,
+    TodoItem: lambda: _vector(('title', 'A'), ('description', 'B')),
+    Location: lambda: _vector(('name', 'A'), ('address', 'B')),
+}
+
+# Fields each model's vector is built from, to skip refreshes of saves that
+# didn't touch them
+SOURCE_FIELDS = {
+    Event: {'notes', 'maintenance_category'},
+    TodoItem: {'title', 'description'},
+    Location: {'name', 'address'},
+}
+
+
+def update_search_vectors(queryset):
+    """Rebuild the search vector of every row in ``queryset``; returns the count"""
+    if not is_supported():
+        return 0
+    return queryset.update(search_vector=VECTORS[queryset.model]())
+
+
+def parse_terms(text):
+    """The distinct words of a search, at most MAX_TERMS of them"""
+    terms = []
+    for term in re.findall(r'\w+', (text or '').lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _ranked(queryset, terms):
+    # Any word may match; SearchRank orders rows matching more words higher
+    query = reduce(or_, (SearchQuery(term, config=SEARCH_CONFIG) for term in terms))
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-pk')
+
+
+def _matching(queryset, terms, fields):
+    matches = [reduce(or_, (Q(**{f'{field}__icontains': term}) for field in fields)) for term in terms]
+    return queryset.filter(reduce(or_, matches)).annotate(rank=Value(0.0)).order_by('-pk')
+
+
+def _search(queryset, terms, fields, limit):
+    queryset = queryset.defer('search_vector')
+    if is_supported():
+        return list(_ranked(queryset, terms)[:limit])
+    return list(_matching(queryset, terms, fields)[:limit])
+
+
+def search(user, access, text, limit=20):
+    """
+    Events, todos and locations the user can see that match ``text``, best
+    first, as a list of result dicts for the search page.
+    """
+    terms = parse_terms(text)
+    if not terms:
+        return []
+
+    events = _search(
+        Event.objects.filter(vehicle__in=access.vehicle_ids).select_related('vehicle', 'maintenance_category'),
+        terms, ('notes', 'maintenance_category__name'), limit,
+    )
+    # A subquery instead of joining shared_with keeps rows unique without DISTINCT
+    shared = TodoItem.shared_with.through.objects.filter(user=user).values('todoitem_id')
+    todos = _search(
+        TodoItem.objects.filter(
+            Q(created_by=user) | Q(id__in=shared) | Q(vehicle__in=access.vehicle_ids)
+        ).select_related('vehicle'),
+        terms, ('title', 'description'), limit,
+    )
+    locations = _search(
+        Location.objects.filter(family__in=access.family_ids),
+        terms, ('name', 'address'), limit,
+    )
+
+    results = []
+    for event in events:
+        category = event.maintenance_category.name if event.maintenance_category else ''
+        results.append({
+            'kind': event.get_event_type_display(),
+            'title': f"{category or event.get_event_type_display()} - {event.vehicle.name}",
+            'text': event.notes or '',
+            'date': event.date,
+            'url': reverse('event_detail', args=[event.pk]),
+            'rank': event.rank,
+        })
+    for todo in todos:
+        results.append({
+            'kind': 'To-do',
+            'title': todo.title + (f" - {todo.vehicle.name}" if todo.vehicle else ''),
+            'text': todo.description or '',
+            'date': todo.due_date,
+            'url': f"{reverse('todo_list')}#todo-item-{todo.pk}",
+            'rank': todo.rank,
+        })
+    for location in locations:
+        results.append({
+            'kind': 'Location',
+            'title': location.name,
+            'text': location.address or '',
+            'date': None,
+            'url': reverse('location_detail', args=[location.pk]),
+            'rank': location.rank,
+        })
+
+    # Ranks are comparable across models; the fallback has none, so keeps
+    # events, then todos, then locations
+    results.sort(key=lambda result: result['rank'], reverse=True)
+    return results[:limit]
@@ -2,42 +2,68 @@
 from rest_framework import serializers
 from .models import Vehicle, Event, Location, TodoItem, MaintenanceCategory, MaintenanceSchedule
 
-class VehicleSerializer(serializers.ModelSerializer):
+
+class SparseFieldsMixin:
+    """
+    Limit the output to the fields named in ``?fields=a,b,c``. Unknown names
+    are ignored; without the parameter every field is returned.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            wanted = {name.strip() for name in requested.split(',') if name.strip()}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class VehicleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    unit = serializers.ReadOnlyField(source='get_unit')
+
     class Meta:
         model = Vehicle
-        exclude = ['owner', 'created_at', 'updated_at']
+        exclude = ['current_reading_event', 'created_at']
         read_only_fields = ['id']
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Location
-        exclude = ['created_by', 'created_at']
+        exclude = ['created_by', 'created_at', 'search_vector']
         read_only_fields = ['id']
 
-class MaintenanceCategorySerializer(serializers.ModelSerializer):
+class MaintenanceCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MaintenanceCategory
         fields = '__all__'
         read_only_fields = ['id']
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # default=None keeps the keys present when the relation is empty
+    maintenance_category_name = serializers.ReadOnlyField(source='maintenance_category.name', default=None)
+    location_name = serializers.ReadOnlyField(source='location.name', default=None)
+
     class Meta:
         model = Event
-        exclude = ['user', 'created_at', 'updated_at']
+        exclude = ['created_at', 'search_vector']
         read_only_fields = ['id']
 
-class TodoItemSerializer(serializers.ModelSerializer):
+class TodoItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TodoItem
-        exclude = ['created_at']
+        exclude = ['created_at', 'search_vector']
         read_only_fields = ['id']
 
-class MaintenanceScheduleSerializer(serializers.ModelSerializer):
+class MaintenanceScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     maintenance_type_name = serializers.ReadOnlyField(source='maintenance_type.name')
+    # Due status needs the MaintenanceSchedule.objects.with_due_status() annotations
     is_due = serializers.BooleanField(read_only=True)
-    due_status = serializers.FloatField(source='get_due_status', read_only=True)
-    
+    days_until_due = serializers.IntegerField(read_only=True)
+    miles_until_due = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    hours_until_due = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    due_details = serializers.ListField(source='get_due_details', child=serializers.CharField(), read_only=True)
+
     class Meta:
         model = MaintenanceSchedule
         exclude = ['created_at', 'updated_at']
-        read_only_fields = ['id']
\ No newline at end of file
+        read_only_fields = ['id']
@@ -0,0 +1,205 @@
+"""
+Signal handlers that keep derived data in step with model writes.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .access import invalidate_access, invalidate_family_access
+from .cache import bump_family_version
+from .efficiency import recompute_vehicle_efficiency
+from .forecast import queue_forecast
+from .rollups import refresh_monthly_stats
+from .search import SOURCE_FIELDS, update_search_vectors
+from .models import Family, Vehicle, Location, Event, TodoItem, MaintenanceSchedule, MaintenanceCategory
+
+
+def _bump_on_commit(*family_ids):
+    # Bump after commit so a concurrent reader can't cache pre-commit data
+    # under the new version
+    transaction.on_commit(lambda: bump_family_version(*family_ids))
+
+
+def _deleted_with_vehicle(kwargs):
+    """True when a post_delete comes from deleting the parent vehicle or family"""
+    origin = kwargs.get('origin')
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Vehicle, Family)
+
+
+def _vehicle_family_id(vehicle_id):
+    if vehicle_id is None:
+        return None
+    return Vehicle.objects.filter(pk=vehicle_id).values_list('family_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Family)
+def family_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+@receiver([post_save, post_delete], sender=Location)
+def family_child_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.family_id)
+
+
+@receiver(pre_delete, sender=Family)
+def family_deleting(sender, instance, **kwargs):
+    # Members are gone by post_delete, so collect them now
+    invalidate_family_access(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+def vehicle_access_changed(sender, instance, **kwargs):
+    """A vehicle added, removed or moved changes its families' vehicle ids"""
+    if kwargs['signal'] is post_delete:
+        origin = kwargs.get('origin')
+        origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+        # A family's own deletion invalidates its members
+        if origin_model is not Family:
+            invalidate_family_access(instance.family_id)
+        return
+    loaded_family_id = getattr(instance, '_loaded_values', {}).get('family_id')
+    if kwargs.get('created') or loaded_family_id != instance.family_id:
+        invalidate_family_access(instance.family_id, loaded_family_id)
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=TodoItem)
+@receiver([post_save, post_delete], sender=MaintenanceSchedule)
+def vehicle_child_changed(sender, instance, **kwargs):
+    # The vehicle's own post_delete invalidates its family
+    if instance.vehicle_id is None or _deleted_with_vehicle(kwargs):
+        return
+    # Prefer the already loaded vehicle; fall back to a single column lookup
+    # (the vehicle may already be gone when a cascade delete runs)
+    vehicle = instance._state.fields_cache.get('vehicle')
+    family_id = vehicle.family_id if vehicle else _vehicle_family_id(instance.vehicle_id)
+    _bump_on_commit(family_id)
+    # An event moved to another vehicle may also have left another family
+    loaded_vehicle_id = getattr(instance, '_loaded_values', {}).get('vehicle_id')
+    if loaded_vehicle_id not in (None, instance.vehicle_id):
+        _bump_on_commit(_vehicle_family_id(loaded_vehicle_id))
+
+
+@receiver([post_save, post_delete], sender=Event)
+def event_changed(sender, instance, **kwargs):
+    """Refresh the vehicle's current reading, fuel efficiency, monthly stats and forecasts"""
+    if _deleted_with_vehicle(kwargs):
+        return
+    
+    loaded = getattr(instance, '_loaded_values', {})
+    deleted = kwargs['signal'] is post_delete
+    if deleted or not loaded:
+        changed = set(Event.TRACKED_FIELDS)
+    else:
+        changed = {field for field in Event.TRACKED_FIELDS if loaded[field] != getattr(instance, field)}
+    if not changed:
+        # Only notes, category etc. changed
+        return
+    
+    vehicle_ids = {instance.vehicle_id, loaded.get('vehicle_id')} - {None}
+    # Earliest date that changed for each affected vehicle
+    since = {}
+    for vehicle_id, date in ((instance.vehicle_id, instance.date),
+                             (loaded.get('vehicle_id'), loaded.get('date'))):
+        if vehicle_id is not None and date is not None:
+            since[vehicle_id] = min(since.get(vehicle_id, date), date)
+    
+    vehicles = list(Vehicle.objects.filter(pk__in=vehicle_ids))
+    if changed != {'total_cost'}:
+        for vehicle in vehicles:
+            vehicle.refresh_current_reading()
+            # The usage rate, and so the schedules' forecasts, follow the readings
+            queue_forecast(vehicle.pk)
+        
+        if instance.event_type == 'gas' or loaded.get('event_type') == 'gas':
+            for vehicle_id, date in since.items():
+                recompute_vehicle_efficiency(vehicle_id, since=date)
+            if not deleted:
+                instance.refresh_from_db(fields=['milespergallon', 'gallonsperhour'])
+    
+    # After the efficiency recompute, which the rollup's averages read
+    for vehicle in vehicles:
+        dates = set()
+        if vehicle.pk == instance.vehicle_id:
+            dates.add(instance.date)
+        if vehicle.pk == loaded.get('vehicle_id'):
+            dates.add(loaded.get('date'))
+        refresh_monthly_stats(vehicle, dates)
+    
+    instance._loaded_values = {field: getattr(instance, field) for field in Event.TRACKED_FIELDS}
+
+
+@receiver(m2m_changed, sender=Family.members.through)
+def family_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _bump_on_commit(instance.pk)
+        if action in ('post_add', 'post_remove'):
+            invalidate_access(*pk_set)
+        elif action == 'pre_clear':
+            invalidate_family_access(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        # user.families.add(...) / remove(...)
+        _bump_on_commit(*pk_set)
+        invalidate_access(instance.pk)
+    elif action == 'pre_clear':
+        # user.families.clear() doesn't provide pk_set, so collect the
+        # families before they are removed
+        _bump_on_commit(*instance.families.values_list('id', flat=True))
+        invalidate_access(instance.pk)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=TodoItem)
+@receiver(post_save, sender=Location)
+def search_source_changed(sender, instance, update_fields=None, **kwargs):
+    """Rebuild the row's full-text search vector"""
+    if update_fields is not None and not SOURCE_FIELDS[sender] & set(update_fields):
+        return
+    update_search_vectors(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=MaintenanceCategory)
+def category_changed(sender, instance, created, **kwargs):
+    # Event vectors include the category name
+    if not created:
+        update_search_vectors(Event.objects.filter(maintenance_category=instance))
+
+
+def _touch_events(**lookups):
+    # Event pages show their location and category names, so move the
+    # conditional GET validators of the events and their vehicles on
+    Event.objects.filter(**lookups).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=MaintenanceCategory)
+def event_label_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    _touch_events(**{'location' if sender is Location else 'maintenance_category': instance})
+
+
+@receiver(pre_delete, sender=Location)
+def location_deleting(sender, instance, **kwargs):
+    # Its events are about to be set to no location
+    _touch_events(location=instance)
+
+
+@receiver(pre_delete, sender=MaintenanceCategory)
+def category_deleting(sender, instance, **kwargs):
+    # Its events are set to no category; remember them to drop the name
+    instance._event_ids = list(Event.objects.filter(maintenance_category=instance).values_list('id', flat=True))
+    _touch_events(pk__in=instance._event_ids)
+
+
+@receiver(post_delete, sender=MaintenanceCategory)
+def category_deleted(sender, instance, **kwargs):
+    event_ids = getattr(instance, '_event_ids', None)
+    if event_ids:
+        update_search_vectors(Event.objects.filter(pk__in=event_ids))
@@ -0,0 +1,56 @@
+"""
+Background job handlers (see tracker.jobs). Imported by TrackerConfig.ready
+so every process, web or worker, knows the registered names.
+"""
+from datetime import date
+
+from django.utils import timezone
+
+from .cache import bump_family_version
+from .efficiency import recompute_vehicle_efficiency
+from .forecast import JOB_NAME as FORECAST_JOB, update_forecasts
+from .images import process_vehicle_image
+from .jobs import job
+from .models import Vehicle
+from .reports import refresh_report
+from .rollups import rebuild_monthly_stats
+
+
+@job('vehicles.render_image')
+def render_vehicle_image(vehicle_id, image=None):
+    return {'rendered': process_vehicle_image(vehicle_id, image=image)}
+
+
+@job('vehicles.recompute_derived')
+def recompute_derived_data(vehicle_id, since=None):
+    """Efficiency from ``since`` (ISO date) onwards and the monthly rollups of one vehicle"""
+    family_id = Vehicle.objects.filter(pk=vehicle_id).values_list('family_id', flat=True).first()
+    if family_id is None:
+        return {'vehicle': None}
+    changed = recompute_vehicle_efficiency(vehicle_id, since=date.fromisoformat(since) if since else None)
+    rebuild_monthly_stats([vehicle_id])
+    update_forecasts([vehicle_id])
+    # Moves ETags and stored reports on to the recomputed data
+    Vehicle.objects.filter(pk=vehicle_id).update(updated_at=timezone.now())
+    bump_family_version(family_id)
+    return {'vehicle': vehicle_id, 'fill_ups_changed': changed}
+
+
+@job('reports.vehicle', max_attempts=2)
+def build_vehicle_report(vehicle_id, start=None, end=None):
+    vehicle = Vehicle.objects.filter(pk=vehicle_id).first()
+    if vehicle is None:
+        return {'report': None}
+    report = refresh_report(
+        vehicle,
+        start=date.fromisoformat(start) if start else None,
+        end=date.fromisoformat(end) if end else None,
+    )
+    return {'report': report.pk}
+
+
+@job(FORECAST_JOB)
+def forecast_schedules(vehicle_id):
+    """Refit one vehicle's usage rate and reproject its schedules' due dates"""
+    rates_changed, schedules_changed = update_forecasts([vehicle_id])
+    return {'vehicle': vehicle_id, 'rate_changed': bool(rates_changed), 'schedules_changed': schedules_changed}
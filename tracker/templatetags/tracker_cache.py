@@ -0,0 +1,72 @@
+"""
+Template fragment caching.
+
+``{% fragment_cache name key... %}...{% endfragment_cache %}`` works like
+Django's ``{% cache %}`` tag but takes its timeout from
+TEMPLATE_FRAGMENT_TIMEOUT and renders uncached instead of failing when the
+cache is unavailable or any key part is None. Key fragments by something that
+changes with their content - a vehicle's ``updated_at``, or a family version:
+
+    {% family_version location.family_id as version %}
+    {% fragment_cache location_card location.pk version %}...{% endfragment_cache %}
+
+``family_version`` reads the ``family_versions`` dict the view put in the
+context (see tracker.cache.get_family_versions).
+"""
+import logging
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+logger = logging.getLogger('tracker')
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        if any(value is None for value in vary_on):
+            return self.nodelist.render(context)
+
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        try:
+            value = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Cache unavailable reading fragment {self.fragment_name}: {e}")
+            return self.nodelist.render(context)
+        if value is not None:
+            return value
+
+        value = self.nodelist.render(context)
+        try:
+            cache.set(key, value, getattr(settings, 'TEMPLATE_FRAGMENT_TIMEOUT', 24 * 60 * 60))
+        except Exception as e:
+            logger.warning(f"Cache unavailable storing fragment {self.fragment_name}: {e}")
+        return value
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    return FragmentCacheNode(nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]])
+
+
+@register.simple_tag(takes_context=True)
+def family_version(context, family_id):
+    """The cached version of ``family_id``, or None when it isn't available"""
+    versions = context.get('family_versions')
+    if not versions:
+        return None
+    return versions.get(family_id)
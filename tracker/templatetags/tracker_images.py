@@ -0,0 +1,39 @@
+"""
+``{% vehicle_image vehicle 'card' class='card-img-top' %}`` renders a
+vehicle's rendition as a <picture> (WebP with a JPEG fallback), or a
+placeholder while the worker hasn't produced it yet, or has given up on it
+(titled to say so). Callers still check ``vehicle.image`` for vehicles
+without a photo.
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+PLACEHOLDER = 'images/vehicle-placeholder.svg'
+PLACEHOLDER_TITLES = {
+    'pending': 'Photo is being processed',
+    'failed': 'Photo could not be processed; try uploading it again',
+}
+
+
+@register.simple_tag
+def vehicle_image(vehicle, size='card', **attrs):
+    css_class = attrs.get('class', '')
+    alt = attrs.get('alt', str(vehicle))
+    rendition = vehicle.image_renditions.get(size) if vehicle.image_status == 'ready' else None
+    if not rendition:
+        title = PLACEHOLDER_TITLES.get(vehicle.image_status, PLACEHOLDER_TITLES['pending'])
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" title="{}">',
+            static(PLACEHOLDER), css_class, alt, title,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" width="{}" height="{}" class="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        default_storage.url(rendition['webp']),
+        default_storage.url(rendition['jpeg']),
+        rendition['width'], rendition['height'], css_class, alt,
+    )
@@ -1,3 +1,887 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+import json
+import math
+import random
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs
+from .downsample import Series, lttb_indices, parse_max_points
+from .efficiency import recompute_efficiency
+from .forecast import fit_usage_rates, project, update_forecasts
+from .geo import MILES_PER_DEGREE, cell_size, covering_cells, encode, nearest
+from .importer import EventImporter, EventImportError
+from .instrumentation import fingerprint
+from .integrity import CHECKS, check_vehicles
+from .models import (
+    Event, Family, Job, Location, MaintenanceCategory, MaintenanceSchedule, TodoItem, Vehicle, VehicleMonthlyStats,
+)
+from .pagination import encode_cursor, keyset_paginate
+from .querybudget import QueryBudgetExceeded, assert_url_budgets, query_budget
+from .reports import build_report
+from .rollups import MONTH_AGGREGATES, TOTAL_FIELDS, rebuild_monthly_stats, stats_totals
+from .templatetags.tracker_images import vehicle_image
+
+
+@jobs.job('tests.fail', max_attempts=3)
+def failing_job(message='boom'):
+    raise RuntimeError(message)
+
+
+@jobs.job('tests.noop')
+def noop_job(**args):
+    return args
+
+
+class TrackerTestCase(TestCase):
+    """A family with one member, a car and a boat"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.family = Family.objects.create(name='Family', created_by=cls.user)
+        cls.family.members.add(cls.user)
+        cls.car = Vehicle.objects.create(family=cls.family, name='Car', make='Make', model='Model', year=2020,
+                                         type='car', starting_mileage=1000)
+        cls.boat = Vehicle.objects.create(family=cls.family, name='Boat', make='Make', model='Model', year=2020,
+                                          type='boat')
+
+    def setUp(self):
+        cache.clear()
+
+    def fill_up(self, vehicle, day, reading, gallons='10', **fields):
+        reading_field = 'miles' if vehicle.type == 'car' else 'hours'
+        return Event.objects.create(
+            vehicle=vehicle, created_by=self.user, event_type='gas', date=day, gallons=Decimal(gallons),
+            price_per_gallon=Decimal('3.50'), **{reading_field: Decimal(str(reading))}, **fields,
+        )
+
+    def run_due_jobs(self, names=None):
+        """Run queued jobs until none are left, ignoring their backoff"""
+        while True:
+            Job.objects.filter(status='queued').update(run_at=timezone.now())
+            job = jobs.claim('test-worker', names=names)
+            if job is None:
+                return
+            jobs.run(job)
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_collapses_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "tracker_event" WHERE "vehicle_id" IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM "tracker_event" WHERE "vehicle_id" IN (%s)'),
+        )
+        self.assertIn('IN (...)', fingerprint('SELECT 1 WHERE id IN ($1, $2)'))
+
+    def test_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'Bob''s' AND cost > 3.50"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND cost > ?',
+        )
+        self.assertEqual(fingerprint("SELECT 1 WHERE id IN (1, 2, 3)"), fingerprint("SELECT 1 WHERE id IN (4)"))
+
+    def test_keeps_identifiers_and_normalises_whitespace(self):
+        self.assertEqual(fingerprint('SELECT  "t2"."col1"\n  FROM t2'), 'SELECT "t2"."col1" FROM t2')
+
+
+class QueryBudgetTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_over_budget_lists_statements(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 2 queries, budget is 1'):
+            with query_budget(1):
+                User.objects.count()
+                User.objects.count()
+
+    def test_repeated_statement(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'likely an N+1'):
+            with query_budget(10, max_repeats=2):
+                for pk in range(3):
+                    User.objects.filter(pk=pk).exists()
+
+
+class URLQueryBudgetTests(TestCase):
+    """
+    The main pages and APIs, against a family with several vehicles, so a
+    query added per row (an N+1) goes over budget or repeats a statement.
+    """
+    # Budgets sit two queries above today's counts (the session and user
+    # lookups included); most times one statement shape may run per request
+    MAX_REPEATS = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        family = Family.objects.create(name='Family', created_by=cls.user)
+        family.members.add(cls.user)
+        category = MaintenanceCategory.objects.create(name='Oil Change')
+        location = Location.objects.create(name='Station', family=family, created_by=cls.user)
+        start = date.today() - timedelta(days=120)
+
+        for index, vehicle_type in enumerate(('car', 'car', 'boat', 'other')):
+            vehicle = Vehicle.objects.create(
+                family=family, name=f'Vehicle {index}', make='Make', model='Model', year=2020,
+                type=vehicle_type, starting_mileage=1000 if vehicle_type == 'car' else None,
+            )
+            reading_field = 'miles' if vehicle_type == 'car' else 'hours'
+            for day in range(5):
+                Event.objects.create(
+                    vehicle=vehicle, created_by=cls.user, event_type='gas', date=start + timedelta(days=day * 20),
+                    gallons=Decimal('10'), price_per_gallon=Decimal('3.50'), location=location,
+                    **{reading_field: Decimal(1200 + day * 250 if vehicle_type == 'car' else 10 + day * 5)},
+                )
+            Event.objects.create(
+                vehicle=vehicle, created_by=cls.user, event_type='maintenance', date=start + timedelta(days=90),
+                maintenance_category=category, total_cost=Decimal('45'), notes='Changed the oil',
+            )
+            MaintenanceSchedule.objects.create(
+                vehicle=vehicle, maintenance_type=category, name='Oil', created_by=cls.user,
+                interval_days=90, last_performed=start + timedelta(days=90),
+            )
+            TodoItem.objects.create(title=f'Wash {vehicle.name}', created_by=cls.user, vehicle=vehicle)
+        cls.vehicle = vehicle
+
+    def setUp(self):
+        # Cached pages would skip their queries
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        assert_url_budgets(self.client, {
+            reverse('dashboard'): 15,
+            reverse('vehicle_list'): 5,
+            reverse('event_list'): 7,
+            reverse('maintenance_schedule_list'): 6,
+            reverse('todo_list'): 6,
+        }, max_repeats=self.MAX_REPEATS)
+
+    def test_exports(self):
+        assert_url_budgets(self.client, {
+            reverse('export_data', args=['vehicles']): 7,
+            reverse('export_data', args=['maintenance']): 5,
+            reverse('export_data_with_pk', args=['vehicle', self.vehicle.pk]): 6,
+        }, max_repeats=self.MAX_REPEATS)
+
+    def test_api(self):
+        assert_url_budgets(self.client, {
+            '/api/v1/vehicles/': 7,
+            '/api/v1/events/': 5,
+            '/api/v1/locations/': 5,
+            '/api/v1/todos/': 6,
+            '/api/v1/maintenance-schedules/': 5,
+            '/api/v1/maintenance-categories/': 5,
+        }, max_repeats=self.MAX_REPEATS)
+
+
+class VehicleImageRenderTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+
+    def test_failed_render_retries_then_fails(self):
+        self.car.image = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        self.car.save()
+        job = Job.objects.get(name='vehicles.render_image')
+
+        # Each failed attempt goes back to the queue with the image pending
+        claimed = jobs.claim('test-worker')
+        self.assertFalse(jobs.run(claimed))
+        job.refresh_from_db()
+        self.car.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertEqual(self.car.image_status, 'pending')
+
+        self.run_due_jobs()
+        job.refresh_from_db()
+        self.car.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', job.max_attempts))
+        self.assertEqual(self.car.image_status, 'failed')
+        self.assertIn('could not be processed', vehicle_image(self.car))
+
+        call_command('process_vehicle_images', '--failed', stdout=StringIO())
+        self.car.refresh_from_db()
+        # Still unreadable, so rendering inline marks it failed again
+        self.assertEqual(self.car.image_status, 'failed')
+
+
+class VehicleReportTests(TrackerTestCase):
+    def test_efficiency_labelled_by_vehicle_type(self):
+        start = date.today() - timedelta(days=30)
+        self.fill_up(self.car, start, 1300)
+        self.fill_up(self.boat, start, 10)
+        self.fill_up(self.boat, start + timedelta(days=7), 20)
+        self.fill_up(self.boat, start + timedelta(days=14), 25)
+
+        car = build_report(self.car)
+        self.assertEqual((car['avg_mpg'], car['avg_gph']), (30.0, None))
+        # Boats record gallons per hour, never MPG
+        boat = build_report(self.boat)
+        self.assertEqual((boat['avg_mpg'], boat['avg_gph']), (None, 1.5))
+
+
+class ConditionalGetTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.location = Location.objects.create(name='Harbor Fuel', family=self.family, created_by=self.user)
+        self.category = MaintenanceCategory.objects.create(name='Impeller')
+        self.event = Event.objects.create(
+            vehicle=self.boat, created_by=self.user, event_type='maintenance', date=date.today(),
+            hours=Decimal('20'), location=self.location, maintenance_category=self.category,
+        )
+        self.urls = [reverse('event_detail', args=[self.event.pk]), reverse('vehicle_detail', args=[self.boat.pk])]
+
+    def assertRevalidates(self, change, name):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Timestamps are compared to the second
+        Event.objects.filter(pk=self.event.pk).update(updated_at=timezone.now() - timedelta(seconds=5))
+        Vehicle.objects.filter(pk=self.boat.pk).update(updated_at=timezone.now() - timedelta(seconds=5))
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        change()
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+        if name is not None:
+            self.assertContains(self.client.get(self.urls[0]), name)
+
+    def test_location_renamed(self):
+        self.location.name = 'Marina Fuel Dock'
+        self.assertRevalidates(self.location.save, None)
+
+    def test_category_renamed(self):
+        self.category.name = 'Raw Water Impeller'
+        self.assertRevalidates(self.category.save, 'Raw Water Impeller')
+
+    def test_location_deleted(self):
+        self.assertRevalidates(self.location.delete, None)
+
+
+class EfficiencyTests(TrackerTestCase):
+    """Stored MPG / GPH as the LAG() recompute in tracker.efficiency leaves them"""
+
+    def efficiency(self, *events):
+        values = []
+        for event in events:
+            event.refresh_from_db()
+            values.append((event.milespergallon, event.gallonsperhour))
+        return values
+
+    def test_first_fill_up_counts_from_starting_mileage(self):
+        first = self.fill_up(self.car, date(2025, 1, 1), 1300)
+        self.assertEqual(self.efficiency(first), [(Decimal('30.00'), None)])
+
+    def test_back_dated_insert_delete_and_edit(self):
+        first = self.fill_up(self.car, date(2025, 1, 1), 1300)
+        last = self.fill_up(self.car, date(2025, 1, 21), 1600)
+        self.assertEqual(self.efficiency(last), [(Decimal('30.00'), None)])
+
+        # The later fill-up now counts from the back-dated one
+        middle = self.fill_up(self.car, date(2025, 1, 11), 1450)
+        self.assertEqual(self.efficiency(first, middle, last),
+                         [(Decimal('30.00'), None), (Decimal('15.00'), None), (Decimal('15.00'), None)])
+
+        middle.delete()
+        self.assertEqual(self.efficiency(last), [(Decimal('30.00'), None)])
+
+        first.miles = Decimal('1400')
+        first.save()
+        self.assertEqual(self.efficiency(first, last), [(Decimal('40.00'), None), (Decimal('20.00'), None)])
+
+    def test_non_car_gets_gallons_per_hour(self):
+        first = self.fill_up(self.boat, date(2025, 1, 1), 10)
+        second = self.fill_up(self.boat, date(2025, 1, 8), 15, gallons='12')
+        # No earlier reading for the first; 12 gallons over 5 hours after it
+        self.assertEqual(self.efficiency(first, second), [(None, None), (None, Decimal('2.40'))])
+
+    def test_no_longer_a_fill_up_is_cleared(self):
+        first = self.fill_up(self.car, date(2025, 1, 1), 1300)
+        last = self.fill_up(self.car, date(2025, 1, 21), 1600)
+        first.event_type = 'outing'
+        first.save()
+        self.assertEqual(self.efficiency(first, last), [(None, None), (Decimal('60.00'), None)])
+
+    def test_recompute_repairs_stale_rows_from_since(self):
+        first = self.fill_up(self.car, date(2025, 1, 1), 1300)
+        last = self.fill_up(self.car, date(2025, 1, 21), 1600)
+        outing = Event.objects.create(vehicle=self.car, created_by=self.user, event_type='outing',
+                                      date=date(2025, 1, 25), miles=Decimal('1700'))
+        # update() skips the signals, leaving stale values behind
+        Event.objects.filter(pk__in=[first.pk, last.pk]).update(milespergallon=Decimal('99'))
+        Event.objects.filter(pk=outing.pk).update(milespergallon=Decimal('5'))
+
+        self.assertEqual(recompute_efficiency([self.car.pk], since=date(2025, 1, 10)), 2)
+        self.assertEqual(self.efficiency(first, last, outing),
+                         [(Decimal('99.00'), None), (Decimal('30.00'), None), (None, None)])
+        self.assertEqual(recompute_efficiency([self.car.pk]), 1)
+        self.assertEqual(recompute_efficiency([self.car.pk]), 0)
+
+
+@override_settings(JOB_RETRY_BACKOFF=30, JOB_RETRY_MAX_DELAY=60 * 60)
+class JobQueueTests(TestCase):
+    def claim_now(self, job):
+        """Make ``job`` due and claim it"""
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        claimed = jobs.claim('test-worker')
+        self.assertEqual(claimed.pk, job.pk)
+        return claimed
+
+    def test_key_collision_returns_active_job(self):
+        first = jobs.enqueue('tests.noop', key='noop:1', value=1)
+        self.assertEqual(jobs.enqueue('tests.noop', key='noop:1', value=2).pk, first.pk)
+        self.assertTrue(jobs.run(self.claim_now(first)))
+        # Running jobs hold their key too
+        running = jobs.enqueue('tests.noop', key='noop:1', value=3)
+        self.assertNotEqual(running.pk, first.pk)
+        self.claim_now(running)
+        self.assertEqual(jobs.enqueue('tests.noop', key='noop:1').pk, running.pk)
+        # Unkeyed jobs never collide
+        self.assertNotEqual(jobs.enqueue('tests.noop').pk, jobs.enqueue('tests.noop').pk)
+
+    def test_unknown_job(self):
+        with self.assertRaisesMessage(ValueError, "Unknown job 'tests.missing'"):
+            jobs.enqueue('tests.missing')
+
+    def test_debounce_pushes_back_then_uses_next_slot(self):
+        delay = timedelta(minutes=5)
+        first = jobs.debounce('tests.noop', 'noop:1', delay, value=1)
+        pushed = jobs.debounce('tests.noop', 'noop:1', delay, value=2)
+        self.assertEqual(pushed.pk, first.pk)
+        first.refresh_from_db()
+        self.assertGreater(first.run_at, timezone.now() + timedelta(minutes=4))
+        self.assertEqual(first.args, {'value': 2})
+
+        # Once it is running, changes queue a follow-up under :next
+        self.claim_now(first)
+        follow_up = jobs.debounce('tests.noop', 'noop:1', delay, value=3)
+        self.assertEqual(follow_up.key, 'noop:1:next')
+        self.assertEqual(jobs.debounce('tests.noop', 'noop:1', delay, value=4).pk, follow_up.pk)
+
+        # With both slots running, an unkeyed job still picks the change up
+        self.claim_now(follow_up)
+        fallback = jobs.debounce('tests.noop', 'noop:1', delay, value=5)
+        self.assertEqual((fallback.key, fallback.status, fallback.args), ('', 'queued', {'value': 5}))
+
+    def test_retries_with_backoff_then_fails(self):
+        job = jobs.enqueue('tests.fail', message='no luck')
+        self.assertEqual(job.max_attempts, 3)
+
+        for attempt, base in ((1, 30), (2, 60)):
+            claimed = self.claim_now(job)
+            self.assertEqual(claimed.attempts, attempt)
+            before = timezone.now()
+            self.assertFalse(jobs.run(claimed))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', attempt, ''))
+            self.assertIn('no luck', job.error)
+            # Exponential backoff with up to 20% jitter either way
+            self.assertGreaterEqual(job.run_at, before + timedelta(seconds=base * 0.8))
+            self.assertLessEqual(job.run_at, timezone.now() + timedelta(seconds=base * 1.2))
+            self.assertIsNone(jobs.claim('test-worker'))
+
+        self.assertFalse(jobs.run(self.claim_now(job)))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIn('RuntimeError: no luck', job.error)
+        self.assertIsNone(jobs.claim('test-worker'))
+
+    def test_claims_by_priority_then_run_at(self):
+        now = timezone.now()
+        low = jobs.enqueue('tests.noop', run_at=now - timedelta(minutes=5))
+        high = jobs.enqueue('tests.noop', run_at=now - timedelta(minutes=1), priority=5)
+        jobs.enqueue('tests.noop', run_at=now + timedelta(minutes=1))
+        self.assertEqual(jobs.claim('test-worker').pk, high.pk)
+        self.assertEqual(jobs.claim('test-worker').pk, low.pk)
+        self.assertIsNone(jobs.claim('test-worker'))
+
+    def test_requeue_stale_locks(self):
+        stale = self.claim_now(jobs.enqueue('tests.noop', key='noop:stale'))
+        spent = self.claim_now(jobs.enqueue('tests.noop', max_attempts=1))
+        fresh = self.claim_now(jobs.enqueue('tests.noop'))
+        Job.objects.filter(pk__in=[stale.pk, spent.pk]).update(
+            locked_at=timezone.now() - timedelta(minutes=20))
+
+        self.assertEqual(jobs.requeue_stale(timeout=15 * 60), 2)
+        for job in (stale, spent, fresh):
+            job.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by, stale.locked_at), ('queued', '', None))
+        self.assertEqual((spent.status, spent.attempts), ('failed', 1))
+        self.assertIn('Worker stopped', spent.error)
+        self.assertEqual((fresh.status, fresh.locked_by), ('running', 'test-worker'))
+
+        # The requeued job keeps its key and runs again
+        self.assertEqual(jobs.enqueue('tests.noop', key='noop:stale').pk, stale.pk)
+        claimed = jobs.claim('test-worker')
+        self.assertEqual((claimed.pk, claimed.attempts), (stale.pk, 2))
+        self.assertTrue(jobs.run(claimed))
+
+
+class RollupTests(TrackerTestCase):
+    def monthly(self, vehicle):
+        return list(VehicleMonthlyStats.objects.filter(vehicle=vehicle).order_by('month').values_list(
+            'month', 'distance', 'end_reading', 'gas_count', 'gallons', 'efficiency_total', 'efficiency_count',
+        ))
+
+    def test_totals_match_event_aggregates(self):
+        reading = 1000
+        for day in (date(2025, 1, 1), date(2025, 1, 15), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 14),
+                    date(2025, 2, 28), date(2025, 3, 1), date(2025, 3, 10), date(2025, 3, 31), date(2025, 4, 2)):
+            reading += 250
+            self.fill_up(self.car, day, reading)
+            Event.objects.create(vehicle=self.car, created_by=self.user, event_type='maintenance', date=day,
+                                 total_cost=Decimal('40.00'))
+            Event.objects.create(vehicle=self.car, created_by=self.user, event_type='outing',
+                                 date=day + timedelta(days=3), total_cost=Decimal('12.50'))
+        stats = VehicleMonthlyStats.objects.filter(vehicle=self.car)
+        events = Event.objects.filter(vehicle=self.car)
+
+        for start, end in (
+            (date(2025, 1, 15), date(2025, 3, 10)),  # mid-month to mid-month
+            (date(2025, 2, 5), date(2025, 2, 20)),  # inside one month
+            (date(2025, 2, 1), date(2025, 2, 28)),  # exactly one month
+            (date(2025, 1, 31), date(2025, 3, 31)),  # ends on the last day of a month
+            (date(2025, 1, 1), date(2025, 1, 31)),
+        ):
+            with self.subTest(start=start, end=end):
+                totals = stats_totals(stats, events, start, end)
+                expected = events.filter(date__gte=start, date__lte=end).aggregate(
+                    **{field: MONTH_AGGREGATES[field] for field in TOTAL_FIELDS})
+                for field in TOTAL_FIELDS:
+                    self.assertEqual(totals[field], expected[field] or 0, field)
+
+    def test_back_dated_event_refreshes_next_month(self):
+        self.fill_up(self.car, date(2025, 1, 10), 1300)
+        self.fill_up(self.car, date(2025, 2, 10), 1600)
+        self.assertEqual([row[1] for row in self.monthly(self.car)], [Decimal('300'), Decimal('300')])
+
+        inserted = self.fill_up(self.car, date(2025, 1, 25), 1450, gallons='5')
+        rows = self.monthly(self.car)
+        # February now counts from January's new last reading
+        self.assertEqual([row[1] for row in rows], [Decimal('450'), Decimal('150')])
+        # ...and its MPG from January's new last fill-up
+        self.assertEqual(rows[1][5], Decimal('15.00'))
+
+        inserted.delete()
+        self.assertEqual([row[1] for row in self.monthly(self.car)], [Decimal('300'), Decimal('300')])
+
+        # Refreshing as events change matches rebuilding from scratch
+        self.fill_up(self.car, date(2024, 12, 20), 1100)
+        refreshed = self.monthly(self.car)
+        rebuild_monthly_stats([self.car.pk])
+        self.assertEqual(self.monthly(self.car), refreshed)
+
+
+class EventImporterTests(TrackerTestCase):
+    CSV = [
+        'Vehicle,Type,Date,Reading,Gallons,Price,Category,Notes\n',
+        'Car,gas,2025-01-10,1300,10,3.50,,\n',
+        'Car,Gas Fill-up,01/10/2025,1300,10,3.50,,Same fill-up again\n',
+        'Car,gas,2025-01-05,1150,5,3.25,,Already tracked\n',
+        'Car,gas,not a date,1400,10,3.50,,\n',
+        'Truck,gas,2025-01-12,500,10,3.50,,\n',
+        'Car,gas,2025-01-20,1600,,3.50,,\n',
+        'Car,maintenance,2025-01-15,1400,,,Oil Change,Changed oil\n',
+        '\n',
+        'Car,maintenance,2025-01-16,1410,,,Tires,Rotated\n',
+        'Car,gas,2025-02-01,1450,5,3.00,,\n',
+        'Boat,gas,2025-01-10,12.5,8,4.00,,\n',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.fill_up(self.car, date(2025, 1, 5), 1150, gallons='5')
+        oil = MaintenanceCategory.objects.create(name='Oil Change')
+        tires = MaintenanceCategory.objects.create(name='Tires')
+        self.oil_schedule = MaintenanceSchedule.objects.create(
+            vehicle=self.car, maintenance_type=oil, name='Oil', interval_miles=5000, created_by=self.user,
+            last_performed=date(2024, 6, 1), last_miles=900)
+        # Recorded after the imported rotation, so the import mustn't move it back
+        self.tire_schedule = MaintenanceSchedule.objects.create(
+            vehicle=self.car, maintenance_type=tires, name='Tires', interval_miles=7500, created_by=self.user,
+            last_performed=date(2025, 6, 1), last_miles=2000)
+
+    def importer(self, **kwargs):
+        return EventImporter(self.user, [self.car, self.boat], **kwargs)
+
+    def test_counts_and_reports_rows(self):
+        result = self.importer().run(self.CSV)
+
+        self.assertEqual((result.imported, result.duplicates, result.rejected, result.total), (5, 2, 3, 10))
+        self.assertEqual(result.rejects, [
+            (5, "Invalid date 'not a date'"),
+            (6, "Unknown vehicle 'Truck'"),
+            (7, 'Gas fill-up without gallons'),
+        ])
+        # Against an earlier row of the file, then against an existing event
+        self.assertEqual([line for line, _ in result.duplicate_rows], [3, 4])
+        self.assertEqual(result.vehicle_ids, {self.car.pk, self.boat.pk})
+        self.assertEqual(Event.objects.filter(vehicle=self.car).count(), 5)
+
+    def test_batches_inserts(self):
+        with mock.patch.object(Event.objects, 'bulk_create', wraps=Event.objects.bulk_create) as bulk_create:
+            self.importer(batch_size=2).run(self.CSV)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1])
+
+    def test_dry_run_writes_nothing(self):
+        result = self.importer().run(self.CSV, dry_run=True)
+        self.assertEqual((result.imported, result.duplicates, result.rejected), (5, 2, 3))
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_updates_derived_data(self):
+        self.importer().run(self.CSV)
+
+        fill_ups = Event.objects.filter(vehicle=self.car, event_type='gas').order_by('date')
+        self.assertEqual([(e.milespergallon, e.total_cost) for e in fill_ups], [
+            (Decimal('30.00'), Decimal('17.50')),
+            (Decimal('15.00'), Decimal('35.00')),
+            (Decimal('30.00'), Decimal('15.00')),
+        ])
+        self.assertEqual(Event.objects.get(vehicle=self.boat).gallonsperhour, None)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.current_reading, Decimal('1450'))
+
+        self.oil_schedule.refresh_from_db()
+        self.tire_schedule.refresh_from_db()
+        self.assertEqual((self.oil_schedule.last_performed, self.oil_schedule.last_miles), (date(2025, 1, 15), 1400))
+        self.assertEqual((self.tire_schedule.last_performed, self.tire_schedule.last_miles), (date(2025, 6, 1), 2000))
+        self.assertEqual(VehicleMonthlyStats.objects.filter(vehicle=self.car).count(), 2)
+
+    def test_file_errors(self):
+        with self.assertRaisesMessage(EventImportError, 'Choose a vehicle or map a vehicle column'):
+            self.importer().run(['Date,Gallons\n', '2025-01-10,10\n'])
+        with self.assertRaisesMessage(EventImportError, 'No date column found'):
+            self.importer(vehicle=self.car).run(['Gallons\n', '10\n'])
+        with self.assertRaisesMessage(EventImportError, "Unknown column mapping 'other'"):
+            self.importer(vehicle=self.car, mapping='other').run(['Date\n'])
+
+
+class KeysetPaginationTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        # Several rows share each date, so pages split ties on id
+        for day in (date(2025, 1, 10), date(2025, 1, 5), date(2025, 1, 10), date(2025, 1, 1), date(2025, 1, 5),
+                    date(2025, 1, 10), date(2025, 1, 1)):
+            Event.objects.create(vehicle=self.car, created_by=self.user, event_type='outing', date=day)
+        self.events = Event.objects.filter(vehicle=self.car)
+        self.newest_first = list(self.events.order_by('-date', '-id').values_list('pk', flat=True))
+
+    def ids(self, page):
+        return [event.pk for event in page.object_list]
+
+    def test_forward_then_back(self):
+        pages = [keyset_paginate(self.events, 2)]
+        while pages[-1].has_next:
+            pages.append(keyset_paginate(self.events, 2, after=pages[-1].next_cursor))
+        self.assertEqual([len(page.object_list) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.newest_first)
+        self.assertEqual([(page.has_previous, page.has_next) for page in pages],
+                         [(False, True), (True, True), (True, True), (True, False)])
+
+        back = [pages[-1]]
+        while back[-1].has_previous:
+            back.append(keyset_paginate(self.events, 2, before=back[-1].previous_cursor))
+        back.reverse()
+        self.assertEqual([self.ids(page) for page in back], [self.ids(page) for page in pages])
+        self.assertEqual([(page.has_previous, page.has_next) for page in back],
+                         [(False, True), (True, True), (True, True), (True, False)])
+        self.assertIsNone(back[0].previous_cursor)
+        self.assertIsNone(pages[-1].next_cursor)
+
+    def test_invalid_cursor_shows_first_page(self):
+        first = self.ids(keyset_paginate(self.events, 3))
+        for cursor in ('', 'garbage', '2025-13-01.5', '2025-01-01.x', '2025-01-01'):
+            with self.subTest(cursor=cursor):
+                for direction in ('after', 'before'):
+                    page = keyset_paginate(self.events, 3, **{direction: cursor})
+                    self.assertEqual(self.ids(page), first)
+                    self.assertEqual((page.has_previous, page.has_next), (False, True))
+
+    def test_before_the_newest_row_is_empty(self):
+        newest = self.events.get(pk=self.newest_first[0])
+        page = keyset_paginate(self.events, 2, before=encode_cursor(newest))
+        self.assertEqual(page.object_list, [])
+        self.assertEqual((page.has_previous, page.has_next), (False, False))
+        self.assertIsNone(page.next_cursor)
+
+    def test_before_a_deleted_last_row(self):
+        oldest = self.events.get(pk=self.newest_first[-1])
+        cursor = encode_cursor(oldest)
+        oldest.delete()
+        page = keyset_paginate(self.events, 2, before=cursor)
+        self.assertEqual(self.ids(page), self.newest_first[-3:-1])
+        self.assertEqual((page.has_previous, page.has_next), (True, False))
+
+
+class ForecastTests(TrackerTestCase):
+    START = date(2025, 1, 1)
+
+    def log_readings(self, vehicle, readings):
+        """``readings`` maps days after START to a reading"""
+        reading_field = vehicle.get_reading_field()
+        for day, reading in readings.items():
+            Event.objects.create(vehicle=vehicle, created_by=self.user, event_type='outing',
+                                 date=self.START + timedelta(days=day), **{reading_field: Decimal(str(reading))})
+        vehicle.refresh_from_db()
+
+    def schedule(self, **fields):
+        category = MaintenanceCategory.objects.create(name=f'Service {MaintenanceCategory.objects.count()}')
+        return MaintenanceSchedule(vehicle=self.car, maintenance_type=category, name='Service',
+                                   created_by=self.user, **fields)
+
+    def test_fits_least_squares_slope(self):
+        # 40 miles a day, off by 0, 6, -3 and 3 miles: the offsets cancel out
+        # of the slope but not of the first-to-last difference (40.1 a day)
+        self.log_readings(self.car, {0: 1000, 10: 1406, 20: 1797, 30: 2203})
+        self.log_readings(self.boat, {0: 10, 20: 20, 40: 30})
+        other = Vehicle.objects.create(family=self.family, name='Other', make='Make', model='Model',
+                                       year=2020, type='other')
+        # Too few readings
+        self.log_readings(other, {0: 5, 30: 50})
+
+        self.assertEqual(fit_usage_rates([self.car, self.boat, other]),
+                         {self.car.pk: Decimal('40.000'), self.boat.pk: Decimal('0.500')})
+
+    def test_fit_ignores_readings_outside_window(self):
+        # Far outside FORECAST_USAGE_DAYS of the latest reading
+        self.log_readings(self.car, {-400: 10, 0: 1000, 10: 1300, 20: 1600})
+        self.assertEqual(fit_usage_rates([self.car]), {self.car.pk: Decimal('30.000')})
+
+    def test_fit_needs_a_span_and_no_negative_rates(self):
+        self.log_readings(self.car, {0: 1000, 5: 1100, 10: 1200})
+        self.assertEqual(fit_usage_rates([self.car]), {})
+        self.log_readings(self.boat, {0: 30, 10: 20, 20: 10})
+        self.assertEqual(fit_usage_rates([self.boat]), {self.boat.pk: Decimal('0.000')})
+
+    def test_project_picks_earliest_due_date(self):
+        self.car.usage_rate = Decimal('40')
+        self.car.current_reading = Decimal('2200')
+        self.car.current_reading_date = self.START
+        performed = self.START - timedelta(days=30)
+
+        # 800 miles left at 40 a day is 20 days, before the 90 day interval
+        schedule = self.schedule(interval_days=90, interval_miles=1000, last_performed=performed, last_miles=2000)
+        self.assertEqual(project(schedule, self.car), (self.START + timedelta(days=20), 'miles'))
+        # A partial day rounds up
+        schedule.last_miles = 2001
+        self.assertEqual(project(schedule, self.car), (self.START + timedelta(days=21), 'miles'))
+        schedule.interval_days = 40
+        self.assertEqual(project(schedule, self.car), (self.START + timedelta(days=10), 'days'))
+        # Already past the interval: when it ran out
+        schedule.interval_days, schedule.last_miles = 90, 800
+        self.assertEqual(project(schedule, self.car), (self.START - timedelta(days=10), 'miles'))
+
+        self.car.usage_rate = None
+        self.assertEqual(project(schedule, self.car), (performed + timedelta(days=90), 'days'))
+        schedule.last_performed = None
+        self.assertEqual(project(schedule, self.car), (None, ''))
+
+    def test_update_forecasts_stores_rate_and_due_date(self):
+        self.log_readings(self.car, {0: 1000, 10: 1400, 20: 1800, 30: 2200})
+        schedule = self.schedule(interval_miles=1000, last_performed=self.START, last_miles=2000)
+        schedule.save()
+
+        self.assertEqual(update_forecasts([self.car.pk]), (1, 1))
+        self.car.refresh_from_db()
+        schedule.refresh_from_db()
+        self.assertEqual(self.car.usage_rate, Decimal('40.000'))
+        self.assertEqual((schedule.forecast_due_date, schedule.forecast_basis),
+                         (self.START + timedelta(days=50), 'miles'))
+        self.assertEqual(update_forecasts([self.car.pk]), (0, 0))
+
+
+class IntegrityTests(TrackerTestCase):
+    TODAY = date(2025, 6, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.fill_up(self.car, date(2025, 1, 1), 1300)
+        self.last = self.fill_up(self.car, date(2025, 1, 20), 1600)
+        self.fill_up(self.boat, date(2025, 1, 1), 10)
+        self.fill_up(self.boat, date(2025, 1, 20), 15, gallons='12')
+
+    def outing(self, vehicle, day, **fields):
+        return Event.objects.create(vehicle=vehicle, created_by=self.user, event_type='outing', date=day, **fields)
+
+    def anomalies(self, *checks):
+        _, found = check_vehicles([self.car.pk, self.boat.pk], checks or CHECKS, today=self.TODAY)
+        return [(anomaly['check'], anomaly['event_id']) for anomaly in found], found
+
+    def test_clean_history(self):
+        self.assertEqual(check_vehicles([self.car.pk, self.boat.pk], today=self.TODAY), (4, []))
+
+    def test_wrong_unit(self):
+        hours_on_car = self.outing(self.car, date(2025, 1, 10), hours=Decimal('5'))
+        miles_on_boat = self.outing(self.boat, date(2025, 1, 10), miles=Decimal('12'))
+        # Both set is fine
+        self.outing(self.car, date(2025, 1, 11), miles=Decimal('1400'), hours=Decimal('2'))
+        found, details = self.anomalies('wrong_unit')
+        self.assertEqual(found, [('wrong_unit', hours_on_car.pk), ('wrong_unit', miles_on_boat.pk)])
+        self.assertEqual((details[0]['value'], details[0]['fixable']), (5.0, True))
+
+    def test_reading_backwards(self):
+        backwards = self.outing(self.car, date(2025, 1, 25), miles=Decimal('1500'))
+        found, details = self.anomalies('reading_backwards')
+        self.assertEqual(found, [('reading_backwards', backwards.pk)])
+        self.assertEqual((details[0]['reading'], details[0]['previous'], details[0]['fixable']),
+                         (1500.0, 1600.0, False))
+
+    def test_duplicate_fill_up(self):
+        duplicate = self.fill_up(self.car, date(2025, 1, 20), 1600)
+        # Same day and reading but a different amount isn't a duplicate
+        self.fill_up(self.car, date(2025, 1, 20), 1600, gallons='2')
+        found, details = self.anomalies('duplicate_fill_up')
+        self.assertEqual(found, [('duplicate_fill_up', duplicate.pk)])
+        self.assertEqual(details[0]['duplicate_of'], self.last.pk)
+
+    def test_efficiency_mismatch(self):
+        Event.objects.filter(pk=self.first.pk).update(milespergallon=Decimal('99'))
+        # GPH has no place on a car
+        Event.objects.filter(pk=self.last.pk).update(gallonsperhour=Decimal('1'))
+        found, details = self.anomalies('efficiency_mismatch')
+        self.assertEqual(found, [('efficiency_mismatch', self.first.pk), ('efficiency_mismatch', self.last.pk)])
+        self.assertEqual((details[0]['stored'], details[0]['expected']), (99.0, 30.0))
+
+    def test_future_date(self):
+        future = self.outing(self.car, self.TODAY + timedelta(days=1))
+        self.outing(self.car, self.TODAY)
+        self.assertEqual(self.anomalies('future_date')[0], [('future_date', future.pk)])
+
+    def test_fix(self):
+        miles_on_boat = self.outing(self.boat, date(2025, 1, 10), miles=Decimal('12'))
+        duplicate = self.fill_up(self.car, date(2025, 1, 20), 1600)
+        backwards = self.outing(self.car, date(2025, 1, 25), miles=Decimal('1500'))
+        Event.objects.filter(pk=self.first.pk).update(milespergallon=Decimal('99'))
+
+        out = StringIO()
+        call_command('check_event_integrity', '--fix', '--workers', '1', '--format', 'jsonl', stdout=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[-1]['summary']['fixed'],
+                         {'wrong_unit': 1, 'duplicate_fill_up': 1, 'efficiency_mismatch': 1})
+        self.assertEqual(len(lines), 5)
+
+        miles_on_boat.refresh_from_db()
+        self.assertEqual((miles_on_boat.miles, miles_on_boat.hours), (None, Decimal('12')))
+        self.assertFalse(Event.objects.filter(pk=duplicate.pk).exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.milespergallon, Decimal('30.00'))
+        # Left for a person to sort out
+        self.assertEqual(self.anomalies()[0], [('reading_backwards', backwards.pk)])
+
+
+class GeoTests(SimpleTestCase):
+    CENTRES = [
+        (51.5, -0.12),
+        (45.0, -90.0),  # on a cell boundary at every precision
+        (0.0, 0.0),  # where all four top-level cells meet
+        (cell_size(6)[0] * 300, cell_size(6)[1] * 200),  # a precision 6 cell corner
+        (-36.85, 179.999),  # the antimeridian, from either side
+        (64.2, -179.995),
+        (89.95, 10.0),  # near a pole
+    ]
+    RADII = (0.05, 1, 5, 25, 150)
+
+    def points_around(self, rng, latitude, longitude, radius):
+        """Random points up to twice ``radius`` away, some exactly on its edge"""
+        lat_delta = radius / MILES_PER_DEGREE
+        lon_delta = lat_delta / max(math.cos(math.radians(latitude)), 0.01)
+        points = []
+        for index in range(300):
+            lat = min(90.0, max(-90.0, latitude + rng.uniform(-2, 2) * lat_delta))
+            lon = (longitude + rng.uniform(-2, 2) * lon_delta + 180.0) % 360.0 - 180.0
+            points.append((index, lat, lon))
+        for index, angle in enumerate(range(0, 360, 30), start=len(points)):
+            lat = latitude + math.sin(math.radians(angle)) * lat_delta * 0.999
+            lon = longitude + math.cos(math.radians(angle)) * lon_delta * 0.999
+            points.append((index, min(90.0, max(-90.0, lat)), (lon + 180.0) % 360.0 - 180.0))
+        return points
+
+    def test_cells_and_haversine_match_full_scan(self):
+        rng = random.Random(4)
+        for latitude, longitude in self.CENTRES:
+            for radius in self.RADII:
+                with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                    points = self.points_around(rng, latitude, longitude, radius)
+                    cells = covering_cells(latitude, longitude, radius)
+                    candidates = [point for point in points if encode(point[1], point[2]).startswith(tuple(cells))]
+                    expected = nearest(points, latitude, longitude, radius, len(points))
+                    self.assertEqual(nearest(candidates, latitude, longitude, radius, len(points)), expected)
+                    self.assertTrue(expected)
+
+    def test_covering_cells_stay_few(self):
+        for latitude, longitude in self.CENTRES:
+            for radius in self.RADII:
+                cells = covering_cells(latitude, longitude, radius)
+                self.assertLessEqual(len(cells), 9)
+        # Cells small enough that a short radius doesn't scan a region
+        self.assertEqual(len(covering_cells(51.5, -0.12, 0.05)[0]), 7)
+
+    def test_nearest_orders_and_limits(self):
+        rows = [(1, 51.51, -0.12), (2, 51.5, -0.121), (3, 52.5, -0.12)]
+        found = nearest(rows, 51.5, -0.12, 5, limit=5)
+        self.assertEqual([row[0] for _, row in found], [2, 1])
+        self.assertAlmostEqual(found[1][0], 0.691, places=2)
+        self.assertEqual(len(nearest(rows, 51.5, -0.12, 5, limit=1)), 1)
+
+
+class DownsampleTests(SimpleTestCase):
+    def series(self, values, start=date(2025, 1, 1)):
+        series = Series()
+        for offset, value in enumerate(values):
+            series.append(start + timedelta(days=offset), value)
+        return series
+
+    def test_keeps_ends_and_respects_max_points(self):
+        rng = random.Random(11)
+        for length in (5, 10, 99, 100, 101, 1000, 2503):
+            values = [rng.uniform(0, 100) for _ in range(length)]
+            series = self.series(values)
+            for max_points in (3, 4, 10, 99, 500):
+                if max_points >= length:
+                    continue
+                with self.subTest(length=length, max_points=max_points):
+                    indices = list(lttb_indices(series.x, series.y, max_points))
+                    self.assertEqual(len(indices), max_points)
+                    self.assertEqual((indices[0], indices[-1]), (0, length - 1))
+                    self.assertEqual(indices, sorted(set(indices)))
+
+                    reduced = series.downsample(max_points)
+                    self.assertEqual(len(reduced), max_points)
+                    self.assertEqual(list(reduced.y), [values[index] for index in indices])
+                    self.assertEqual((reduced.x[0], reduced.x[-1]), (series.x[0], series.x[-1]))
+
+    def test_short_series_unchanged(self):
+        series = self.series([3.0, 1.0, 2.0])
+        for max_points in (3, 4, 1000, None, 0):
+            self.assertIs(series.downsample(max_points), series)
+        self.assertEqual(list(lttb_indices(series.x, series.y, 2)), [0, 1, 2])
+        self.assertEqual(series.as_chart(unit='MPG'), {
+            'labels': ['2025-01-01', '2025-01-02', '2025-01-03'], 'data': [3.0, 1.0, 2.0], 'unit': 'MPG',
+        })
+
+    def test_keeps_peaks(self):
+        values = [10.0] * 500
+        values[137], values[402] = 80.0, -40.0
+        reduced = self.series(values).downsample(20)
+        self.assertIn(80.0, reduced.y)
+        self.assertIn(-40.0, reduced.y)
+
+    @override_settings(CHART_MAX_POINTS=500)
+    def test_parse_max_points(self):
+        self.assertEqual([parse_max_points(value) for value in (None, '', 'abc', '1', '50', '9999')],
+                         [500, 500, 500, 3, 50, 500])
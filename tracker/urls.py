@@ -1,7 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from . import api
 
+router = DefaultRouter()
+router.register('vehicles', api.VehicleViewSet, basename='api-vehicle')
+router.register('events', api.EventViewSet, basename='api-event')
+router.register('locations', api.LocationViewSet, basename='api-location')
+router.register('todos', api.TodoItemViewSet, basename='api-todo')
+router.register('maintenance-schedules', api.MaintenanceScheduleViewSet, basename='api-maintenance-schedule')
+router.register('maintenance-categories', api.MaintenanceCategoryViewSet, basename='api-maintenance-category')
 
 urlpatterns = [
     # Landing page (no navbar, login/register options)
@@ -33,6 +41,7 @@ urlpatterns = [
     path('events/maintenance/create/', views.MaintenanceCreateView.as_view(), name='maintenance_create'),
     path('events/gas/create/', views.GasCreateView.as_view(), name='gas_create'),
     path('events/outing/create/', views.OutingCreateView.as_view(), name='outing_create'),
+    path('events/import/', views.EventImportView.as_view(), name='event_import'),
     path('events/<int:pk>/', views.EventDetailView.as_view(), name='event_detail'),
     path('events/<int:pk>/update/', views.EventUpdateView.as_view(), name='event_update'),
     path('events/<int:pk>/delete/', views.EventDeleteView.as_view(), name='event_delete'),
@@ -52,9 +61,15 @@ urlpatterns = [
     path('locations/<int:pk>/update/', views.LocationUpdateView.as_view(), name='location_update'),
     path('locations/<int:pk>/delete/', views.LocationDeleteView.as_view(), name='location_delete'),
     
+    # Search
+    path('search/', views.SearchView.as_view(), name='search'),
+    
     # Reports
     path('reports/', views.ReportsView.as_view(), name='reports'),
+    path('reports/fuel/', views.FuelAnalyticsView.as_view(), name='fuel_analytics'),
     path('reports/vehicle/<int:pk>/', views.VehicleReportView.as_view(), name='vehicle_report'),
+    path('reports/vehicle/<int:pk>/jobs/<int:job_id>/', views.VehicleReportStatusView.as_view(),
+         name='vehicle_report_status'),
     
     # Maintenance Schedules
     path('maintenance-schedules/', views.MaintenanceScheduleListView.as_view(), name='maintenance_schedule_list'),
@@ -66,8 +81,14 @@ urlpatterns = [
     path('export/<str:type>/', views.ExportDataView.as_view(), name='export_data'),
     path('export/<str:type>/<int:pk>/', views.ExportDataView.as_view(), name='export_data_with_pk'),
     
+    # REST API
+    path('api/v1/', include(router.urls)),
+    
     # API URLs for charts and data
     path('api/vehicles/<int:pk>/', views.VehicleDetailAPIView.as_view(), name='vehicle_detail_api'),
+    path('api/fuel-analytics/', views.FuelAnalyticsAPIView.as_view(), name='fuel_analytics_api'),
+    path('api/locations/nearby/', views.LocationNearbyAPIView.as_view(), name='location_nearby_api'),
+    path('api/vehicle/<int:vehicle_id>/charts/', views.vehicle_charts_api, name='vehicle_charts_api'),
     path('api/vehicle/<int:vehicle_id>/events/', views.vehicle_events_api, name='vehicle_events_api'),
     path('api/vehicle/<int:vehicle_id>/mileage/', views.vehicle_mileage_api, name='vehicle_mileage_api'),
     path('api/vehicle/<int:vehicle_id>/fuel-efficiency/', views.vehicle_fuel_efficiency_api, name='vehicle_fuel_efficiency_api'),
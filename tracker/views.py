@@ -1,28 +1,55 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.views import LogoutView
 from django.contrib.auth.models import User
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, View
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic.edit import FormView
 from django.contrib import messages
 from django.db.models import Sum, Count, Avg, F, Q
 from datetime import datetime, timedelta
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.conf import settings
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
+from asgiref.sync import sync_to_async
+import csv
+import io
 import os
-from .models import Vehicle, Event, Location, TodoItem, MaintenanceCategory, MaintenanceSchedule, Family
+import zlib
+from .models import (Vehicle, Event, Location, TodoItem, MaintenanceCategory, MaintenanceSchedule, Family,
+                     VehicleMonthlyStats, Job)
+from . import cache as family_cache
+from . import geo
+from .pagination import keyset_paginate
 from .forms import (VehicleForm, MaintenanceEventForm, GasEventForm, 
                   OutingEventForm, TodoItemForm, LocationForm, UserRegisterForm,
-                  FamilyForm, FamilyMemberForm,MaintenanceScheduleForm)
+                  FamilyForm, FamilyMemberForm,MaintenanceScheduleForm, EventImportForm)
+from .importer import EventImporter, EventImportError
+from .conditional import ConditionalGetMixin, avehicle_state, vehicle_state, event_state
+from .rollups import PERIODS, period_breakdown, stats_totals
+from .reports import JOB_NAME as REPORT_JOB, get_report, report_context
+from .search import search
+from .fuel import PRICE_WINDOW, ROLLING_WINDOW, fuel_analytics
+from .downsample import parse_max_points
+from .charts import parse_series, avehicle_chart_data
 
 import logging
 logger = logging.getLogger('tracker')
 
+# How far ahead the dashboard lists maintenance projected to come due
+UPCOMING_MAINTENANCE_DAYS = 60
+
+def parse_date_param(value):
+    """Parse a YYYY-MM-DD query parameter, returning None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
 def landing_page_view(request):
     logger.debug(f"Request headers: {request.headers}")
     logger.debug(f"Request META: {request.META}")
@@ -36,99 +63,133 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         user = self.request.user
         
         # Get all families the user belongs to
-        user_families = user.families.all()
+        access = self.request.access
+        family_ids = sorted(access.family_ids)
         
         # Get all vehicles in these families
-        vehicles = Vehicle.objects.filter(family__in=user_families)
+        vehicle_ids = access.vehicle_ids
         
-        # Get all locations in these families
-        locations = Location.objects.filter(family__in=user_families)
-        
-        # Get counts for dashboard
-        context['family_count'] = user_families.count()
-        context['vehicle_count'] = vehicles.count()
-        context['location_count'] = locations.count()  # Added location count
+        # Counts and cost aggregates are cached per family version, so they
+        # are only recomputed after one of the user's families changes
+        today = timezone.now().date()
+        context.update(family_cache.get_or_build(
+            'dashboard', family_ids,
+            lambda: self.build_stats(family_ids, today),
+            today,
+        ))
         
         # Get recent events
         context['recent_events'] = Event.objects.filter(
-            vehicle__in=vehicles
-        ).order_by('-date')[:5]
+            vehicle__in=vehicle_ids
+        ).select_related('vehicle').order_by('-date')[:5]
         
         # Get upcoming to-do items
         context['todo_items'] = TodoItem.objects.filter(
-            Q(vehicle__in=vehicles) | Q(shared_with=user),
+            Q(vehicle__in=vehicle_ids) | Q(shared_with=user),
             completed=False
-        ).order_by('due_date')[:5]
+        ).select_related('vehicle').order_by('due_date')[:5]
         
         # Get maintenance due
-        maintenance_due = []
-        for vehicle in vehicles:
-            for schedule in vehicle.maintenance_schedules.filter(is_active=True):
-                if schedule.is_due():
-                    maintenance_due.append({
-                        'vehicle': vehicle,
-                        'schedule': schedule,
-                    })
-        
-        context['maintenance_due'] = maintenance_due[:5]
+        due_schedules = MaintenanceSchedule.objects.due().filter(
+            vehicle__in=vehicle_ids
+        ).select_related('vehicle', 'maintenance_type').order_by('vehicle', 'name')[:5]
+        
+        context['maintenance_due'] = due_schedules
+        
+        # Not yet due, soonest first; the dates are projected ahead of time
+        # by tracker.forecast
+        context['maintenance_upcoming'] = MaintenanceSchedule.objects.filter(
+            vehicle__in=vehicle_ids,
+            is_active=True,
+            forecast_due_date__gt=today,
+            forecast_due_date__lte=today + timedelta(days=UPCOMING_MAINTENANCE_DAYS),
+        ).select_related('vehicle').order_by('forecast_due_date', 'id')[:5]
+        
+        # The events and maintenance cards are cached as rendered fragments
+        # under the same family versions; their querysets stay lazy so a
+        # cache hit never runs them
+        context['fragment_version'] = family_cache.family_cache_key('dashboard_fragments', family_ids, today)
+        return context
+    
+    def build_stats(self, family_ids, today):
+        """Compute the cacheable dashboard aggregates for the given families"""
+        vehicles = Vehicle.objects.filter(family__in=family_ids)
+        events = Event.objects.filter(vehicle__family__in=family_ids)
         
         # Get statistics for the last 30 days
-        thirty_days_ago = timezone.now().date() - timedelta(days=30)
-        
-        # Total maintenance cost in last 30 days
-        maintenance_cost = Event.objects.filter(
-            vehicle__in=vehicles,
-            event_type='maintenance',
-            date__gte=thirty_days_ago
-        ).aggregate(total=Sum('total_cost'))['total'] or 0
-        
-        # Total gas cost in last 30 days
-        gas_cost = Event.objects.filter(
-            vehicle__in=vehicles,
-            event_type='gas',
-            date__gte=thirty_days_ago
-        ).aggregate(total=Sum('total_cost'))['total'] or 0
-        
-        context['maintenance_cost'] = maintenance_cost
-        context['gas_cost'] = gas_cost
-        context['total_cost'] = maintenance_cost + gas_cost
+        thirty_days_ago = today - timedelta(days=30)
+        costs = events.filter(date__gte=thirty_days_ago).aggregate(
+            maintenance=Sum('total_cost', filter=Q(event_type='maintenance')),
+            gas=Sum('total_cost', filter=Q(event_type='gas')),
+        )
+        maintenance_cost = costs['maintenance'] or 0
+        gas_cost = costs['gas'] or 0
         
         # Get events by type for pie chart
-        events_by_type = Event.objects.filter(
-            vehicle__in=vehicles
-        ).values('event_type').annotate(count=Count('id')).order_by('-count')
-        
-        context['events_by_type'] = events_by_type
-        
-        # Get families with their vehicle count and location count
-        families_with_counts = []
-        for family in user_families:
-            families_with_counts.append({
-                'family': family,
-                'vehicle_count': family.vehicles.count(),
-                'location_count': family.locations.count(),  # Added location count
-                'member_count': family.members.count(),
-            })
-            
-        context['families'] = families_with_counts
-        return context
+        events_by_type = list(
+            events.values('event_type').annotate(count=Count('id')).order_by('-count')
+        )
+        
+        # Get families with their vehicle, location and member counts
+        families = Family.objects.filter(id__in=family_ids).annotate(
+            vehicle_count=Count('vehicles', distinct=True),
+            location_count=Count('locations', distinct=True),
+            member_count=Count('members', distinct=True),
+        ).order_by('id')
+        families_with_counts = [{
+            'family': {'id': family.id, 'name': family.name},
+            'vehicle_count': family.vehicle_count,
+            'location_count': family.location_count,
+            'member_count': family.member_count,
+        } for family in families]
+        
+        return {
+            'family_count': len(family_ids),
+            'vehicle_count': vehicles.count(),
+            'location_count': Location.objects.filter(family__in=family_ids).count(),
+            'maintenance_cost': maintenance_cost,
+            'gas_cost': gas_cost,
+            'total_cost': maintenance_cost + gas_cost,
+            'events_by_type': events_by_type,
+            'families': families_with_counts,
+        }
+    
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for views with async handlers"""
     
+    async def dispatch(self, request, *args, **kwargs):
+        # request.user would load the user synchronously; resolve it here
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
 class FamilyMemberRequiredMixin(UserPassesTestMixin):
+    def get_object(self, queryset=None):
+        # test_func and the view itself both need the object; fetch it once
+        if queryset is None and getattr(self, '_member_object', None) is not None:
+            return self._member_object
+        obj = super().get_object(queryset)
+        if queryset is None:
+            self._member_object = obj
+        return obj
+    
     def test_func(self):
+        access = self.request.access
         # For views with pk in kwargs (for Family objects)
         if 'pk' in self.kwargs:
             obj = self.get_object()
-            if hasattr(obj, 'family'):
+            if hasattr(obj, 'family_id'):
                 # For Vehicle objects
-                return self.request.user.families.filter(id=obj.family.id).exists()
+                return access.has_family(obj.family_id)
             elif isinstance(obj, Family):
                 # For Family objects
-                return self.request.user.families.filter(id=obj.id).exists()
+                return access.has_family(obj.id)
             
         # For views with family_id in kwargs
         if 'family_id' in self.kwargs:
             family_id = self.kwargs.get('family_id')
-            return self.request.user.families.filter(id=family_id).exists()
+            return access.has_family(int(family_id))
             
         return False
 
@@ -139,7 +200,16 @@ class FamilyListView(LoginRequiredMixin, ListView):
     template_name = 'tracker/family_list.html'
     
     def get_queryset(self):
-        return self.request.user.families.all()
+        return self.request.access.families().annotate(
+            member_count=Count('members', distinct=True),
+            vehicle_count=Count('vehicles', distinct=True),
+        )
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Cards are cached as fragments keyed by family version
+        context['family_versions'] = family_cache.get_family_versions(self.request.access.family_ids)
+        return context
 
 class FamilyDetailView(LoginRequiredMixin, FamilyMemberRequiredMixin, DetailView):
     model = Family
@@ -148,7 +218,7 @@ class FamilyDetailView(LoginRequiredMixin, FamilyMemberRequiredMixin, DetailView
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        family = self.get_object()
+        family = self.object
         context['vehicles'] = family.vehicles.all()
         context['locations'] = family.locations.all()  # Added locations
         context['members'] = family.members.all()
@@ -293,18 +363,18 @@ class VehicleListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         # Get vehicles from all families the user belongs to
-        user_families = self.request.user.families.all()
-        return Vehicle.objects.filter(family__in=user_families)
+        return self.request.access.vehicles()
 
 
-class VehicleDetailView(LoginRequiredMixin, FamilyMemberRequiredMixin, DetailView):
+class VehicleDetailView(LoginRequiredMixin, FamilyMemberRequiredMixin, ConditionalGetMixin, DetailView):
     model = Vehicle
+    state_func = vehicle_state
     context_object_name = 'vehicle'
     template_name = 'tracker/vehicle_detail.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        vehicle = self.get_object()
+        vehicle = self.object
         context['events'] = vehicle.events.order_by('-date')[:5]
         context['todo_items'] = vehicle.todo_items.filter(completed=False)
         return context
@@ -357,25 +427,96 @@ class VehicleDeleteView(LoginRequiredMixin, FamilyMemberRequiredMixin, DeleteVie
         return super().delete(request, *args, **kwargs)
     
 class EventListView(LoginRequiredMixin, ListView):
+    """
+    Newest-first event history, keyset paginated on (date, id).
+    
+    Filters: ``vehicle``, ``type``, ``category``, ``days`` (last N days) and
+    ``start_date`` / ``end_date``. ``after`` / ``before`` carry the page cursor.
+    """
     model = Event
     context_object_name = 'events'
     template_name = 'tracker/event_list.html'
+    page_size = 25
+    filter_params = ('vehicle', 'type', 'category', 'days', 'start_date', 'end_date')
+    
+    def get_vehicles(self):
+        if not hasattr(self, '_vehicles'):
+            self._vehicles = list(self.request.access.vehicles().order_by('name'))
+        return self._vehicles
     
     def get_queryset(self):
         # Get events from all vehicles in families the user belongs to
-        user_families = self.request.user.families.all()
-        vehicles = Vehicle.objects.filter(family__in=user_families)
-        return Event.objects.filter(vehicle__in=vehicles).order_by('-date')
+        params = self.request.GET
+        vehicle_ids = [vehicle.id for vehicle in self.get_vehicles()]
+        
+        # Narrowing to one vehicle keeps the scan on the (vehicle, ...) indexes
+        vehicle_id = params.get('vehicle')
+        if vehicle_id and vehicle_id.isdigit() and int(vehicle_id) in vehicle_ids:
+            vehicle_ids = [int(vehicle_id)]
+        
+        events = Event.objects.filter(vehicle__in=vehicle_ids)
+        
+        event_type = params.get('type')
+        if event_type in dict(Event.EVENT_TYPES):
+            events = events.filter(event_type=event_type)
+        
+        category = params.get('category')
+        if category and category.isdigit():
+            events = events.filter(maintenance_category_id=category)
+        
+        days = params.get('days')
+        if days and days.isdigit():
+            try:
+                events = events.filter(date__gte=timezone.now().date() - timedelta(days=int(days)))
+            except OverflowError:
+                # Reaches back past date.min; ignored like an unparsable date
+                pass
+        start_date = parse_date_param(params.get('start_date'))
+        if start_date:
+            events = events.filter(date__gte=start_date)
+        end_date = parse_date_param(params.get('end_date'))
+        if end_date:
+            events = events.filter(date__lte=end_date)
+        
+        return events.select_related('vehicle', 'maintenance_category', 'location')
+    
+    def get_context_data(self, **kwargs):
+        page = keyset_paginate(
+            self.object_list, self.page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        kwargs['object_list'] = page.object_list
+        context = super().get_context_data(**kwargs)
+        
+        # Page links keep the active filters
+        filters = self.request.GET.copy()
+        for key in list(filters):
+            if key not in self.filter_params or not filters[key]:
+                del filters[key]
+        
+        context.update({
+            'page': page,
+            'filter_query': filters.urlencode(),
+            'filters': {key: self.request.GET.get(key, '') for key in self.filter_params},
+            'vehicles': self.get_vehicles(),
+            'categories': MaintenanceCategory.objects.order_by('name'),
+        })
+        return context
 
-class EventDetailView(LoginRequiredMixin, DetailView):
+class EventDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Event
+    state_func = event_state
     context_object_name = 'event'
     template_name = 'tracker/event_detail.html'
     
+    def get_queryset(self):
+        return Event.objects.filter(vehicle__in=self.request.access.vehicle_ids)
+    
     def test_func(self):
         event = self.get_object()
         # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=event.vehicle.family.id).exists()
+        return self.request.access.has_vehicle(event.vehicle_id)
 
 class EventCreateView(LoginRequiredMixin, TemplateView):
     template_name = 'tracker/event_type_select.html'
@@ -493,8 +634,11 @@ class EventUpdateView(LoginRequiredMixin, UpdateView):
     model = Event
     template_name = 'tracker/event_form.html'
     
+    def get_queryset(self):
+        return Event.objects.filter(vehicle__in=self.request.access.vehicle_ids)
+    
     def get_form_class(self):
-        event = self.get_object()
+        event = self.object
         if event.event_type == 'maintenance':
             return MaintenanceEventForm
         elif event.event_type == 'gas':
@@ -509,7 +653,7 @@ class EventUpdateView(LoginRequiredMixin, UpdateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        event = self.get_object()
+        event = self.object
         context['event_type'] = event.event_type
         context['event'] = event
         return context
@@ -522,12 +666,15 @@ class EventUpdateView(LoginRequiredMixin, UpdateView):
     def test_func(self):
         event = self.get_object()
         # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=event.vehicle.family.id).exists()
+        return self.request.access.has_vehicle(event.vehicle_id)
 
 class EventDeleteView(LoginRequiredMixin, DeleteView):
     model = Event
     template_name = 'tracker/event_confirm_delete.html'
     
+    def get_queryset(self):
+        return Event.objects.filter(vehicle__in=self.request.access.vehicle_ids)
+    
     def get_success_url(self):
         return reverse_lazy('vehicle_detail', kwargs={'pk': self.object.vehicle.pk})
     
@@ -539,7 +686,7 @@ class EventDeleteView(LoginRequiredMixin, DeleteView):
     def test_func(self):
         event = self.get_object()
         # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=event.vehicle.family.id).exists()
+        return self.request.access.has_vehicle(event.vehicle_id)
 
 class TodoPermissionMixin:
     """Mixin to handle consistent permissions for TodoItem views"""
@@ -549,19 +696,16 @@ class TodoPermissionMixin:
         return TodoItem.objects.filter(
             Q(created_by=self.request.user) | 
             Q(shared_with=self.request.user) |
-            Q(vehicle__family__members=self.request.user)
+            Q(vehicle__in=self.request.access.vehicle_ids)
         ).distinct()
     
     def has_permission(self, todo_item):
         """Check if user has permission for a specific todo item"""
-        # Get the vehicle's family (if the todo is associated with a vehicle)
-        vehicle_family = todo_item.vehicle.family if todo_item.vehicle else None
-        
-        # Check the permission cases
-        is_family_member = vehicle_family and self.request.user.families.filter(id=vehicle_family.id).exists()
-        return (todo_item.created_by == self.request.user or 
-                self.request.user in todo_item.shared_with.all() or
-                is_family_member)
+        # Check the permission cases, cheapest first
+        is_family_member = todo_item.vehicle_id is not None and self.request.access.has_vehicle(todo_item.vehicle_id)
+        return (todo_item.created_by_id == self.request.user.pk or 
+                is_family_member or
+                todo_item.shared_with.filter(pk=self.request.user.pk).exists())
     
     def has_change_permission(self, todo_item):
         """Check if user can modify a todo item (toggle, update, delete)"""
@@ -591,8 +735,11 @@ class TodoListView(LoginRequiredMixin, TodoPermissionMixin, ListView):
     template_name = 'tracker/todo_list.html'
     
     def get_queryset(self):
-        # Use the mixin's get_queryset and add ordering
-        return super().get_queryset().order_by('completed', '-created_at')
+        # Use the mixin's get_queryset and add ordering; the template shows
+        # each todo's vehicle and who it is shared with
+        return super().get_queryset().select_related('vehicle').prefetch_related('shared_with').order_by(
+            'completed', '-created_at'
+        )
 
 class TodoDetailView(LoginRequiredMixin, TodoPermissionMixin, DetailView):
     model = TodoItem
@@ -678,8 +825,15 @@ class LocationListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         # Get all locations in families the user belongs to
-        user_families = self.request.user.families.all()
-        return Location.objects.filter(family__in=user_families)
+        return Location.objects.filter(
+            family__in=self.request.access.family_ids
+        ).select_related('family', 'created_by')
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Cards are cached as fragments keyed by family version
+        context['family_versions'] = family_cache.get_family_versions(self.request.access.family_ids)
+        return context
 
 class LocationDetailView(LoginRequiredMixin, DetailView):
     model = Location
@@ -688,8 +842,7 @@ class LocationDetailView(LoginRequiredMixin, DetailView):
     
     def get_queryset(self):
         # Get all locations in families the user belongs to
-        user_families = self.request.user.families.all()
-        return Location.objects.filter(family__in=user_families)
+        return Location.objects.filter(family__in=self.request.access.family_ids)
 
 class LocationCreateView(LoginRequiredMixin, CreateView):
     model = Location
@@ -700,7 +853,7 @@ class LocationCreateView(LoginRequiredMixin, CreateView):
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
         # Limit family choices to only families the user belongs to
-        form.fields['family'].queryset = self.request.user.families.all()
+        form.fields['family'].queryset = self.request.access.families()
         return form
     
     def form_valid(self, form):
@@ -717,13 +870,12 @@ class LocationUpdateView(LoginRequiredMixin, UpdateView):
     
     def get_queryset(self):
         # Get all locations in families the user belongs to
-        user_families = self.request.user.families.all()
-        return Location.objects.filter(family__in=user_families)
+        return Location.objects.filter(family__in=self.request.access.family_ids)
     
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
         # Limit family choices to only families the user belongs to
-        form.fields['family'].queryset = self.request.user.families.all()
+        form.fields['family'].queryset = self.request.access.families()
         return form
     
     def form_valid(self, form):
@@ -737,8 +889,7 @@ class LocationDeleteView(LoginRequiredMixin, DeleteView):
     
     def get_queryset(self):
         # Get all locations in families the user belongs to
-        user_families = self.request.user.families.all()
-        return Location.objects.filter(family__in=user_families)
+        return Location.objects.filter(family__in=self.request.access.family_ids)
     
     def delete(self, request, *args, **kwargs):
         messages.success(request, 'Location deleted successfully!')
@@ -754,6 +905,17 @@ class LocationDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(request, 'Location deleted successfully!')
         return super().delete(request, *args, **kwargs)
 
+class SearchView(LoginRequiredMixin, TemplateView):
+    """Full-text search over the user's events, todos and locations"""
+    template_name = 'tracker/search.html'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+        context['results'] = search(self.request.user, self.request.access, query) if query else []
+        return context
+
 class ReportsView(LoginRequiredMixin, TemplateView):
     template_name = 'tracker/reports.html'
     
@@ -761,8 +923,7 @@ class ReportsView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Get all vehicles in families the user belongs to
-        user_families = self.request.user.families.all()
-        vehicles = Vehicle.objects.filter(family__in=user_families)
+        vehicles = self.request.access.vehicles()
         
         # Get vehicle types and count
         vehicle_types = {}
@@ -773,115 +934,130 @@ class ReportsView(LoginRequiredMixin, TemplateView):
             else:
                 vehicle_types[vehicle_type] = 1
         
-        # Get maintenance and gas event counts and costs
-        maintenance_events = Event.objects.filter(
-            vehicle__in=vehicles,
-            event_type='maintenance'
-        )
+        # Counts and costs come from the monthly rollup rather than raw events
+        stats = VehicleMonthlyStats.objects.filter(vehicle__in=vehicles)
+        totals = stats_totals(stats)
         
-        gas_events = Event.objects.filter(
-            vehicle__in=vehicles,
-            event_type='gas'
-        )
-        
-        # Calculate maintenance statistics
-        maintenance_count = maintenance_events.count()
-        maintenance_cost = maintenance_events.aggregate(
-            total=Sum('total_cost')
-        )['total'] or 0
-        
-        # Calculate gas statistics
-        gas_count = gas_events.count()
-        gas_cost = gas_events.aggregate(
-            total=Sum('total_cost')
-        )['total'] or 0
+        # Fleet totals by month, quarter or year, newest first
+        period = self.request.GET.get('period')
+        if period not in PERIODS:
+            period = 'year'
+        breakdown = period_breakdown(stats, period)
+        breakdown.reverse()
         
         # Get due maintenance schedules
-        due_maintenance = []
-        for vehicle in vehicles:
-            for schedule in vehicle.maintenance_schedules.filter(is_active=True):
-                if schedule.is_due():
-                    due_maintenance.append(schedule)
+        due_maintenance = MaintenanceSchedule.objects.due().filter(
+            vehicle__in=vehicles
+        ).select_related('vehicle').order_by('vehicle', 'name')
         
         # Add all data to context
         context['vehicles'] = vehicles
         context['vehicle_types'] = vehicle_types
-        context['maintenance_count'] = maintenance_count
-        context['maintenance_cost'] = maintenance_cost
-        context['gas_count'] = gas_count
-        context['gas_cost'] = gas_cost
+        context['maintenance_count'] = totals['maintenance_count']
+        context['maintenance_cost'] = totals['maintenance_cost']
+        context['gas_count'] = totals['gas_count']
+        context['gas_cost'] = totals['gas_cost']
         context['due_maintenance'] = due_maintenance
+        context['period'] = period
+        context['breakdown'] = breakdown
         
         return context
 
+def fuel_analytics_scope(request, access):
+    """
+    The family ids a fuel analytics request covers: ``?family=`` when it is
+    one of the user's families, otherwise all of them. None when the
+    requested family isn't the user's.
+    """
+    family_id = request.GET.get('family')
+    if not family_id:
+        return access.family_ids
+    try:
+        family_id = int(family_id)
+    except ValueError:
+        return None
+    return {family_id} if access.has_family(family_id) else None
+
+class FuelAnalyticsView(LoginRequiredMixin, TemplateView):
+    """Fuel prices by station, efficiency percentiles and outlier fill-ups across the fleet"""
+    template_name = 'tracker/fuel_analytics.html'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        access = self.request.access
+        family_ids = fuel_analytics_scope(self.request, access)
+        if family_ids is None:
+            family_ids = access.family_ids
+        start_date = parse_date_param(self.request.GET.get('start_date'))
+        end_date = parse_date_param(self.request.GET.get('end_date'))
+        
+        analytics = fuel_analytics(family_ids, start_date, end_date)
+        context.update(analytics)
+        context.update({
+            'families': access.families().order_by('name'),
+            'family_id': self.request.GET.get('family', ''),
+            'start_date': start_date.isoformat() if start_date else '',
+            'end_date': end_date.isoformat() if end_date else '',
+            'rolling_window': ROLLING_WINDOW,
+            'price_window': PRICE_WINDOW,
+        })
+        return context
+
 class VehicleReportView(LoginRequiredMixin, DetailView):
     model = Vehicle
     template_name = 'tracker/vehicle_report.html'
     context_object_name = 'vehicle'
     
+    def get_queryset(self):
+        return self.request.access.vehicles()
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        vehicle = self.get_object()
+        vehicle = self.object
         
         # Date range filtering
-        start_date = self.request.GET.get('start_date')
-        end_date = self.request.GET.get('end_date')
-        
-        events = Event.objects.filter(vehicle=vehicle)
-        
-        if start_date:
-            events = events.filter(date__gte=start_date)
-        
-        if end_date:
-            events = events.filter(date__lte=end_date)
-        
-        # Group events by type
-        maintenance_events = events.filter(event_type='maintenance')
-        gas_events = events.filter(event_type='gas')
-        outing_events = events.filter(event_type='outing')
-        
-        # Calculate statistics
-        total_maintenance_cost = maintenance_events.aggregate(Sum('total_cost'))['total_cost__sum'] or 0
-        total_gas_cost = gas_events.aggregate(Sum('total_cost'))['total_cost__sum'] or 0
-        
-        # Calculate MPG
-        mpg_data = []
-        for event in gas_events.order_by('date'):
-            mpg = event.get_mpg()
-            if mpg:
-                mpg_data.append({
-                    'date': event.date.strftime('%Y-%m-%d'),
-                    'mpg': float(mpg),  # Convert to float to ensure JSON serialization
-                })
-        
-        # Convert mpg_data to a JSON string
-        import json
-        mpg_data_json = json.dumps(mpg_data)
-        
-        # Calculate average MPG
-        if mpg_data:
-            avg_mpg = sum(item['mpg'] for item in mpg_data) / len(mpg_data)
+        start_date = parse_date_param(self.request.GET.get('start_date'))
+        end_date = parse_date_param(self.request.GET.get('end_date'))
+        
+        period = self.request.GET.get('period')
+        if period not in PERIODS:
+            period = 'month'
+        
+        # Served from the stored report while the vehicle's data is unchanged;
+        # otherwise built now, or by a job the page polls for large ranges
+        report, job = get_report(vehicle, start_date, end_date, user=self.request.user)
+        if report is not None:
+            context.update(report_context(report, period))
         else:
-            avg_mpg = 0
+            context['report_job'] = job
         
         context.update({
-            'maintenance_events': maintenance_events,
-            'gas_events': gas_events,
-            'outing_events': outing_events,
-            'total_maintenance_cost': total_maintenance_cost,
-            'total_gas_cost': total_gas_cost,
-            'total_cost': total_maintenance_cost + total_gas_cost,
-            'avg_mpg': avg_mpg,
-            'mpg_data': mpg_data_json,  # Now a properly formatted JSON string
-            'start_date': start_date,
-            'end_date': end_date,
+            'start_date': start_date.isoformat() if start_date else '',
+            'end_date': end_date.isoformat() if end_date else '',
+            'period': period,
+            'period_choices': [('month', 'Month'), ('quarter', 'Quarter'), ('year', 'Year')],
         })
         return context
+
+
+class VehicleReportStatusView(AsyncLoginRequiredMixin, View):
+    """Progress of a vehicle report build, polled by the report page"""
     
-    def test_func(self):
-        vehicle = self.get_object()
-        # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=vehicle.family.id).exists()
+    async def get(self, request, pk, job_id):
+        access = await request.aaccess()
+        if not access.has_vehicle(pk):
+            return JsonResponse({'error': 'Vehicle not found or access denied'}, status=404)
+        
+        job = await Job.objects.filter(pk=job_id, name=REPORT_JOB, args__vehicle_id=pk).afirst()
+        if job is None:
+            return JsonResponse({'error': 'Report job not found'}, status=404)
+        
+        return JsonResponse({
+            'status': job.status,
+            'progress': job.progress,
+            'done': job.status == 'succeeded',
+            'failed': job.status in ('failed', 'cancelled'),
+        })
 
 class MaintenanceScheduleListView(LoginRequiredMixin, ListView):
     model = MaintenanceSchedule
@@ -890,28 +1066,25 @@ class MaintenanceScheduleListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         # Get all vehicles in families the user belongs to
-        user_families = self.request.user.families.all()
-        vehicles = Vehicle.objects.filter(family__in=user_families)
-        
         return MaintenanceSchedule.objects.filter(
-            vehicle__in=vehicles,
+            vehicle__in=self.request.access.vehicle_ids,
             is_active=True
-        ).order_by('vehicle', 'name')
+        ).with_due_status().select_related('vehicle', 'maintenance_type').order_by('vehicle', 'name')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        schedules = self.get_queryset()
+        # Evaluate once; every schedule carries its due status annotations
+        schedules = list(context['object_list'])
         
         # Find due schedules
-        due_schedules = [schedule for schedule in schedules if schedule.is_due()]
+        due_schedules = [schedule for schedule in schedules if schedule.due_now]
         
         # Group by vehicle
-        user_families = self.request.user.families.all()
-        vehicles = Vehicle.objects.filter(family__in=user_families)
-        vehicle_schedules = {}
+        vehicles = self.request.access.vehicles()
+        vehicle_schedules = {vehicle: [] for vehicle in vehicles}
         
-        for vehicle in vehicles:
-            vehicle_schedules[vehicle] = schedules.filter(vehicle=vehicle)
+        for schedule in schedules:
+            vehicle_schedules[schedule.vehicle].append(schedule)
         
         context.update({
             'due_schedules': due_schedules,
@@ -951,6 +1124,9 @@ class MaintenanceScheduleUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'tracker/maintenance_schedule_form.html'
     success_url = reverse_lazy('maintenance_schedule_list')
     
+    def get_queryset(self):
+        return MaintenanceSchedule.objects.filter(vehicle__in=self.request.access.vehicle_ids)
+    
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
@@ -963,13 +1139,16 @@ class MaintenanceScheduleUpdateView(LoginRequiredMixin, UpdateView):
     def test_func(self):
         schedule = self.get_object()
         # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=schedule.vehicle.family.id).exists()
+        return self.request.access.has_vehicle(schedule.vehicle_id)
 
 class MaintenanceScheduleDeleteView(LoginRequiredMixin, DeleteView):
     model = MaintenanceSchedule
     template_name = 'tracker/maintenance_schedule_confirm_delete.html'
     success_url = reverse_lazy('maintenance_schedule_list')
     
+    def get_queryset(self):
+        return MaintenanceSchedule.objects.filter(vehicle__in=self.request.access.vehicle_ids)
+    
     def delete(self, request, *args, **kwargs):
         messages.success(request, 'Maintenance schedule deleted successfully!')
         return super().delete(request, *args, **kwargs)
@@ -977,208 +1156,273 @@ class MaintenanceScheduleDeleteView(LoginRequiredMixin, DeleteView):
     def test_func(self):
         schedule = self.get_object()
         # Check if user is in the family that owns the vehicle
-        return self.request.user.families.filter(id=schedule.vehicle.family.id).exists()
+        return self.request.access.has_vehicle(schedule.vehicle_id)
+
+
+def stream_csv(header, rows, compress=False, chunk_size=64 * 1024):
+    """
+    Yield CSV output for ``rows`` in chunks of roughly ``chunk_size`` bytes,
+    optionally gzip-compressed. Only one chunk is held in memory at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 produces a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    
+    def drain():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+    
+    # Send the header straight away so the download starts immediately
+    if header:
+        writer.writerow(header)
+    yield drain()
+    
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            chunk = drain()
+            if chunk:
+                yield chunk
+    
+    chunk = drain()
+    if chunk:
+        yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+class EventImportView(LoginRequiredMixin, FormView):
+    """Upload a CSV of historical fill-ups, maintenance and outings"""
+    form_class = EventImportForm
+    template_name = 'tracker/event_import.html'
+    
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+    
+    def form_valid(self, form):
+        user = self.request.user
+        vehicles = self.request.access.vehicles()
+        importer = EventImporter(
+            user, vehicles,
+            vehicle=form.cleaned_data['vehicle'],
+            mapping=form.cleaned_data['format'] or None,
+            default_event_type=form.cleaned_data['event_type'],
+        )
+        dry_run = form.cleaned_data['dry_run']
+        
+        upload = form.cleaned_data['csv_file']
+        try:
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            result = importer.run(lines, dry_run=dry_run)
+        except (EventImportError, UnicodeDecodeError, csv.Error) as e:
+            form.add_error('csv_file', f"Couldn't import this file: {e}")
+            return self.form_invalid(form)
+        except Exception as e:
+            logger.error(f"Error importing events for {user}: {e}")
+            form.add_error(None, "The import failed. No events were saved.")
+            return self.form_invalid(form)
+        
+        if dry_run:
+            messages.info(self.request, f"{result.imported} of {result.total} rows are ready to import.")
+        elif result.imported:
+            messages.success(self.request, f"Imported {result.imported} events.")
+        else:
+            messages.warning(self.request, "No events were imported.")
+        
+        return self.render_to_response(self.get_context_data(form=form, result=result, dry_run=dry_run))
 
 
 class ExportDataView(LoginRequiredMixin, View):
+    """
+    Stream data as CSV.
+    
+    Optional query parameters: ``start_date`` / ``end_date`` (YYYY-MM-DD),
+    ``event_type`` and ``gzip=1`` for a compressed download.
+    """
+    chunk_size = 2000
+    
     def get(self, request, type, pk=None):
         """Export data to CSV format"""
-        import csv
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{type}_export.csv"'
-        
-        writer = csv.writer(response)
-        
         # Get all vehicles in families the user belongs to
-        user_families = self.request.user.families.all()
-        vehicles = Vehicle.objects.filter(family__in=user_families)
+        access = self.request.access
+        vehicles = access.vehicles()
+        
+        # Event filters shared by every export type
+        event_type_labels = dict(Event.EVENT_TYPES)
+        event_lookups = {}
+        start_date = parse_date_param(request.GET.get('start_date'))
+        end_date = parse_date_param(request.GET.get('end_date'))
+        event_type = request.GET.get('event_type')
+        if start_date:
+            event_lookups['date__gte'] = start_date
+        if end_date:
+            event_lookups['date__lte'] = end_date
+        if event_type in event_type_labels:
+            event_lookups['event_type'] = event_type
+        event_filter = Q(**event_lookups)
         
         if type == 'vehicle' and pk:
             # Export single vehicle data
             vehicle = get_object_or_404(Vehicle, pk=pk)
             
             # Ensure user has access to this vehicle
-            if vehicle.family not in user_families:
+            if not access.has_vehicle(vehicle.pk):
                 return redirect('reports')
             
-            # Header row
-            writer.writerow(['Event Type', 'Date', 'Miles/Hours', 'Category', 'Location', 'Cost', 'Notes'])
+            header = ['Event Type', 'Date', 'Miles/Hours', 'Category', 'Location', 'Cost', 'Notes']
+            distance_field = 'miles' if vehicle.type == 'car' else 'hours'
             
-            # Data rows
-            events = Event.objects.filter(vehicle=vehicle).order_by('date')
-            for event in events:
-                distance = event.miles if vehicle.type == 'car' else event.hours
-                category = event.maintenance_category.name if event.maintenance_category else ''
-                location = event.location.name if event.location else ''
-                cost = event.total_cost if event.total_cost else ''
-                
-                writer.writerow([
-                    event.get_event_type_display(),
-                    event.date.strftime('%Y-%m-%d'),
+            events = Event.objects.filter(event_filter, vehicle=vehicle).order_by('date', 'id').values_list(
+                'event_type', 'date', distance_field, 'maintenance_category__name',
+                'location__name', 'total_cost', 'notes',
+            )
+            rows = (
+                [
+                    event_type_labels.get(kind, kind),
+                    date.strftime('%Y-%m-%d'),
                     distance,
-                    category,
-                    location,
-                    cost,
-                    event.notes
-                ])
+                    category or '',
+                    location or '',
+                    cost if cost else '',
+                    notes,
+                ]
+                for kind, date, distance, category, location, cost, notes
+                in events.iterator(chunk_size=self.chunk_size)
+            )
         
         elif type == 'vehicles':
             # Export all vehicle summary
-            writer.writerow(['Name', 'Make', 'Model', 'Year', 'Type', 'Total Events'])
+            header = ['Name', 'Make', 'Model', 'Year', 'Type', 'Total Events']
+            vehicle_type_labels = dict(Vehicle.TYPE_CHOICES)
             
-            for vehicle in vehicles:
-                event_count = Event.objects.filter(vehicle=vehicle).count()
-                
-                writer.writerow([
-                    vehicle.name,
-                    vehicle.make,
-                    vehicle.model,
-                    vehicle.year,
-                    vehicle.get_type_display(),
-                    event_count
-                ])
+            # Apply the shared filters to the counted events
+            count_filter = Q(**{f'events__{lookup}': value for lookup, value in event_lookups.items()})
+            summary = vehicles.order_by('id').annotate(
+                event_count=Count('events', filter=count_filter)
+            ).values_list('name', 'make', 'model', 'year', 'type', 'event_count')
+            rows = (
+                [name, make, model, year, vehicle_type_labels.get(vehicle_type, vehicle_type), event_count]
+                for name, make, model, year, vehicle_type, event_count
+                in summary.iterator(chunk_size=self.chunk_size)
+            )
         
         elif type == 'maintenance':
             # Export maintenance records
-            writer.writerow(['Vehicle', 'Date', 'Category', 'Miles/Hours', 'Cost', 'Notes'])
+            header = ['Vehicle', 'Date', 'Category', 'Miles/Hours', 'Cost', 'Notes']
             
             events = Event.objects.filter(
+                event_filter,
                 vehicle__in=vehicles,
                 event_type='maintenance'
-            ).select_related('vehicle', 'maintenance_category').order_by('date')
-            
-            for event in events:
-                distance = event.miles if event.vehicle.type == 'car' else event.hours
-                category = event.maintenance_category.name if event.maintenance_category else ''
-                
-                writer.writerow([
-                    str(event.vehicle),
-                    event.date.strftime('%Y-%m-%d'),
-                    category,
-                    distance,
-                    event.total_cost if event.total_cost else '',
-                    event.notes
-                ])
+            ).order_by('date', 'id').values_list(
+                'vehicle__year', 'vehicle__make', 'vehicle__model', 'vehicle__name', 'vehicle__type',
+                'date', 'maintenance_category__name', 'miles', 'hours', 'total_cost', 'notes',
+            )
+            rows = (
+                [
+                    f"{year} {make} {model} ({name})",
+                    date.strftime('%Y-%m-%d'),
+                    category or '',
+                    miles if vehicle_type == 'car' else hours,
+                    cost if cost else '',
+                    notes,
+                ]
+                for year, make, model, name, vehicle_type, date, category, miles, hours, cost, notes
+                in events.iterator(chunk_size=self.chunk_size)
+            )
         
+        else:
+            header, rows = [], iter(())
+        
+        compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+        response = StreamingHttpResponse(
+            stream_csv(header, rows, compress=compress),
+            content_type='application/gzip' if compress else 'text/csv',
+        )
+        filename = f"{type}_export.csv" + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
 
 # API Views for charts and data
-class VehicleEventsApiView(LoginRequiredMixin, View):
-    def get(self, request, vehicle_id):
+class VehicleChartsApiView(AsyncLoginRequiredMixin, ConditionalGetMixin, View):
+    """
+    Every chart series for a vehicle in one response, built from one pass
+    over its events. ``?series=`` picks series (comma separated), ``?start=``
+    and ``?end=`` limit the dates and ``?max_points=`` bounds line series.
+    Async, so concurrent chart loads don't each hold a worker under ASGI.
+    """
+    state_func = avehicle_state
+    # Set on the single-series endpoints, which return just that series
+    series = None
+    
+    async def get(self, request, vehicle_id):
         # Get vehicle and check access
-        user_families = request.user.families.all()
-        vehicle = get_object_or_404(Vehicle, pk=vehicle_id)
-        
-        if vehicle.family not in user_families:
+        vehicle = await aget_object_or_404(Vehicle, pk=vehicle_id)
+        access = await request.aaccess()
+        if not access.has_vehicle(vehicle.pk):
             return JsonResponse({'error': 'Access denied'}, status=403)
         
-        # Get events and format for chart
-        events = Event.objects.filter(vehicle=vehicle).values('event_type').annotate(count=Count('id'))
+        if self.series:
+            series = (self.series,)
+        else:
+            try:
+                series = parse_series(request.GET.get('series'))
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
         
-        # Format data for charts
-        data = {
-            'labels': [event['event_type'] for event in events],
-            'data': [event['count'] for event in events],
-        }
+        if self.series == 'fuel_efficiency' and vehicle.type != 'car':
+            return JsonResponse({'error': 'Not applicable for this vehicle type'}, status=400)
         
-        return JsonResponse(data)
+        data = await avehicle_chart_data(
+            vehicle,
+            series,
+            start=parse_date_param(request.GET.get('start')),
+            end=parse_date_param(request.GET.get('end')),
+            max_points=parse_max_points(request.GET.get('max_points')),
+        )
+        return JsonResponse(data[self.series] if self.series else data)
 
 
-class VehicleMileageApiView(LoginRequiredMixin, View):
-    def get(self, request, vehicle_id):
-        # Get vehicle and check access
-        user_families = request.user.families.all()
-        vehicle = get_object_or_404(Vehicle, pk=vehicle_id)
-        
-        if vehicle.family not in user_families:
-            return JsonResponse({'error': 'Access denied'}, status=403)
-        
-        # Get events with mileage/hours data
-        if vehicle.type == 'car':
-            events = Event.objects.filter(
-                vehicle=vehicle, 
-                miles__isnull=False
-            ).order_by('date').values('date', 'miles')
-            
-            # Format data for charts
-            data = {
-                'labels': [event['date'].strftime('%Y-%m-%d') for event in events],
-                'data': [float(event['miles']) for event in events],
-                'unit': 'miles',
-            }
-        else:
-            events = Event.objects.filter(
-                vehicle=vehicle, 
-                hours__isnull=False
-            ).order_by('date').values('date', 'hours')
-            
-            # Format data for charts
-            data = {
-                'labels': [event['date'].strftime('%Y-%m-%d') for event in events],
-                'data': [float(event['hours']) for event in events],
-                'unit': 'hours',
-            }
-        
-        return JsonResponse(data)
+class VehicleEventsApiView(VehicleChartsApiView):
+    series = 'events'
 
 
-class VehicleFuelEfficiencyApiView(LoginRequiredMixin, View):
-    def get(self, request, vehicle_id):
-        # Get vehicle and check access
-        user_families = request.user.families.all()
-        vehicle = get_object_or_404(Vehicle, pk=vehicle_id)
-        
-        if vehicle.family not in user_families:
-            return JsonResponse({'error': 'Access denied'}, status=403)
-        
-        # Only for cars
-        if vehicle.type != 'car':
-            return JsonResponse({'error': 'Not applicable for this vehicle type'}, status=400)
-        
-        # Get gas events
-        gas_events = Event.objects.filter(
-            vehicle=vehicle,
-            event_type='gas',
-            gallons__isnull=False
-        ).order_by('date')
-        
-        # Calculate MPG for each event
-        mpg_data = []
-        for event in gas_events:
-            mpg = event.get_mpg()
-            if mpg:
-                mpg_data.append({
-                    'date': event.date.strftime('%Y-%m-%d'),
-                    'mpg': mpg,
-                })
-        
-        # Format data for charts
-        data = {
-            'labels': [item['date'] for item in mpg_data],
-            'data': [item['mpg'] for item in mpg_data],
-        }
-        
-        return JsonResponse(data)
+class VehicleMileageApiView(VehicleChartsApiView):
+    series = 'mileage'
+
+
+class VehicleFuelEfficiencyApiView(VehicleChartsApiView):
+    series = 'fuel_efficiency'
+
+
+async def vehicle_charts_api(request, vehicle_id):
+    """Function-based view for consistency with the single-series endpoints"""
+    view = VehicleChartsApiView.as_view()
+    return await view(request, vehicle_id=vehicle_id)
 
 
-def vehicle_events_api(request, vehicle_id):
+async def vehicle_events_api(request, vehicle_id):
     """Function-based view for backward compatibility"""
     view = VehicleEventsApiView.as_view()
-    return view(request, vehicle_id=vehicle_id)
+    return await view(request, vehicle_id=vehicle_id)
 
 
-def vehicle_mileage_api(request, vehicle_id):
+async def vehicle_mileage_api(request, vehicle_id):
     """Function-based view for backward compatibility"""
     view = VehicleMileageApiView.as_view()
-    return view(request, vehicle_id=vehicle_id)
+    return await view(request, vehicle_id=vehicle_id)
 
 
-def vehicle_fuel_efficiency_api(request, vehicle_id):
+async def vehicle_fuel_efficiency_api(request, vehicle_id):
     """Function-based view for backward compatibility"""
     view = VehicleFuelEfficiencyApiView.as_view()
-    return view(request, vehicle_id=vehicle_id)
+    return await view(request, vehicle_id=vehicle_id)
 
 
 def register(request):
@@ -1206,20 +1450,25 @@ def service_worker(request):
     return HttpResponse(content, content_type='application/javascript')
 
 
-def health_check(request):
-    """Health check endpoint for monitoring"""
+def _check_database():
     from django.db import connection
+    
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+async def health_check(request):
+    """Health check endpoint for monitoring"""
     from django.conf import settings
-    from redis import Redis
+    from redis.asyncio import Redis
     import socket
     
-    # Check database connection
+    # Check database connection (there is no async cursor; run it in a thread)
     db_ok = True
     db_error = None
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
+        await sync_to_async(_check_database)()
     except Exception as e:
         db_ok = False
         db_error = str(e)
@@ -1229,7 +1478,10 @@ def health_check(request):
     redis_error = None
     try:
         redis_client = Redis.from_url(settings.CACHES['default']['LOCATION'])
-        redis_client.ping()
+        try:
+            await redis_client.ping()
+        finally:
+            await redis_client.aclose()
     except Exception as e:
         redis_ok = False
         redis_error = str(e)
@@ -1314,15 +1566,17 @@ class CustomLogoutView(LogoutView):
     next_page = reverse_lazy('landing_page')
 
 
-class VehicleDetailAPIView(LoginRequiredMixin, APIView):
+class VehicleDetailAPIView(AsyncLoginRequiredMixin, ConditionalGetMixin, View):
     """
     API endpoint to get vehicle details (for JavaScript)
     """
-    def get(self, request, pk):
+    state_func = avehicle_state
+    
+    async def get(self, request, pk):
         try:
             # Check if user has access to this vehicle
-            user_families = request.user.families.all()
-            vehicle = Vehicle.objects.get(pk=pk, family__in=user_families)
+            access = await request.aaccess()
+            vehicle = await access.vehicles().aget(pk=pk)
             
             # Return vehicle data
             data = {
@@ -1333,10 +1587,80 @@ class VehicleDetailAPIView(LoginRequiredMixin, APIView):
                 'model': vehicle.model,
                 'year': vehicle.year,
             }
-            return Response(data)
+            return JsonResponse(data)
         
         except Vehicle.DoesNotExist:
-            return Response(
+            return JsonResponse(
                 {'error': 'Vehicle not found or access denied'},
-                status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+                status=404
+            )
+
+class FuelAnalyticsAPIView(AsyncLoginRequiredMixin, View):
+    """
+    Fleet fuel analytics as JSON: station prices, monthly prices, per-vehicle
+    efficiency percentiles and rolling averages, and outlier fill-ups. Takes
+    optional ``?family=``, ``?start=``, ``?end=`` and ``?max_points=``.
+    """
+    
+    async def get(self, request):
+        access = await request.aaccess()
+        family_ids = fuel_analytics_scope(request, access)
+        if family_ids is None:
+            return JsonResponse({'error': 'Family not found or access denied'}, status=404)
+        
+        # NumPy work and the cache lookup are sync; run them off the event loop
+        data = await sync_to_async(fuel_analytics)(
+            family_ids,
+            start=parse_date_param(request.GET.get('start')),
+            end=parse_date_param(request.GET.get('end')),
+            max_points=parse_max_points(request.GET.get('max_points')),
+        )
+        return JsonResponse(data)
+
+class LocationNearbyAPIView(AsyncLoginRequiredMixin, View):
+    """
+    The user's families' locations near a point, nearest first, so a phone
+    logging an event can suggest where it is. Takes ``?lat=`` and ``?lon=``,
+    plus optional ``?radius=`` (miles) and ``?limit=``.
+    """
+    default_radius = 5
+    max_radius = 100
+    default_limit = 5
+    max_limit = 50
+    
+    async def get(self, request):
+        try:
+            lat = float(request.GET['lat'])
+            lon = float(request.GET['lon'])
+            radius = float(request.GET.get('radius') or self.default_radius)
+            limit = int(request.GET.get('limit') or self.default_limit)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'lat and lon are required; radius and limit must be numbers'}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius < float('inf')):
+            return JsonResponse({'error': 'Coordinates or radius out of range'}, status=400)
+        radius = min(radius, self.max_radius)
+        limit = min(max(limit, 1), self.max_limit)
+        
+        access = await request.aaccess()
+        # Only rows in the grid cells around the point are read; exact
+        # distances are computed for those
+        candidates = Location.objects.filter(
+            geo.cell_filter(lat, lon, radius), family__in=access.family_ids
+        ).values_list('id', 'latitude', 'longitude', 'name', 'address', 'family_id')
+        rows = [row async for row in candidates]
+        
+        results = [
+            {
+                'id': pk,
+                'name': name,
+                'address': address or '',
+                'family': family_id,
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'distance_miles': round(distance, 3),
+            }
+            for distance, (pk, latitude, longitude, name, address, family_id) in geo.nearest(
+                rows, lat, lon, radius, limit
+            )
+        ]
+        return JsonResponse({'results': results})
@@ -44,13 +44,22 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tracker.middleware.AccessContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-# Only add WhiteNoise in production
+# Only add WhiteNoise in production (wrapped so it also runs natively under ASGI)
 if not DEBUG:
-    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    MIDDLEWARE.insert(1, 'tracker.middleware.StaticFilesMiddleware')
+
+# Opt-in per-request SQL instrumentation: Server-Timing headers, a JSON log
+# line per request on 'tracker.sql' and warnings for statements repeated more
+# than SQL_N_PLUS_ONE_THRESHOLD times
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'False').lower() in ['true', '1', 'yes']
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+if SQL_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'tracker.middleware.SQLInstrumentationMiddleware')
 
 
 ROOT_URLCONF = 'vehicle_tracker.urls'
@@ -72,13 +81,31 @@ TEMPLATES = [
     },
 ]
 
+# Outside DEBUG, parse each template once per process
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'vehicle_tracker.wsgi.application'
+ASGI_APPLICATION = 'vehicle_tracker.asgi.application'
+
+# 'wsgi' (sync gunicorn workers) or 'asgi' (gunicorn with uvicorn workers,
+# which serve the async chart and API views on an event loop); see
+# gunicorn.conf.py
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
 
 # Database
 DATABASES = {
     'default': dj_database_url.config(
         default=f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}",
-        conn_max_age=600
+        # Under ASGI each request's queries run in their own thread, so
+        # persistent connections would pile up; use a pooler (pgbouncer) there
+        conn_max_age=0 if SERVER_MODE == 'asgi' else 600
     )
 }
 
@@ -90,6 +117,39 @@ CACHES = {
     }
 }
 
+# How long versioned per-family cache entries (dashboard aggregates etc.) live
+FAMILY_CACHE_TIMEOUT = int(os.environ.get('FAMILY_CACHE_TIMEOUT', 60 * 60))
+
+# How long a user's cached family/vehicle access lists live; they are also
+# invalidated whenever membership or vehicles change
+ACCESS_CACHE_TIMEOUT = int(os.environ.get('ACCESS_CACHE_TIMEOUT', 15 * 60))
+
+# How long rendered list and dashboard cards ({% fragment_cache %}) live;
+# their keys change whenever the underlying objects do
+TEMPLATE_FRAGMENT_TIMEOUT = int(os.environ.get('TEMPLATE_FRAGMENT_TIMEOUT', 24 * 60 * 60))
+
+# Background jobs (tracker.jobs, run by `manage.py run_worker`): attempts
+# before a job fails, retry backoff base/cap in seconds, how long a running
+# job's lock lasts before it is assumed dead and requeued, and how long
+# finished jobs are kept
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BACKOFF = int(os.environ.get('JOB_RETRY_BACKOFF', 30))
+JOB_RETRY_MAX_DELAY = int(os.environ.get('JOB_RETRY_MAX_DELAY', 60 * 60))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 15 * 60))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 14))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+
+# Vehicle reports covering more events than this are built by a background
+# job while the page shows progress; smaller ones are built in the request
+REPORT_INLINE_EVENT_LIMIT = int(os.environ.get('REPORT_INLINE_EVENT_LIMIT', 500))
+
+# Days of readings, back from each vehicle's latest, its usage rate is fitted
+# from when forecasting maintenance due dates
+FORECAST_USAGE_DAYS = int(os.environ.get('FORECAST_USAGE_DAYS', 180))
+
+# Most points a chart series API returns; longer series are LTTB-downsampled
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', 1000))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {